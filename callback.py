@@ -4,7 +4,6 @@ Entrypoint для Yandex Cloud Functions: обработчик webhook от Repl
 Важно: обработку делаем синхронно в рамках вызова функции (без create_task()).
 """
 
-import asyncio
 import base64
 import json
 import logging
@@ -58,6 +57,7 @@ def handler(event, context):  # noqa: ARG001
         # Ленивый импорт, чтобы избежать 502 на этапе загрузки handler.
         try:
             from src.domain.logic import process_replicate_webhook  # noqa: WPS433
+            from src.utils.runtime import function_runtime  # noqa: WPS433
         except Exception as import_err:
             logger.exception(
                 "Import error (src). __file__=%s cwd=%s sys.path[0:5]=%s err=%s",
@@ -84,7 +84,7 @@ def handler(event, context):  # noqa: ARG001
             webhook_data.get("status"),
         )
 
-        asyncio.run(process_replicate_webhook(webhook_data))
+        function_runtime.run(process_replicate_webhook(webhook_data))
 
         return {
             "statusCode": 200,
@@ -5,7 +5,6 @@ Entrypoint для Yandex Cloud Functions: обработчик Telegram webhook.
 после возврата ответа. Поэтому здесь обработка выполняется в рамках одного вызова.
 """
 
-import asyncio
 import base64
 import json
 import logging
@@ -33,6 +32,10 @@ for _p in _CANDIDATE_PATHS:
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
+# Каждый вызов функции получает один Update: копить альбом в памяти бессмысленно,
+# части альбома сводятся через S3 (см. src/domain/albums.py)
+ALBUM_BUFFER_SECONDS = 0.0
+
 
 def _parse_event_body(event: Dict[str, Any]) -> Any:
     body = event.get("body")
@@ -60,6 +63,7 @@ def handler(event, context):  # noqa: ARG001
         # чтобы исключить 502 при проблемах с PYTHONPATH на cold start.
         try:
             from src.handlers.telegram_processor import process_telegram_update  # noqa: WPS433
+            from src.utils.runtime import function_runtime  # noqa: WPS433
         except Exception as import_err:
             logger.exception(
                 "Import error (src). __file__=%s cwd=%s sys.path[0:5]=%s err=%s",
@@ -82,7 +86,7 @@ def handler(event, context):  # noqa: ARG001
         update_data = _parse_event_body(event or {})
         logger.info("Telegram webhook received: update_id=%s", update_data.get("update_id"))
 
-        asyncio.run(process_telegram_update(update_data))
+        function_runtime.run(process_telegram_update(update_data, album_buffer_seconds=ALBUM_BUFFER_SECONDS))
 
         return {
             "statusCode": 200,
@@ -1,17 +1,51 @@
 """
-Локальный эмулятор Replicate API для разработки и тестирования.
+Локальный эмулятор Replicate API для разработки, тестирования и нагрузочных прогонов.
+
+Prediction проходит те же стадии, что в Replicate: starting (ждет свободного
+«воркера», не больше MOCK_MAX_CONCURRENCY одновременно) → processing (скачивание
+входа, задержка модели) → succeeded / failed и вебхук на `webhook`.
+
+Настройка — переменные окружения (по умолчанию — поведение для разработки):
+
+- MOCK_LATENCY — время «модели»: fixed:3 | uniform:2,5 | normal:3,1 |
+  lognormal:3,0.5 (медиана, sigma) | exp:3 (среднее), секунды;
+- MOCK_CREATE_LATENCY — задержка ответа POST /v1/predictions (по умолчанию fixed:0);
+- MOCK_MAX_CONCURRENCY — одновременных prediction (0 — без ограничения);
+  остальные ждут в статусе starting, как в очереди Replicate;
+- MOCK_MAX_QUEUE — больше стольких ждущих prediction новые получают 429 (0 — без ограничения);
+- MOCK_THROTTLE_RATE / MOCK_SERVER_ERROR_RATE — доля POST /v1/predictions,
+  отвечающих 429 (Retry-After) / 503;
+- MOCK_FAILURE_RATE — доля prediction, завершающихся статусом failed;
+- MOCK_OUTPUT — process (результат — обработанное изображение, отдается самим
+  эмулятором: GET /outputs/{id}.{ext}) или echo (прежнее поведение: URL входа);
+- MOCK_OUTPUT_FORMAT (JPEG / PNG / WEBP), MOCK_OUTPUT_SCALE, MOCK_OUTPUT_MAX_SIDE —
+  формат и размер результата;
+- MOCK_PUBLIC_URL — адрес эмулятора в ссылках на результат (по умолчанию — адрес,
+  по которому пришел запрос на создание prediction);
+- MOCK_WEBHOOK_RETRIES — повторы вебхука при ошибке (1 с, 2 с, ...);
+- MOCK_TASKS_KEEP / MOCK_OUTPUTS_KEEP — сколько prediction / результатов держать в памяти;
+- MOCK_SEED — seed генератора задержек и ошибок (воспроизводимые прогоны).
+
+Все сетевые операции асинхронные (общий httpx.AsyncClient), обработка
+изображения — в потоке (asyncio.to_thread): event loop эмулятора не блокируется.
+GET /stats — счетчики и перцентили, POST /stats/reset — сброс между прогонами.
 """
 import asyncio
+import hashlib
+import io
 import logging
-import uuid
+import math
+import os
 import random
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Optional, Set
+
 import httpx
-from PIL import Image
-import io
-import requests
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,168 +53,461 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Mock Replicate API")
 
-# Хранилище задач в памяти (в проде можно использовать БД)
-tasks: Dict[str, Dict[str, Any]] = {}
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
 
 
-async def process_image_async(
-    prediction_id: str,
-    image_url: str,
-    webhook_url: str
-):
+def parse_latency(spec: str) -> Callable[[], float]:
     """
-    Асинхронная обработка изображения (эмуляция).
-    
+    Распределение задержки из строки вида "вид:параметры".
+
     Args:
-        prediction_id: ID предсказания
-        image_url: URL исходного изображения
-        webhook_url: URL для отправки вебхука
+        spec: fixed:S | uniform:MIN,MAX | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA | exp:MEAN
+
+    Returns:
+        Функция без аргументов, возвращающая задержку в секундах (не меньше 0)
     """
+    kind, _, args = spec.strip().partition(":")
     try:
-        # Имитация задержки обработки (2-5 секунд)
-        delay = random.uniform(2.0, 5.0)
-        logger.info(f"Prediction {prediction_id}: имитация обработки, задержка {delay:.1f}с")
-        await asyncio.sleep(delay)
-        
-        # Обновить статус на processing
-        if prediction_id in tasks:
-            tasks[prediction_id]["status"] = "processing"
-        
-        # Скачать исходное изображение
+        values = [float(v) for v in args.split(",") if v.strip()]
+    except ValueError:
+        raise ValueError(f"Некорректные параметры задержки: {spec!r}")
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+    if kind not in expected or len(values) != expected[kind]:
+        raise ValueError(
+            f"Некорректная задержка {spec!r}: ожидается fixed:S, uniform:MIN,MAX, "
+            "normal:MEAN,STDDEV, lognormal:MEDIAN,SIGMA или exp:MEAN"
+        )
+    if kind == "fixed":
+        return lambda: max(0.0, values[0])
+    if kind == "uniform":
+        return lambda: _rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, _rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: values[0] * math.exp(_rng.gauss(0.0, values[1]))
+    return lambda: _rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+
+
+_rng = random.Random(os.getenv("MOCK_SEED") or None)
+
+LATENCY_SPEC = os.getenv("MOCK_LATENCY", "uniform:2,5")
+CREATE_LATENCY_SPEC = os.getenv("MOCK_CREATE_LATENCY", "fixed:0")
+latency = parse_latency(LATENCY_SPEC)
+create_latency = parse_latency(CREATE_LATENCY_SPEC)
+MAX_CONCURRENCY = _env_int("MOCK_MAX_CONCURRENCY", 0)
+MAX_QUEUE = _env_int("MOCK_MAX_QUEUE", 0)
+THROTTLE_RATE = _env_float("MOCK_THROTTLE_RATE", 0.0)
+SERVER_ERROR_RATE = _env_float("MOCK_SERVER_ERROR_RATE", 0.0)
+FAILURE_RATE = _env_float("MOCK_FAILURE_RATE", 0.0)
+OUTPUT_MODE = os.getenv("MOCK_OUTPUT", "process").strip().lower()
+OUTPUT_FORMAT = os.getenv("MOCK_OUTPUT_FORMAT", "JPEG").strip().upper()
+OUTPUT_SCALE = _env_float("MOCK_OUTPUT_SCALE", 1.0)
+OUTPUT_MAX_SIDE = _env_int("MOCK_OUTPUT_MAX_SIDE", 4096)
+PUBLIC_URL = os.getenv("MOCK_PUBLIC_URL", "").rstrip("/")
+WEBHOOK_RETRIES = _env_int("MOCK_WEBHOOK_RETRIES", 2)
+TASKS_KEEP = _env_int("MOCK_TASKS_KEEP", 10000)
+OUTPUTS_KEEP = _env_int("MOCK_OUTPUTS_KEEP", 500)
+HTTP_MAX_CONNECTIONS = _env_int("MOCK_HTTP_MAX_CONNECTIONS", 100)
+
+if OUTPUT_MODE not in ("process", "echo"):
+    raise ValueError(f"MOCK_OUTPUT должен быть process или echo, получено {OUTPUT_MODE!r}")
+if OUTPUT_FORMAT not in ("JPEG", "PNG", "WEBP"):
+    raise ValueError(f"MOCK_OUTPUT_FORMAT должен быть JPEG, PNG или WEBP, получено {OUTPUT_FORMAT!r}")
+OUTPUT_CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+OUTPUT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+# Сколько последних замеров держать для перцентилей
+SAMPLES_KEEP = 10000
+
+app = FastAPI(title="Mock Replicate API")
+
+# Prediction в памяти (старые вытесняются после MOCK_TASKS_KEEP)
+tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Результаты (MOCK_OUTPUT=process): имя файла -> байты
+outputs: "OrderedDict[str, bytes]" = OrderedDict()
+# Готовые результаты по SHA-256 входа (один и тот же объект bytes на все prediction)
+_renders: "OrderedDict[str, bytes]" = OrderedDict()
+RENDERS_KEEP = 32
+
+_client: Optional[httpx.AsyncClient] = None
+_slots: Optional[asyncio.Semaphore] = None
+# Ссылки на фоновые задачи: create_task держит их только слабо
+_background: Set[asyncio.Task] = set()
+
+
+class InjectedFailure(RuntimeError):
+    """Ошибка prediction, внесенная MOCK_FAILURE_RATE."""
+
+    pass
+
+
+def _new_stats() -> Dict[str, Any]:
+    return {
+        "started_at": time.time(),
+        "created": 0,
+        "throttled": 0,
+        "throttled_queue_full": 0,
+        "server_errors": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "failed_injected": 0,
+        "fetch_errors": 0,
+        "render_cache_hits": 0,
+        "webhooks_sent": 0,
+        "webhook_errors": 0,
+        "webhook_retries": 0,
+        "outputs_served": 0,
+        "output_bytes": 0,
+        "queued": 0,
+        "running": 0,
+        "peak_queued": 0,
+        "peak_running": 0,
+    }
+
+
+_stats: Dict[str, Any] = _new_stats()
+_samples: Dict[str, Deque[float]] = {
+    "queue_wait": deque(maxlen=SAMPLES_KEEP),
+    "fetch": deque(maxlen=SAMPLES_KEEP),
+    "render": deque(maxlen=SAMPLES_KEEP),
+    "model": deque(maxlen=SAMPLES_KEEP),
+    "total": deque(maxlen=SAMPLES_KEEP),
+}
+
+
+def _percentiles(values: Deque[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(ordered[-1], 3)}
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Общий HTTP-клиент и «воркеры» эмулятора."""
+    global _client, _slots
+    _client = httpx.AsyncClient(
+        timeout=30.0,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+    )
+    if MAX_CONCURRENCY > 0:
+        _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    logger.info(
+        "Mock Replicate: latency=%s, create_latency=%s, concurrency=%s, queue=%s, "
+        "throttle=%.2f, server_errors=%.2f, failures=%.2f, output=%s/%s x%.2f",
+        LATENCY_SPEC, CREATE_LATENCY_SPEC, MAX_CONCURRENCY or "∞", MAX_QUEUE or "∞",
+        THROTTLE_RATE, SERVER_ERROR_RATE, FAILURE_RATE, OUTPUT_MODE, OUTPUT_FORMAT, OUTPUT_SCALE,
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in list(_background):
+        task.cancel()
+    if _client is not None:
+        await _client.aclose()
+
+
+def _render_output(image_data: bytes) -> bytes:
+    """
+    «Обработка» входа (в потоке): поворот по EXIF, автоконтраст, резкость,
+    масштаб MOCK_OUTPUT_SCALE (длинная сторона не больше MOCK_OUTPUT_MAX_SIDE).
+    """
+    from PIL import Image, ImageFilter, ImageOps
+
+    with Image.open(io.BytesIO(image_data)) as img:
+        image = ImageOps.exif_transpose(img).convert("RGB")
+    scale = OUTPUT_SCALE
+    if OUTPUT_MAX_SIDE > 0:
+        scale = min(scale, OUTPUT_MAX_SIDE / max(image.size))
+    if scale != 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    image = ImageOps.autocontrast(image).filter(ImageFilter.SHARPEN)
+    buffer = io.BytesIO()
+    image.save(buffer, format=OUTPUT_FORMAT, quality=90)
+    return buffer.getvalue()
+
+
+def _store_output(name: str, data: bytes) -> None:
+    outputs[name] = data
+    while len(outputs) > OUTPUTS_KEEP:
+        outputs.popitem(last=False)
+
+
+async def _render_cached(image_data: bytes) -> bytes:
+    """
+    Результат для входа: нагрузочный прогон обычно гоняет несколько одинаковых
+    фото — Pillow не должен стать узким местом эмулятора.
+    """
+    digest = hashlib.sha256(image_data).hexdigest()
+    data = _renders.get(digest)
+    if data is None:
+        data = await asyncio.to_thread(_render_output, image_data)
+        _renders[digest] = data
+        while len(_renders) > RENDERS_KEEP:
+            _renders.popitem(last=False)
+    else:
+        _renders.move_to_end(digest)
+        _stats["render_cache_hits"] += 1
+    return data
+
+
+async def _make_output(prediction_id: str, image_url: str, base_url: str) -> str:
+    """Скачать вход и подготовить результат; вернуть URL результата."""
+    started = time.perf_counter()
+    try:
+        response = await _client.get(image_url)
+        response.raise_for_status()
+    except Exception:
+        _stats["fetch_errors"] += 1
+        raise
+    finally:
+        _samples["fetch"].append(time.perf_counter() - started)
+
+    if OUTPUT_MODE == "echo":
+        return image_url
+    started = time.perf_counter()
+    data = await _render_cached(response.content)
+    _samples["render"].append(time.perf_counter() - started)
+    name = f"{prediction_id}.{OUTPUT_EXTENSIONS[OUTPUT_FORMAT]}"
+    _store_output(name, data)
+    return f"{base_url}/outputs/{name}"
+
+
+async def _send_webhook(task: Dict[str, Any]) -> None:
+    """Отправить итог prediction на webhook (с повторами, как Replicate)."""
+    payload = {key: task.get(key) for key in ("id", "status", "output", "error", "input", "created_at", "completed_at")}
+    for attempt in range(WEBHOOK_RETRIES + 1):
         try:
-            response = requests.get(image_url, timeout=30)
+            response = await _client.post(task["webhook"], json=payload)
             response.raise_for_status()
-            image_data = response.content
-            
-            # Простая трансформация: можно просто вернуть исходное изображение
-            # или применить простую обработку через PIL
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Для эмуляции можно просто вернуть исходное изображение
-            # Или применить простую трансформацию (например, изменение размера)
-            # Здесь просто используем исходное изображение
-            
-            # Сохранить результат во временный файл или загрузить куда-то
-            # Для простоты эмуляции вернем исходный URL
-            # В реальном сценарии нужно загрузить результат в S3 или другой хостинг
-            
-            output_url = image_url  # В эмуляции возвращаем исходный URL
-            
-            # Обновить статус на succeeded
-            if prediction_id in tasks:
-                tasks[prediction_id]["status"] = "succeeded"
-                tasks[prediction_id]["output"] = output_url
-            
-            # Отправить вебхук
-            webhook_data = {
-                "id": prediction_id,
-                "status": "succeeded",
-                "output": output_url
-            }
-            
-            logger.info(f"Prediction {prediction_id}: отправка вебхука на {webhook_url}")
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                try:
-                    response = await client.post(webhook_url, json=webhook_data)
-                    response.raise_for_status()
-                    logger.info(f"Вебхук успешно отправлен для {prediction_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке вебхука для {prediction_id}: {e}")
-            
+            _stats["webhooks_sent"] += 1
+            logger.info(f"Вебхук успешно отправлен для {task['id']}")
+            return
         except Exception as e:
-            logger.error(f"Ошибка при обработке изображения для {prediction_id}: {e}")
-            # Обновить статус на failed
-            if prediction_id in tasks:
-                tasks[prediction_id]["status"] = "failed"
-                tasks[prediction_id]["error"] = {"message": str(e)}
-            
-            # Отправить вебхук с ошибкой
-            webhook_data = {
-                "id": prediction_id,
-                "status": "failed",
-                "error": {"message": str(e)}
-            }
-            
+            if attempt < WEBHOOK_RETRIES:
+                _stats["webhook_retries"] += 1
+                await asyncio.sleep(2 ** attempt)
+                continue
+            _stats["webhook_errors"] += 1
+            logger.error(f"Ошибка при отправке вебхука для {task['id']}: {e}")
+
+
+async def process_image_async(task: Dict[str, Any], base_url: str):
+    """
+    Асинхронная обработка prediction (эмуляция).
+
+    Args:
+        task: Запись prediction (обновляется по ходу обработки)
+        base_url: Адрес эмулятора для ссылки на результат
+    """
+    prediction_id = task["id"]
+    queued_at = time.perf_counter()
+    _stats["queued"] += 1
+    _stats["peak_queued"] = max(_stats["peak_queued"], _stats["queued"])
+    try:
+        if _slots is not None:
+            await _slots.acquire()
+        try:
+            _stats["queued"] -= 1
+            _stats["running"] += 1
+            _stats["peak_running"] = max(_stats["peak_running"], _stats["running"])
+            _samples["queue_wait"].append(time.perf_counter() - queued_at)
+            task["status"] = "processing"
+            task["started_at"] = _now()
+
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    await client.post(webhook_url, json=webhook_data)
-            except Exception as webhook_error:
-                logger.error(f"Ошибка при отправке вебхука с ошибкой: {webhook_error}")
-    
+                # Время «модели» — из MOCK_LATENCY, подготовка результата входит в него
+                delay = latency()
+                logger.info(f"Prediction {prediction_id}: имитация обработки, задержка {delay:.1f}с")
+                model_started = time.perf_counter()
+                output_url = await _make_output(prediction_id, task["input"]["image"], base_url)
+                await asyncio.sleep(max(0.0, delay - (time.perf_counter() - model_started)))
+                _samples["model"].append(time.perf_counter() - model_started)
+                if FAILURE_RATE and _rng.random() < FAILURE_RATE:
+                    raise InjectedFailure("Injected failure (MOCK_FAILURE_RATE)")
+                task["status"] = "succeeded"
+                task["output"] = output_url
+                _stats["succeeded"] += 1
+            except Exception as e:
+                logger.error(f"Ошибка при обработке изображения для {prediction_id}: {e}")
+                task["status"] = "failed"
+                task["error"] = str(e)
+                _stats["failed"] += 1
+                if isinstance(e, InjectedFailure):
+                    _stats["failed_injected"] += 1
+        finally:
+            _stats["running"] -= 1
+            if _slots is not None:
+                _slots.release()
+
+        task["completed_at"] = _now()
+        _samples["total"].append(time.perf_counter() - queued_at)
+        logger.info(f"Prediction {prediction_id}: отправка вебхука на {task['webhook']}")
+        await _send_webhook(task)
+
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.error(f"Критическая ошибка при обработке {prediction_id}: {e}", exc_info=True)
 
 
+def _throttled(detail: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": detail, "status": 429},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.post("/v1/predictions")
-async def create_prediction(request: Dict[str, Any]):
+async def create_prediction(body: Dict[str, Any], request: Request):
     """
     Создать prediction (эмуляция Replicate API).
-    
+
     Принимает:
     - input.image: URL изображения
     - webhook: URL для вебхука
     - webhook_events_filter: список событий
+
+    Отвечает 429, если ждущих prediction больше MOCK_MAX_QUEUE или сработала
+    MOCK_THROTTLE_RATE; 503 — MOCK_SERVER_ERROR_RATE.
     """
-    try:
-        input_data = request.get("input", {})
-        image_url = input_data.get("image")
-        webhook_url = request.get("webhook")
-        webhook_events_filter = request.get("webhook_events_filter", ["completed"])
-        
-        if not image_url:
-            raise HTTPException(status_code=400, detail="input.image обязателен")
-        
-        if not webhook_url:
-            raise HTTPException(status_code=400, detail="webhook обязателен")
-        
-        # Генерировать prediction_id
-        prediction_id = str(uuid.uuid4())
-        
-        # Сохранить задачу
-        tasks[prediction_id] = {
-            "id": prediction_id,
-            "status": "starting",
-            "input": input_data,
-            "webhook": webhook_url,
-            "webhook_events_filter": webhook_events_filter,
-            "created_at": None
-        }
-        
-        logger.info(f"Создан prediction {prediction_id} для изображения {image_url}")
-        
-        # Запустить асинхронную обработку
-        asyncio.create_task(process_image_async(prediction_id, image_url, webhook_url))
-        
-        # Вернуть ответ сразу
-        return JSONResponse(content={
-            "id": prediction_id,
-            "status": "starting",
-            "input": input_data,
-            "webhook": webhook_url,
-            "webhook_events_filter": webhook_events_filter
-        })
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка при создании prediction: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+    input_data = body.get("input", {})
+    image_url = input_data.get("image")
+    webhook_url = body.get("webhook")
+    webhook_events_filter = body.get("webhook_events_filter", ["completed"])
+
+    if not image_url:
+        raise HTTPException(status_code=400, detail="input.image обязателен")
+    if not webhook_url:
+        raise HTTPException(status_code=400, detail="webhook обязателен")
+
+    delay = create_latency()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    if MAX_QUEUE and _stats["queued"] >= MAX_QUEUE:
+        _stats["throttled"] += 1
+        _stats["throttled_queue_full"] += 1
+        return _throttled("Request was throttled. Queue is full.")
+    if THROTTLE_RATE and _rng.random() < THROTTLE_RATE:
+        _stats["throttled"] += 1
+        return _throttled("Request was throttled. Expected available in 1 second.")
+    if SERVER_ERROR_RATE and _rng.random() < SERVER_ERROR_RATE:
+        _stats["server_errors"] += 1
+        return JSONResponse(status_code=503, content={"detail": "Service unavailable (injected)"})
+
+    prediction_id = str(uuid.uuid4())
+    task = {
+        "id": prediction_id,
+        "status": "starting",
+        "input": input_data,
+        "output": None,
+        "error": None,
+        "webhook": webhook_url,
+        "webhook_events_filter": webhook_events_filter,
+        "created_at": _now(),
+    }
+    tasks[prediction_id] = task
+    while len(tasks) > TASKS_KEEP:
+        tasks.popitem(last=False)
+    _stats["created"] += 1
+
+    logger.info(f"Создан prediction {prediction_id} для изображения {image_url}")
+
+    base_url = PUBLIC_URL or str(request.base_url).rstrip("/")
+    background = asyncio.create_task(process_image_async(task, base_url))
+    _background.add(background)
+    background.add_done_callback(_background.discard)
+
+    return JSONResponse(status_code=201, content={
+        "id": prediction_id,
+        "status": "starting",
+        "input": input_data,
+        "webhook": webhook_url,
+        "webhook_events_filter": webhook_events_filter,
+        "created_at": task["created_at"],
+    })
 
 
 @app.get("/v1/predictions/{prediction_id}")
 async def get_prediction(prediction_id: str):
     """
-    Получить статус prediction (опционально, для проверки).
+    Получить статус prediction (сверка зависших задач, проверка вручную).
     """
     if prediction_id not in tasks:
         raise HTTPException(status_code=404, detail="Prediction не найден")
-    
+
     return JSONResponse(content=tasks[prediction_id])
 
 
+@app.get("/outputs/{name}")
+async def get_output(name: str):
+    """Результат prediction (MOCK_OUTPUT=process)."""
+    data = outputs.get(name)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Результат не найден")
+    _stats["outputs_served"] += 1
+    _stats["output_bytes"] += len(data)
+    return Response(content=data, media_type=OUTPUT_CONTENT_TYPES[OUTPUT_FORMAT])
+
+
+@app.get("/stats")
+async def get_stats():
+    """Счетчики эмулятора и перцентили времени (секунды) с запуска или сброса."""
+    stats = dict(_stats)
+    elapsed = max(time.time() - stats.pop("started_at"), 1e-9)
+    stats["elapsed_seconds"] = round(elapsed, 1)
+    stats["completed_per_second"] = round((stats["succeeded"] + stats["failed"]) / elapsed, 3)
+    stats["tasks_stored"] = len(tasks)
+    stats["outputs_stored"] = len(outputs)
+    stats["seconds"] = {name: _percentiles(values) for name, values in _samples.items()}
+    stats["config"] = {
+        "latency": LATENCY_SPEC,
+        "create_latency": CREATE_LATENCY_SPEC,
+        "max_concurrency": MAX_CONCURRENCY,
+        "max_queue": MAX_QUEUE,
+        "throttle_rate": THROTTLE_RATE,
+        "server_error_rate": SERVER_ERROR_RATE,
+        "failure_rate": FAILURE_RATE,
+        "output": OUTPUT_MODE,
+        "output_format": OUTPUT_FORMAT,
+    }
+    return JSONResponse(content=stats)
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    """Сбросить счетчики между прогонами (prediction в работе не затрагиваются)."""
+    queued, running = _stats["queued"], _stats["running"]
+    _stats.clear()
+    _stats.update(_new_stats())
+    _stats["queued"], _stats["running"] = queued, running
+    for values in _samples.values():
+        values.clear()
+    return JSONResponse(content={"status": "ok"})
+
+
 @app.get("/health")
 async def health_check():
     """Проверка работоспособности."""
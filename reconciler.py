@@ -0,0 +1,50 @@
+"""
+Entrypoint для Yandex Cloud Functions: сверка зависших задач с Replicate
+(потерянные вебхуки) — вызывается триггером-таймером, например раз в 5 минут.
+
+Вся работа — в рамках одного вызова, как в handler.py / callback.py
+(в постоянном event loop экземпляра, src/utils/runtime.py).
+"""
+
+import json
+import logging
+import os
+import sys
+
+# В Yandex Cloud Functions код может распаковываться не рядом с runtime,
+# поэтому `src/` не всегда находится через стандартный sys.path.
+_CANDIDATE_PATHS = [
+    os.path.dirname(__file__),
+    os.getcwd(),
+    "/function/code",
+    "/function",
+]
+for _p in _CANDIDATE_PATHS:
+    try:
+        if _p and _p not in sys.path and os.path.isdir(_p):
+            sys.path.insert(0, _p)
+    except Exception:
+        pass
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def handler(event, context):  # noqa: ARG001
+    try:
+        from src.domain.reconcile import reconcile_stuck_tasks  # noqa: WPS433
+        from src.utils.runtime import function_runtime  # noqa: WPS433
+
+        summary = function_runtime.run(reconcile_stuck_tasks())
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"ok": True, "summary": summary}, ensure_ascii=False),
+        }
+    except Exception as e:
+        logger.exception("Reconcile error: %s", e)
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False),
+        }
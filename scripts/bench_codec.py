@@ -0,0 +1,121 @@
+"""
+Микро-бенчмарк сериализации TaskState для S3: прежний путь против src/utils/codec.
+
+- legacy — как было: to_dict в JSON-режиме pydantic + ручные datetime,
+  json.dumps(indent=2, default=...); чтение — json.loads + ручной fromisoformat;
+- codec-<backend> — TaskState.to_dict/from_dict + codec.dumps/loads на каждом
+  доступном бэкенде (orjson, json).
+
+Печатает пропускную способность encode/decode (документов в секунду) и размер документа.
+Дополнительно проверяется, что документ в старом формате читается новым путем.
+
+Запуск из корня проекта: python -m scripts.bench_codec [--iterations 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+for _key in ("TG_BOT_TOKEN", "S3_BUCKET", "S3_ENDPOINT_URL", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("BASE_URL", "http://127.0.0.1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.domain.models import BotMode, TaskState, TaskStatus  # noqa: E402
+from src.utils import codec  # noqa: E402
+
+
+def sample_task() -> TaskState:
+    """Типичное состояние задачи после вебхука (все необязательные поля заполнены)."""
+    return TaskState(
+        prediction_id="p7x2k4m9q1w8e5r3t6y0",
+        chat_id=123456789,
+        user_id=111222333,
+        mode=BotMode.RESTORATION,
+        input_s3_key="images/input/2026/01/21/0c0f4a3e-1111-2222-3333-444455556666.jpg",
+        status=TaskStatus.SUCCEEDED,
+        telegram={"file_id": "AgACAgIAAxkBAAIBZ2WqVbH8nJdXz1Lk7Qy0AAHqE8LwAAJ", "message_id": 42},
+        input={
+            "s3_key": "images/input/2026/01/21/0c0f4a3e-1111-2222-3333-444455556666.jpg",
+            "mime": "image/jpeg",
+            "size_bytes": 345678,
+            "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+        },
+        replicate={"version": "mock", "webhook_events_filter": ["completed"]},
+        result={"output_url": "https://replicate.delivery/pbxt/abc123/output.png"},
+    )
+
+
+def legacy_encode(task: TaskState) -> bytes:
+    """Прежний путь: TaskState.to_dict (JSON-режим) + s3_storage.save_task_state."""
+    data = task.model_dump(exclude_none=True, mode="json")
+    for field in ("created_at", "updated_at"):
+        if isinstance(data.get(field), datetime):
+            data[field] = data[field].isoformat() + "Z"
+
+    def json_serializer(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat() + "Z"
+        raise TypeError(f"Type {type(obj)} not serializable")
+
+    return json.dumps(data, ensure_ascii=False, indent=2, default=json_serializer).encode("utf-8")
+
+
+def legacy_decode(raw: bytes) -> TaskState:
+    """Прежний путь: s3_storage.load_task_state + TaskState.from_dict."""
+    data = json.loads(raw.decode("utf-8"))
+    for field in ("created_at", "updated_at"):
+        if isinstance(data.get(field), str):
+            data[field] = datetime.fromisoformat(data[field].replace("Z", "+00:00"))
+    return TaskState(**data)
+
+
+def throughput(fn: Callable[[Any], Any], arg: Any, iterations: int) -> float:
+    """Вызовов в секунду."""
+    fn(arg)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return iterations / (time.perf_counter() - started)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="encode/decode TaskState: legacy vs codec")
+    parser.add_argument("--iterations", type=int, default=20000, help="Повторов на замер")
+    args = parser.parse_args()
+
+    task = sample_task()
+    paths = {"legacy": (legacy_encode, legacy_decode)}
+    for name in ("orjson", "json"):
+        selected, dumps, loads = codec._select_backend(name)
+        if selected != name:
+            continue
+        paths[f"codec-{name}"] = (
+            lambda t, dumps=dumps: dumps(t.to_dict()),
+            lambda raw, loads=loads: TaskState.from_dict(loads(raw)),
+        )
+
+    old_document = legacy_encode(task)
+    assert TaskState.from_dict(codec.loads(old_document)) == legacy_decode(old_document), "старый документ читается иначе"
+
+    print(f"Активный бэкенд codec: {codec.backend}, итераций: {args.iterations}")
+    print(f"{'path':<13} {'encode/s':>10} {'decode/s':>10} {'size, B':>8}")
+    for name, (encode, decode) in paths.items():
+        raw = encode(task)
+        print(
+            f"{name:<13} {throughput(encode, task, args.iterations):>10.0f} "
+            f"{throughput(decode, raw, args.iterations):>10.0f} {len(raw):>8}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Бенчмарк холодного старта Cloud Functions: handler.py (Telegram) и callback.py (Replicate).
+
+Каждый прогон — новый процесс Python (как холодный экземпляр функции) с -X importtime:
+вызывается handler(event, None) на типовом событии, внешние сервисы — локальная
+заглушка (Telegram Bot API, S3, Replicate) с задержкой --latency-ms на запрос и
+--handshake-ms на новое соединение (TCP+TLS). С --warm N тот же процесс затем
+обрабатывает еще N событий — теплые вызовы экземпляра.
+
+Отчет по сценарию (медианы по --runs прогонам):
+  wall          — от запуска процесса до выхода;
+  imports       — суммарное время импортов (-X importtime);
+  handler       — время вызова handler() (включая ленивые импорты внутри);
+  first_message — от запуска процесса до первого запроса к Telegram (ответ пользователю);
+  warm          — время теплого вызова handler() (с --warm);
+  requests      — запросов к заглушке по сервисам, connections — новых соединений;
+и разбивка импортов по пакетам (собственное время модулей, мс).
+
+Запуск из корня проекта: python -m scripts.bench_cold_start [--runs 5] [--latency-ms 20] [--warm 10]
+Сравнение с asyncio.run() на вызов: FUNCTION_PERSISTENT_LOOP=0 python -m scripts.bench_cold_start --warm 10
+"""
+import argparse
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+_project_root = Path(__file__).resolve().parent.parent
+
+BUCKET = "bench"
+TASK_ID = "bench-task"
+
+# Код дочернего процесса: импорт точки входа и один вызов handler()
+_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import {entry} as entry
+events = json.loads({events!r})
+t1 = time.perf_counter()
+result = entry.handler(events[0], None)
+t2 = time.perf_counter()
+warm = []
+for event in events[1:]:
+    started = time.perf_counter()
+    entry.handler(event, None)
+    warm.append((time.perf_counter() - started) * 1000)
+print("BENCH " + json.dumps({{"entry_import_ms": (t1 - t0) * 1000, "handler_ms": (t2 - t1) * 1000, "warm_ms": warm,
+                              "status": result.get("statusCode"), "body": result.get("body")}}))
+"""
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _make_jpeg() -> bytes:
+    try:
+        from PIL import Image
+
+        buf = io.BytesIO()
+        Image.new("RGB", (640, 480), (120, 130, 140)).save(buf, format="JPEG")
+        return buf.getvalue()
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + b"\x00" * 2000 + b"\xff\xd9"
+
+
+class Stub:
+    """Заглушка Telegram / S3 / Replicate в одном HTTP-сервере (путь определяет сервис)."""
+
+    def __init__(self, latency: float, handshake: float) -> None:
+        self.latency = latency
+        self.handshake = handshake
+        self.jpeg = _make_jpeg()
+        self.objects: Dict[str, bytes] = {}
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.first_telegram_send: Optional[float] = None
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:  # noqa: D401
+                pass
+
+            def setup(self) -> None:
+                super().setup()
+                with stub.lock:
+                    stub.counts["connections"] += 1
+                time.sleep(stub.handshake)
+
+            def _reply(self, code: int, body: bytes = b"", content_type: str = "application/json", headers=None) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _handle(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                time.sleep(stub.latency)
+                url = urlparse(self.path)
+                path = url.path
+                if path.startswith("/bot"):
+                    method = path.rsplit("/", 1)[1]
+                    with stub.lock:
+                        stub.counts["telegram"] += 1
+                        if method.startswith("send") and stub.first_telegram_send is None:
+                            stub.first_telegram_send = time.time()
+                    result = {"message_id": 1, "file_path": "photos/file_1.jpg", "file_size": len(stub.jpeg)}
+                    return self._reply(200, json.dumps({"ok": True, "result": result}).encode())
+                if path.startswith("/file/") or path.startswith("/output/"):
+                    stub.counts["download"] += 1
+                    return self._reply(200, stub.jpeg, "image/jpeg")
+                if path == "/v1/predictions":
+                    stub.counts["replicate"] += 1
+                    return self._reply(201, json.dumps({"id": TASK_ID, "status": "starting"}).encode())
+                if path.startswith(f"/{BUCKET}"):
+                    stub.counts["s3"] += 1
+                    key = path[len(BUCKET) + 2:]
+                    if self.command == "PUT":
+                        stub.objects[key] = body
+                        return self._reply(200, headers={"ETag": '"bench"'})
+                    if self.command == "DELETE":
+                        stub.objects.pop(key, None)
+                        return self._reply(204)
+                    if not key:
+                        if self.command == "HEAD":
+                            return self._reply(200)
+                        xml = (
+                            '<?xml version="1.0" encoding="UTF-8"?><ListBucketResult>'
+                            f"<Name>{BUCKET}</Name><KeyCount>0</KeyCount><IsTruncated>false</IsTruncated>"
+                            "</ListBucketResult>"
+                        )
+                        return self._reply(200, xml.encode(), "application/xml")
+                    if key in stub.objects:
+                        return self._reply(200, stub.objects[key], "application/octet-stream")
+                    xml = "<Error><Code>NoSuchKey</Code><Message>not found</Message></Error>"
+                    return self._reply(404, xml.encode(), "application/xml")
+                return self._reply(404)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def reset(self) -> None:
+        self.objects.clear()
+        self.counts.clear()
+        self.first_telegram_send = None
+
+
+def _events(stub: Stub, invocations: int) -> Dict[str, tuple]:
+    """Сценарий -> (точка входа, тела событий на каждый вызов, объекты S3 до запуска)."""
+    # Свой чат на каждый вызов: лимит отправок в чат (≈1/с) не должен попадать в замер
+    messages = [{"chat": {"id": i}, "from": {"id": i}, "message_id": 1} for i in range(1, invocations + 1)]
+    photo = [{"file_id": "f1", "file_size": len(stub.jpeg)}]
+    task_ids = [TASK_ID] + [f"{TASK_ID}-{i}" for i in range(1, invocations)]
+
+    def task_state(i: int, task_id: str) -> bytes:
+        return json.dumps({
+            "prediction_id": task_id,
+            "chat_id": i + 1,
+            "user_id": i + 1,
+            "mode": "restoration",
+            "input_s3_key": "images/input/bench.jpg",
+            "status": "queued",
+            "created_at": "2026-01-01T00:00:00Z",
+            "updated_at": "2026-01-01T00:00:00Z",
+        }).encode()
+
+    return {
+        "handler:/start": ("handler", [{**message, "text": "/start"} for message in messages], {}),
+        "handler:photo": ("handler", [{**message, "photo": photo} for message in messages], {}),
+        "callback:succeeded": (
+            "callback",
+            [{"id": task_id, "status": "succeeded", "output": f"{stub.url}/output/result.jpg"} for task_id in task_ids],
+            {f"tasks/{task_id}.json": task_state(i, task_id) for i, task_id in enumerate(task_ids)},
+        ),
+    }
+
+
+def _package(module: str) -> str:
+    name = module.split(".")[0]
+    return "src." + module.split(".")[1] if name == "src" and "." in module else name
+
+
+def run_once(stub: Stub, entry: str, bodies: List[dict], objects: Dict[str, bytes], n: int, env: Dict[str, str]) -> dict:
+    stub.reset()
+    stub.objects.update(objects)
+    if entry == "handler":
+        # Разные update_id: повтор Update отбрасывается дедупликацией
+        bodies = [{"update_id": 1000 * (n + 1) + i, "message": body} for i, body in enumerate(bodies)]
+    events = json.dumps([{"body": json.dumps(body)} for body in bodies])
+    code = _CHILD.format(root=str(_project_root), entry=entry, events=events)
+    started = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env, cwd=str(_project_root),
+    )
+    wall = (time.time() - started) * 1000
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("BENCH ")), None)
+    if line is None:
+        raise RuntimeError(f"{entry}: дочерний процесс завершился без результата\n{proc.stderr[-3000:]}")
+    result = json.loads(line[6:])
+
+    imports_us = 0
+    by_package: Dict[str, float] = defaultdict(float)
+    for l in proc.stderr.splitlines():
+        m = _IMPORT_LINE.match(l)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, module = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        if not indent:
+            imports_us += cumulative_us
+        by_package[_package(module)] += self_us / 1000
+    result.update({
+        "wall_ms": wall,
+        "imports_ms": imports_us / 1000,
+        "first_message_ms": (stub.first_telegram_send - started) * 1000 if stub.first_telegram_send else None,
+        "requests": dict(stub.counts),
+        "by_package": by_package,
+    })
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Холодный старт handler.py / callback.py")
+    parser.add_argument("--runs", type=int, default=5, help="Прогонов на сценарий (медиана)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Задержка заглушки на запрос, мс")
+    parser.add_argument("--handshake-ms", type=float, default=50.0, help="Задержка на новое соединение (TCP+TLS), мс")
+    parser.add_argument("--warm", type=int, default=0, help="Теплых вызовов после холодного в том же процессе")
+    parser.add_argument("--top", type=int, default=12, help="Сколько пакетов показать в разбивке импортов")
+    parser.add_argument("--scenario", action="append", help="Только эти сценарии (можно несколько раз)")
+    args = parser.parse_args()
+
+    stub = Stub(args.latency_ms / 1000, args.handshake_ms / 1000)
+    env = dict(os.environ)
+    env.update({
+        "TG_BOT_TOKEN": "bench",
+        "TG_API_BASE_URL": stub.url,
+        "S3_BUCKET": BUCKET,
+        "S3_ENDPOINT_URL": stub.url,
+        "S3_FORCE_PATH_STYLE": "1",
+        "S3_USE_SSL": "0",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "BASE_URL": "http://127.0.0.1",
+        "MOCK_REPLICATE_URL": stub.url,
+        "LOG_LEVEL": "WARNING",
+    })
+
+    for name, (entry, bodies, objects) in _events(stub, 1 + max(0, args.warm)).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        runs: List[dict] = [run_once(stub, entry, bodies, objects, n, env) for n in range(args.runs)]
+        med = lambda key: statistics.median(r[key] for r in runs if r[key] is not None) if any(r[key] is not None for r in runs) else float("nan")  # noqa: E731
+        print(f"\n== {name} ({args.runs} прогонов, задержка {args.latency_ms:.0f} мс/запрос)")
+        print(
+            f"wall {med('wall_ms'):7.0f} мс | imports {med('imports_ms'):6.0f} мс | "
+            f"handler {med('handler_ms'):6.0f} мс | first_message {med('first_message_ms'):6.0f} мс"
+        )
+        warm = [ms for r in runs for ms in r["warm_ms"]]
+        if warm:
+            warm.sort()
+            print(
+                f"warm ({len(warm)} вызовов): p50 {statistics.median(warm):6.0f} мс | "
+                f"p95 {warm[min(len(warm) - 1, int(len(warm) * 0.95))]:6.0f} мс | max {warm[-1]:6.0f} мс"
+            )
+        print(f"requests: {runs[-1]['requests']}  status: {runs[-1]['status']} {runs[-1]['body']}")
+        packages: Dict[str, float] = defaultdict(float)
+        for r in runs:
+            for pkg, ms in r["by_package"].items():
+                packages[pkg] += ms / len(runs)
+        top = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+        print("imports by package (self, ms): " + ", ".join(f"{pkg} {ms:.0f}" for pkg, ms in top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
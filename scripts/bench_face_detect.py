@@ -0,0 +1,179 @@
+"""
+Отчет по детекции лица: задержка, память и доля найденных лиц для всех детекторов
+(см. FaceDetector в src/services/shtender.py) на локальном наборе фото.
+
+Бэкенды:
+- haar-single — каскад Haar на всем изображении (одноэтапно, как раньше);
+- haar — каскад Haar, грубо на уменьшенной копии → уточнение в ROI;
+- yunet — OpenCV DNN YuNet на CPU (нужна модель: python -m scripts.fetch_yunet).
+
+Если запрошенный бэкенд не загрузился (например, нет модели YuNet), таблица
+печатается без него, а код возврата — 1.
+
+Каждый бэкенд прогоняется в отдельном процессе, чтобы честно замерить RSS
+(рост после загрузки модели и пик во время детекции). Фото декодируются так же,
+как в ShtenderRenderer.render. Совпадение (agree) считается относительно
+haar-single: оба не нашли лицо или IoU bbox ≥ --iou.
+
+Запуск из корня проекта:
+  python -m scripts.bench_face_detect --images-dir photos/ [--backends haar-single,haar,yunet] [--runs 3]
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+BACKENDS = ("haar-single", "haar", "yunet")
+BBox = Tuple[int, int, int, int]
+
+
+def iou(a: BBox, b: BBox) -> float:
+    """Intersection over Union двух bbox (x, y, w, h)."""
+    ax2, ay2, bx2, by2 = a[0] + a[2], a[1] + a[3], b[0] + b[2], b[1] + b[3]
+    iw = max(0, min(ax2, bx2) - max(a[0], b[0]))
+    ih = max(0, min(ay2, by2) - max(a[1], b[1]))
+    inter = iw * ih
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..1) без numpy."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))]
+
+
+def _rss_mb() -> float:
+    """Пиковый RSS процесса, МБ (ru_maxrss в КБ на Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(args: argparse.Namespace, photos: List[str]) -> None:
+    """Прогнать один бэкенд в текущем процессе; результат — JSON в stdout."""
+    from src.services.shtender import (
+        FaceDetectionParams,
+        TEMPLATE_PHOTO_RECT_PX,
+        _decode_photo,
+        create_face_detector,
+    )
+
+    rect_w, rect_h = TEMPLATE_PHOTO_RECT_PX[2:]
+    images = [_decode_photo(p, (rect_w, rect_h))[0] for p in photos]
+    rss_images = _rss_mb()
+
+    started = time.perf_counter()
+    if args.child == "haar-single":
+        detector = create_face_detector("haar", FaceDetectionParams(coarse_max_side=0))
+    else:
+        detector = create_face_detector(
+            args.child,
+            FaceDetectionParams(coarse_max_side=args.max_side),
+            yunet_model_path=args.yunet_model,
+        )
+    init_seconds = time.perf_counter() - started
+    rss_model = _rss_mb()
+
+    latencies: List[float] = []
+    found: List[Optional[BBox]] = []
+    for image in images:
+        bbox = None
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            bbox = detector.detect(image)
+            latencies.append(time.perf_counter() - started)
+        found.append(bbox)
+
+    print(json.dumps({
+        "init": init_seconds,
+        "latencies": latencies,
+        "found": found,
+        "model_mb": rss_model - rss_images,
+        "peak_rss_mb": _rss_mb(),
+    }))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Задержка/память/доля найденных лиц по детекторам штендера")
+    parser.add_argument("--template", default="assets/shtender_template.png", help="Путь к PNG-шаблону (исключается из набора)")
+    parser.add_argument("--images-dir", default="assets", help="Папка с фото (jpg/png)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Бэкенды через запятую")
+    parser.add_argument("--yunet-model", default="assets/face_detection_yunet_2023mar.onnx", help="ONNX-модель YuNet (scripts.fetch_yunet)")
+    parser.add_argument("--max-side", type=int, default=480, help="Длинная сторона копии для поиска (haar, yunet)")
+    parser.add_argument("--runs", type=int, default=3, help="Повторов детекции на фото")
+    parser.add_argument("--iou", type=float, default=0.5, help="Порог IoU для совпадения bbox")
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    photos = sorted(
+        str(p) for p in Path(args.images_dir).iterdir()
+        if p.is_file() and p.suffix.lower() in PHOTO_EXTENSIONS and p.name != Path(args.template).name
+    )
+    if not photos:
+        print("Фото не найдены.", file=sys.stderr)
+        return 1
+
+    if args.child:
+        child(args, photos)
+        return 0
+
+    results: Dict[str, dict] = {}
+    failed: List[str] = []
+    for backend in (b.strip() for b in args.backends.split(",") if b.strip()):
+        if backend not in BACKENDS:
+            print(f"Неизвестный бэкенд: {backend}", file=sys.stderr)
+            return 1
+        cmd = [
+            sys.executable, "-m", "scripts.bench_face_detect", "--child", backend,
+            "--template", args.template, "--images-dir", os.path.abspath(args.images_dir),
+            "--yunet-model", os.path.abspath(args.yunet_model),
+            "--max-side", str(args.max_side), "--runs", str(args.runs),
+        ]
+        out = subprocess.run(cmd, capture_output=True, text=True, cwd=_project_root)
+        if out.returncode != 0:
+            error = (out.stderr.strip().splitlines() or ["?"])[-1]
+            print(f"{backend}: не загрузился — {error}", file=sys.stderr)
+            failed.append(backend)
+            continue
+        results[backend] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    reference = results.get("haar-single")
+    print(f"Фото: {len(photos)}, повторов: {args.runs}, max_side={args.max_side}")
+    print(
+        f"{'backend':<12} {'init, ms':>9} {'mean, ms':>9} {'p95, ms':>8} "
+        f"{'model, MB':>10} {'peak RSS, MB':>13} {'hit rate':>9} {'agree':>7}"
+    )
+    for backend, r in results.items():
+        found = [tuple(b) if b else None for b in r["found"]]
+        hits = sum(1 for b in found if b is not None)
+        agree = "-"
+        if reference is not None:
+            ref = [tuple(b) if b else None for b in reference["found"]]
+            matched = sum(
+                1 for a, b in zip(found, ref)
+                if (a is None and b is None) or (a is not None and b is not None and iou(a, b) >= args.iou)
+            )
+            agree = f"{matched / len(photos):.0%}"
+        print(
+            f"{backend:<12} {r['init'] * 1000:>9.1f} {statistics.mean(r['latencies']) * 1000:>9.1f} "
+            f"{percentile(r['latencies'], 0.95) * 1000:>8.1f} {r['model_mb']:>10.1f} "
+            f"{r['peak_rss_mb']:>13.0f} {hits / len(photos):>9.0%} {agree:>7}"
+        )
+    if failed:
+        print(f"Без результатов: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Бенчмарк: сколько TCP(+TLS) соединений открывается на одно обработанное фото
+при «клиент на каждый запрос» и при общем пуле (src.utils.http.get_http_client).
+
+Поднимает два локальных HTTP-сервера (эмуляция api.telegram.org и Replicate),
+считает принятые ими соединения и прогоняет реальную последовательность вызовов
+telegram_api / replicate_api для одного фото (getFile → download → createPrediction →
+sendMessage → вебхук: скачать output → sendPhoto → sendDocument).
+
+В проде каждое новое соединение = TCP + TLS handshake.
+Запуск из корня проекта: python -m scripts.bench_http_pool --photos 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+# Конфиг требует обязательные переменные; для бенчмарка подойдут заглушки
+for _key in ("TG_BOT_TOKEN", "S3_BUCKET", "S3_ENDPOINT_URL", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("BASE_URL", "http://127.0.0.1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx  # noqa: E402
+
+from src.config import config  # noqa: E402
+from src.services import telegram_api, replicate_api  # noqa: E402
+from src.utils import http as http_utils  # noqa: E402
+
+FAKE_JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 200_000 + b"\xff\xd9"
+
+
+class CountingServer:
+    """Минимальный HTTP/1.1 сервер с keep-alive, считающий входящие соединения."""
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.requests = 0
+        self.port = 0
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+
+                if method == "GET":
+                    body, content_type = FAKE_JPEG, "image/jpeg"
+                elif path.endswith("/v1/predictions"):
+                    body = json.dumps({"id": f"bench-{self.requests}", "status": "starting"}).encode()
+                    content_type = "application/json"
+                else:
+                    body = json.dumps({"ok": True, "result": {"file_path": "photos/file_1.jpg", "file_size": len(FAKE_JPEG)}}).encode()
+                    content_type = "application/json"
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    + f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def process_one_photo(chat_id: int, output_url: str) -> None:
+    """Те же HTTP-вызовы, что делает пайплайн на одно фото (режим «Детализация» + штендер)."""
+    file_info = await telegram_api.get_file_info("file-id")
+    await telegram_api.download_file(file_info["file_path"])
+    await replicate_api.create_prediction(image_url=output_url, webhook_url="http://127.0.0.1/webhook/replicate")
+    await telegram_api.send_message(chat_id, "✅ Принял")
+    # Вебхук Replicate: результат + штендер
+    await telegram_api.send_photo(chat_id, output_url, caption="✅ Обработка завершена!")
+    await telegram_api.send_document_bytes(chat_id, b"%PDF-1.4 bench", filename="shtender.pdf")
+
+
+async def run(mode: str, photos: int) -> dict:
+    tg_server, rep_server = CountingServer(), CountingServer()
+    await tg_server.start()
+    await rep_server.start()
+
+    telegram_api.TELEGRAM_API_BASE = f"http://127.0.0.1:{tg_server.port}/bot"
+    telegram_api.TELEGRAM_FILE_BASE = f"http://127.0.0.1:{tg_server.port}/file/bot"
+    config.MOCK_REPLICATE_URL = f"http://127.0.0.1:{rep_server.port}"
+    output_url = f"http://127.0.0.1:{rep_server.port}/output/result.jpg"
+
+    original_get_client = http_utils.get_http_client
+    fresh_clients: List[httpx.AsyncClient] = []
+    if mode == "per-request":
+        # Поведение до общего пула: новый AsyncClient на каждый запрос
+        def fresh_client() -> httpx.AsyncClient:
+            client = httpx.AsyncClient(timeout=10.0)
+            fresh_clients.append(client)
+            return client
+
+        http_utils.get_http_client = fresh_client
+        telegram_api.get_http_client = fresh_client
+
+    started = time.perf_counter()
+    try:
+        for i in range(photos):
+            await process_one_photo(chat_id=1000 + i, output_url=output_url)
+    finally:
+        elapsed = time.perf_counter() - started
+        http_utils.get_http_client = original_get_client
+        telegram_api.get_http_client = original_get_client
+        for client in fresh_clients:
+            await client.aclose()
+        await http_utils.close_http_client()
+        await tg_server.stop()
+        await rep_server.stop()
+
+    connections = tg_server.connections + rep_server.connections
+    requests = tg_server.requests + rep_server.requests
+    return {
+        "mode": mode,
+        "photos": photos,
+        "requests": requests,
+        "connections": connections,
+        "connections_per_photo": connections / photos,
+        "ms_per_photo": elapsed * 1000 / photos,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Handshakes на одно фото: клиент на запрос vs общий пул")
+    parser.add_argument("--photos", type=int, default=20, help="Сколько фото прогнать")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(mode, args.photos)) for mode in ("per-request", "pooled")]
+    print(f"{'mode':<12} {'requests':>9} {'conns':>7} {'conns/photo':>12} {'ms/photo':>9}")
+    for r in results:
+        print(
+            f"{r['mode']:<12} {r['requests']:>9} {r['connections']:>7} "
+            f"{r['connections_per_photo']:>12.2f} {r['ms_per_photo']:>9.2f}"
+        )
+    saved = results[0]["connections_per_photo"] - results[1]["connections_per_photo"]
+    print(f"Сэкономлено handshake на фото: {saved:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
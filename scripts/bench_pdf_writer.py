@@ -0,0 +1,71 @@
+"""
+Бенчмарк сборщиков PDF штендера (см. PdfWriter в src/services/shtender.py):
+- pil — фото вклеивается в копию шаблона, вся страница сохраняется через PIL;
+- direct — шаблон закодирован один раз, в PDF дописывается только JPEG фото.
+
+Печатает время рендера (весь render и этап pdf) и размер PDF на каждом фото.
+
+Запуск из корня проекта:
+  python -m scripts.bench_pdf_writer --photo assets/tmp5zl0dedr.jpg --runs 20 [--save-dir out/]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from src.services.shtender import PDF_WRITERS, ShtenderRenderer  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..1) без numpy."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Время рендера и размер PDF: pil vs direct")
+    parser.add_argument("--template", default="assets/shtender_template.png", help="Путь к PNG-шаблону")
+    parser.add_argument("--photo", action="append", help="Фото с лицом (можно несколько раз)")
+    parser.add_argument("--runs", type=int, default=20, help="Рендеров на фото и сборщик")
+    parser.add_argument("--save-dir", help="Сохранить по одному PDF каждого сборщика для сравнения")
+    args = parser.parse_args()
+    photos = args.photo or ["assets/tmp5zl0dedr.jpg"]
+
+    print(f"{'writer':<7} {'init, ms':>9} {'mean, ms':>9} {'p95, ms':>8} {'pdf, ms':>8} {'size, KB':>9}")
+    for name in PDF_WRITERS:
+        started = time.perf_counter()
+        renderer = ShtenderRenderer(args.template, pdf_writer=name)
+        init_seconds = time.perf_counter() - started
+
+        latencies: List[float] = []
+        stages: Dict[str, float] = {}
+        sizes: List[int] = []
+        for photo in photos:
+            renderer.render(photo)  # прогрев
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                pdf = renderer.render(photo, timings=stages)
+                latencies.append(time.perf_counter() - started)
+            sizes.append(len(pdf))
+            if args.save_dir:
+                os.makedirs(args.save_dir, exist_ok=True)
+                with open(os.path.join(args.save_dir, f"{Path(photo).stem}_{name}.pdf"), "wb") as f:
+                    f.write(pdf)
+
+        print(
+            f"{name:<7} {init_seconds * 1000:>9.1f} {statistics.mean(latencies) * 1000:>9.1f} "
+            f"{percentile(latencies, 0.95) * 1000:>8.1f} {stages.get('pdf', 0.0) * 1000 / len(latencies):>8.1f} "
+            f"{statistics.mean(sizes) / 1024:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Бенчмарк декодирования фото для штендера: полное декодирование против
+уменьшенного (JPEG draft, масштабирование в DCT-домене) на типичных разрешениях
+телефонных камер.
+
+Из фото с лицом (--photo) генерируются JPEG на 12/24/48 Мп (по умолчанию),
+каждый рендер выполняется в отдельном процессе, чтобы честно замерить пиковый RSS.
+
+Запуск из корня проекта:
+  python -m scripts.bench_photo_decode --photo assets/tmp5zl0dedr.jpg --resolutions 12,24,48
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+
+def child(template: str, photo: str, reduced: bool) -> None:
+    """Один рендер в текущем процессе; результат — JSON в stdout."""
+    from src.services.shtender import ShtenderRenderer
+
+    renderer = ShtenderRenderer(template, reduced_decode=reduced)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = {}
+    started = time.perf_counter()
+    renderer.render(photo, timings=timings)
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "total": elapsed,
+        "timings": timings,
+        "peak_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }))
+
+
+def make_photo(src: str, megapixels: float, out_dir: str) -> str:
+    """Увеличить исходное фото до нужного числа мегапикселей (с сохранением пропорций)."""
+    from PIL import Image
+
+    img = Image.open(src).convert("RGB")
+    k = math.sqrt(megapixels * 1_000_000 / (img.width * img.height))
+    size = (int(img.width * k), int(img.height * k))
+    path = os.path.join(out_dir, f"photo_{megapixels:g}mp.jpg")
+    img.resize(size, Image.Resampling.BICUBIC).save(path, quality=90)
+    return path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Полное vs уменьшенное декодирование фото для штендера")
+    parser.add_argument("--template", default="assets/shtender_template.png", help="Путь к PNG-шаблону")
+    parser.add_argument("--photo", default="assets/tmp5zl0dedr.jpg", help="Фото с лицом (исходник для генерации)")
+    parser.add_argument("--resolutions", default="12,24,48", help="Мегапиксели через запятую")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--reduced", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.template, args.photo, args.reduced)
+        return 0
+
+    print(f"{'MP':>4} {'mode':<8} {'total, ms':>10} {'load, ms':>9} {'detect, ms':>11} {'peak RSS, MB':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in (float(x) for x in args.resolutions.split(",")):
+            photo = make_photo(args.photo, mp, tmp)
+            for mode in ("full", "reduced"):
+                cmd = [sys.executable, "-m", "scripts.bench_photo_decode", "--child",
+                       "--template", args.template, "--photo", photo]
+                if mode == "reduced":
+                    cmd.append("--reduced")
+                out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=_project_root)
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                t = r["timings"]
+                print(
+                    f"{mp:>4g} {mode:<8} {r['total'] * 1000:>10.0f} {t.get('load', 0) * 1000:>9.0f} "
+                    f"{t.get('detect', 0) * 1000:>11.0f} {r['peak_rss_mb']:>13.0f}"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
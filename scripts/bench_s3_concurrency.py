@@ -0,0 +1,114 @@
+"""
+Бенчмарк: N параллельных фото и S3 — синхронные вызовы boto3 в event loop
+против асинхронного слоя src.services.s3_async (пул потоков).
+
+На одно фото выполняются те же операции S3, что и в process_telegram_image:
+load_user_state → upload_to_s3 → generate_presigned_url → save_task_state.
+Вместо сети S3 подставляется клиент с фиксированной задержкой на запрос
+(--latency-ms), поэтому результат не зависит от доступности бакета.
+
+Запуск из корня проекта: python -m scripts.bench_s3_concurrency --photos 20 --latency-ms 50
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+for _key in ("TG_BOT_TOKEN", "S3_BUCKET", "S3_ENDPOINT_URL", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("BASE_URL", "http://127.0.0.1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.config import config  # noqa: E402
+from src.services import s3_storage, s3_async  # noqa: E402
+
+
+class SlowS3Client:
+    """Клиент S3 с задержкой сети: put/get блокируют поток на latency секунд."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):  # noqa: N803
+        time.sleep(self.latency)
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key, **kwargs):  # noqa: N803
+        time.sleep(self.latency)
+        if Key not in self.objects:
+            raise s3_storage.ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def generate_presigned_url(self, *args, **kwargs):
+        return "http://s3.local/presigned"
+
+
+async def photo_blocking(i: int) -> None:
+    """Как было: синхронный boto3 прямо в корутине."""
+    s3_storage.load_user_state(i)
+    s3_storage.upload_to_s3(config.S3_BUCKET, f"images/input/{i}.jpg", b"x" * 1024, "image/jpeg")
+    s3_storage.generate_presigned_url(config.S3_BUCKET, f"images/input/{i}.jpg")
+    s3_storage.save_task_state(f"bench-{i}", {"prediction_id": f"bench-{i}", "chat_id": i})
+
+
+async def photo_async(i: int) -> None:
+    """Как стало: await s3_async.*."""
+    await s3_async.load_user_state(i)
+    await s3_async.upload_to_s3(config.S3_BUCKET, f"images/input/{i}.jpg", b"x" * 1024, "image/jpeg")
+    await s3_async.generate_presigned_url(config.S3_BUCKET, f"images/input/{i}.jpg")
+    await s3_async.save_task_state(f"bench-{i}", {"prediction_id": f"bench-{i}", "chat_id": i})
+
+
+async def measure(photo_fn, photos: int) -> dict:
+    """Запустить photos корутин параллельно и замерить время и лаг event loop."""
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def heartbeat() -> None:
+        nonlocal max_lag
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.005)
+            max_lag = max(max_lag, time.perf_counter() - t0 - 0.005)
+
+    hb = asyncio.create_task(heartbeat())
+    started = time.perf_counter()
+    await asyncio.gather(*(photo_fn(i) for i in range(photos)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await hb
+    return {"elapsed": elapsed, "max_loop_lag": max_lag}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Параллельные фото: sync boto3 в loop vs s3_async")
+    parser.add_argument("--photos", type=int, default=20, help="Сколько фото обрабатывать параллельно")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Задержка одного запроса к S3, мс")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    s3_storage._s3_client = SlowS3Client(args.latency_ms / 1000)
+
+    print(f"photos={args.photos} latency={args.latency_ms:.0f}ms S3_MAX_POOL_CONNECTIONS={config.S3_MAX_POOL_CONNECTIONS}")
+    print(f"{'mode':<10} {'total, s':>9} {'ms/photo':>9} {'max loop lag, ms':>17}")
+    for name, fn in (("blocking", photo_blocking), ("s3_async", photo_async)):
+        r = asyncio.run(measure(fn, args.photos))
+        print(
+            f"{name:<10} {r['elapsed']:>9.2f} {r['elapsed'] * 1000 / args.photos:>9.1f} "
+            f"{r['max_loop_lag'] * 1000:>17.1f}"
+        )
+    s3_async.shutdown_executor()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Бенчмарк генерации штендера: задержка одного рендера.
+
+Режимы:
+- cold — новый ShtenderRenderer на каждый рендер (шаблон и каскад Haar читаются
+  заново, как в build_shtender_pdf до появления ShtenderRenderer);
+- warm — один общий ShtenderRenderer (get_renderer), шаблон и каскад уже загружены.
+
+Запуск из корня проекта:
+  python -m scripts.bench_shtender --photo assets/tmp5zl0dedr.jpg --runs 20
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from src.services.shtender import ShtenderRenderer, get_renderer  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..1) без numpy."""
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def bench(render: Callable[[Dict[str, float]], bytes], runs: int) -> dict:
+    """Прогнать render runs раз, вернуть статистику задержки и этапов."""
+    latencies: List[float] = []
+    stages: Dict[str, float] = {}
+    size = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        size = len(render(stages))
+        latencies.append(time.perf_counter() - started)
+    return {
+        "mean": statistics.mean(latencies),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "stages": {k: v / runs for k, v in stages.items()},
+        "size": size,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Задержка рендера штендера: cold vs warm ShtenderRenderer")
+    parser.add_argument("--template", default="assets/shtender_template.png", help="Путь к PNG-шаблону")
+    parser.add_argument("--photo", default="assets/tmp5zl0dedr.jpg", help="Фото с лицом")
+    parser.add_argument("--runs", type=int, default=20, help="Количество рендеров на режим")
+    args = parser.parse_args()
+
+    def cold(stages: Dict[str, float]) -> bytes:
+        started = time.perf_counter()
+        renderer = ShtenderRenderer(args.template)
+        stages["init"] = stages.get("init", 0.0) + time.perf_counter() - started
+        return renderer.render(args.photo, timings=stages)
+
+    warm_renderer = get_renderer(args.template)
+
+    def warm(stages: Dict[str, float]) -> bytes:
+        return warm_renderer.render(args.photo, timings=stages)
+
+    print(f"{'mode':<6} {'mean, ms':>9} {'p50, ms':>8} {'p95, ms':>8}  stages, ms")
+    for name, fn in (("cold", cold), ("warm", warm)):
+        fn({})  # прогрев импорта/кэшей ОС
+        r = bench(fn, args.runs)
+        stages = " ".join(f"{k}={v * 1000:.1f}" for k, v in r["stages"].items())
+        print(f"{name:<6} {r['mean'] * 1000:>9.1f} {r['p50'] * 1000:>8.1f} {r['p95'] * 1000:>8.1f}  {stages}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
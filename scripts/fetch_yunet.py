@@ -0,0 +1,94 @@
+"""
+Скачать ONNX-модель YuNet (OpenCV Zoo) для детектора лица штендера.
+
+Модель в репозиторий не входит; без нее SHTENDER_FACE_DETECTOR=yunet не
+запускается (ошибка при прогреве приложения и на каждом штендере). Шаг нужен
+перед сборкой образа / пакета функции (deploy-yc-functions.ps1 копирует assets/
+целиком) и перед `python -m scripts.bench_face_detect --backends ...,yunet`.
+
+Файл пишется атомарно (временный файл → rename) и проверяется загрузкой в
+cv2.FaceDetectorYN, если opencv установлен. SHA-256 печатается — его можно
+закрепить через --sha256 в CI.
+
+Запуск из корня проекта:
+  python -m scripts.fetch_yunet [--output assets/face_detection_yunet_2023mar.onnx] [--sha256 ...] [--force]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from src.config import config  # noqa: E402
+
+YUNET_URL = (
+    "https://github.com/opencv/opencv_zoo/raw/main/models/"
+    "face_detection_yunet/face_detection_yunet_2023mar.onnx"
+)
+
+
+def _check_model(path: str) -> str:
+    """Загрузить модель в OpenCV; пустая строка — успех или opencv не установлен."""
+    try:
+        from src.services.shtender import YuNetFaceDetector
+    except ImportError:
+        return ""
+    try:
+        YuNetFaceDetector(model_path=path)
+    except Exception as e:
+        return str(e)
+    return ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Скачать модель YuNet для SHTENDER_FACE_DETECTOR=yunet")
+    parser.add_argument("--url", default=YUNET_URL, help="Откуда скачать ONNX-модель")
+    parser.add_argument("--output", default=config.SHTENDER_YUNET_MODEL_PATH, help="Куда сохранить")
+    parser.add_argument("--sha256", help="Ожидаемый SHA-256 файла")
+    parser.add_argument("--force", action="store_true", help="Скачать, даже если файл уже есть")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Таймаут загрузки (с)")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.output) and not args.force:
+        print(f"Модель уже есть: {args.output} (--force — скачать заново)")
+        return 0
+
+    try:
+        with urllib.request.urlopen(args.url, timeout=args.timeout) as response:
+            data = response.read()
+    except OSError as e:
+        print(f"Не удалось скачать {args.url}: {e}", file=sys.stderr)
+        return 1
+
+    digest = hashlib.sha256(data).hexdigest()
+    if args.sha256 and digest != args.sha256.lower():
+        print(f"SHA-256 не совпадает: {digest} (ожидался {args.sha256})", file=sys.stderr)
+        return 1
+
+    directory = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".onnx", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        error = _check_model(tmp_path)
+        if error:
+            print(f"Скачанный файл не загружается как модель YuNet: {error}", file=sys.stderr)
+            return 1
+        os.replace(tmp_path, args.output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    print(f"Модель сохранена: {args.output} ({len(data) / 1024:.0f} КБ, sha256 {digest})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
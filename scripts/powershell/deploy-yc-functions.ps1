@@ -1,5 +1,5 @@
 # Deploy Cloud Functions (create-or-update) for the project.
-# - builds ZIP (src/ + handler.py + callback.py + requirements.txt)
+# - builds ZIP (src/ + handler.py + callback.py + reconciler.py + requirements.txt)
 # - creates/updates 2 functions: Telegram and Replicate
 # - passes env vars from yc.env and yc.secrets.env
 #
@@ -160,12 +160,23 @@ Write-Host "`nPreparing artifact (code directory)..." -ForegroundColor Yellow
 Copy-Item -Recurse -Force (Join-Path $repoRoot "src") (Join-Path $buildDir "src")
 Copy-Item -Force (Join-Path $repoRoot "handler.py") (Join-Path $buildDir "handler.py")
 Copy-Item -Force (Join-Path $repoRoot "callback.py") (Join-Path $buildDir "callback.py")
+Copy-Item -Force (Join-Path $repoRoot "reconciler.py") (Join-Path $buildDir "reconciler.py")
 Copy-Item -Force (Join-Path $repoRoot "requirements.functions.txt") (Join-Path $buildDir "requirements.txt")
 # Шаблон штендера (режим «Создание штендера»)
 $assetsSrc = Join-Path $repoRoot "assets"
 if (Test-Path $assetsSrc) {
     Copy-Item -Recurse -Force $assetsSrc (Join-Path $buildDir "assets")
 }
+# Байт-код в архиве: холодный старт не тратит время на компиляцию модулей.
+# Только если локальный Python той же версии, что и runtime (иначе .pyc не подойдут).
+$runtimeTag = $runtime -replace "^python", ""
+$localTag = & python -c "import sys; print(f'{sys.version_info[0]}{sys.version_info[1]}')" 2>$null
+if ($localTag -eq $runtimeTag) {
+    & python -m compileall -q -j 0 $buildDir | Out-Null
+    Write-Host "Bytecode precompiled (python$localTag)" -ForegroundColor Green
+} else {
+    Write-Host "Skip bytecode precompile: local python$localTag != $runtime" -ForegroundColor Yellow
+}
 
 Write-Host "Artifact ready: $buildDir" -ForegroundColor Green
 
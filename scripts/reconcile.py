@@ -0,0 +1,63 @@
+"""
+Сверка зависших задач с Replicate (потерянные вебхуки), см. src/domain/reconcile.py.
+
+Запуск из корня проекта (нужен .env с доступом к бакету и Replicate / MOCK_REPLICATE_URL):
+  python -m scripts.reconcile [--min-age 600] [--days 1] [--concurrency 8] [--dry-run]
+  python -m scripts.reconcile --id <prediction_id> [--id ...]
+  python -m scripts.reconcile --loop 300
+
+Вывод — JSON со счетчиками итогов за проход.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from src.domain import reconcile  # noqa: E402
+from src.services import s3_async  # noqa: E402
+from src.utils.http import close_http_client  # noqa: E402
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        while True:
+            summary = await reconcile.reconcile_stuck_tasks(
+                min_age_seconds=args.min_age,
+                lookback_days=args.days,
+                concurrency=args.concurrency,
+                dry_run=args.dry_run,
+                prediction_ids=args.id,
+            )
+            print(json.dumps(summary, ensure_ascii=False), flush=True)
+            if not args.loop:
+                return 1 if summary.get("error") else 0
+            await asyncio.sleep(args.loop)
+    finally:
+        await close_http_client()
+        s3_async.shutdown_executor()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сверка зависших задач с Replicate")
+    parser.add_argument("--min-age", type=int, default=None, help="Порог возраста задачи, с (по умолчанию RECONCILE_MIN_AGE_SECONDS)")
+    parser.add_argument("--days", type=int, default=None, help="Проверить и задачи за N прошлых дней по index/days/")
+    parser.add_argument("--concurrency", type=int, default=None, help="Одновременных запросов к Replicate")
+    parser.add_argument("--id", action="append", help="Сверить только эту задачу (можно несколько раз)")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать итоги, ничего не отправлять")
+    parser.add_argument("--loop", type=float, default=0, help="Повторять каждые N секунд")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,16 +2,166 @@
 CLI для генерации штендера: шаблон + фото (файл или URL) → PDF.
 При отсутствии лица на фото штендер не создаётся, выводится сообщение.
 Запуск из корня проекта: python -m scripts.shtender_cli --template ... --photo ... --output ...
+
+Пакетный режим (папка, glob или манифест → папка с PDF, пул процессов):
+  python -m scripts.shtender_cli --template ... --input-dir photos/ --output-dir out/ [--workers 4]
+  python -m scripts.shtender_cli --template ... --glob "photos/**/*.jpg" --output-dir out/
+  python -m scripts.shtender_cli --template ... --manifest list.txt --output-dir out/
+Манифест — текстовый файл: один путь или URL на строку, строки с # игнорируются.
 """
 import argparse
+import glob
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 _project_root = Path(__file__).resolve().parent.parent
 if str(_project_root) not in sys.path:
     sys.path.insert(0, str(_project_root))
 
-from src.services.shtender import build_shtender_pdf, FaceNotFoundError
+import cv2
+
+from src.services.shtender import FACE_DETECTOR_BACKENDS, PDF_WRITERS, get_renderer, FaceNotFoundError
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Шаблон, детектор и сборщик PDF воркера пакетного режима (задаются в _init_worker)
+_worker_template: Optional[str] = None
+_worker_detector: str = "haar"
+_worker_pdf_writer: str = "pil"
+
+
+def _init_worker(template_path: str, detector: str = "haar", pdf_writer: str = "pil") -> None:
+    """Инициализация процесса-воркера: заранее загрузить шаблон и детектор лица."""
+    global _worker_template, _worker_detector, _worker_pdf_writer
+    # Параллелизм дает пул процессов; внутренние потоки OpenCV только конкурируют за CPU
+    cv2.setNumThreads(1)
+    _worker_template = template_path
+    _worker_detector = detector
+    _worker_pdf_writer = pdf_writer
+    get_renderer(template_path, backend=detector, pdf_writer=pdf_writer)
+
+
+def _render_one(photo: str, output_path: str) -> Tuple[str, str, Dict[str, float], str]:
+    """
+    Отрендерить один штендер в воркере.
+
+    Returns:
+        (photo, статус "ok" | "no_face" | "error", этапы в секундах, текст ошибки)
+    """
+    timings: Dict[str, float] = {}
+    try:
+        renderer = get_renderer(_worker_template, backend=_worker_detector, pdf_writer=_worker_pdf_writer)
+        renderer.render(photo, output_path=output_path, timings=timings)
+        return photo, "ok", timings, ""
+    except FaceNotFoundError as e:
+        return photo, "no_face", timings, str(e)
+    except Exception as e:  # noqa: BLE001 — одна битая картинка не должна ронять пакет
+        return photo, "error", timings, f"{type(e).__name__}: {e}"
+
+
+def _collect_photos(args: argparse.Namespace) -> List[str]:
+    """Собрать список фото из --input-dir / --glob / --manifest."""
+    if args.input_dir:
+        return sorted(
+            str(p) for p in Path(args.input_dir).iterdir()
+            if p.is_file() and p.suffix.lower() in PHOTO_EXTENSIONS
+        )
+    if args.glob:
+        return sorted(p for p in glob.glob(args.glob, recursive=True) if os.path.isfile(p))
+    with open(args.manifest, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _output_names(photos: List[str], output_dir: str) -> List[str]:
+    """Имена PDF по именам фото; при совпадении добавляется порядковый номер."""
+    used = set()
+    outputs = []
+    for i, photo in enumerate(photos):
+        stem = Path(photo.split("?", 1)[0].rstrip("/")).stem or f"photo_{i}"
+        name = f"{stem}.pdf"
+        if name in used:
+            name = f"{stem}_{i}.pdf"
+        used.add(name)
+        outputs.append(os.path.join(output_dir, name))
+    return outputs
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Пакетная генерация штендеров в пуле процессов."""
+    photos = _collect_photos(args)
+    if not photos:
+        print("Фото не найдены.", file=sys.stderr)
+        return 1
+    # Шаблон и детектор проверяются здесь один раз: ошибка в _init_worker
+    # проявилась бы только как BrokenProcessPool на каждом фото
+    try:
+        get_renderer(args.template, backend=args.detector, pdf_writer=args.pdf_writer)
+    except Exception as e:  # noqa: BLE001 — любая ошибка подготовки останавливает пакет
+        print(f"Не удалось подготовить рендер штендера: {type(e).__name__}: {e}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    outputs = _output_names(photos, args.output_dir)
+    workers = args.workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    ok: List[str] = []
+    no_face: List[str] = []
+    errors: List[Tuple[str, str]] = []
+    stage_totals: Dict[str, float] = {}
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(args.template, args.detector, args.pdf_writer),
+        ) as executor:
+            futures = [executor.submit(_render_one, photo, out) for photo, out in zip(photos, outputs)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                photo, status, timings, error = future.result()
+                for stage, seconds in timings.items():
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+                if status == "ok":
+                    ok.append(photo)
+                elif status == "no_face":
+                    no_face.append(photo)
+                else:
+                    errors.append((photo, error))
+                if not args.quiet:
+                    print(f"[{done}/{len(photos)}] {status}: {photo}")
+    except BrokenProcessPool as e:
+        # Воркер не запустился или завершился аварийно (нехватка памяти, сбой OpenCV)
+        print(
+            f"Пул воркеров остановлен аварийно ({e}); готово PDF: {len(ok)} из {len(photos)}. "
+            f"Попробуйте меньше воркеров (--workers).",
+            file=sys.stderr,
+        )
+        return 1
+
+    elapsed = time.perf_counter() - started
+
+    if no_face:
+        report_path = os.path.join(args.output_dir, "faces_not_found.txt")
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(no_face) + "\n")
+        print(f"\nЛицо не найдено ({len(no_face)}), список: {report_path}")
+        for photo in no_face:
+            print(f"  {photo}")
+    if errors:
+        print(f"\nОшибки ({len(errors)}):", file=sys.stderr)
+        for photo, error in errors:
+            print(f"  {photo}: {error}", file=sys.stderr)
+
+    print(f"\nГотово: {len(ok)} PDF в {args.output_dir}, без лица: {len(no_face)}, ошибок: {len(errors)}")
+    print(f"Воркеров: {workers}, время: {elapsed:.2f} с, пропускная способность: {len(photos) / elapsed:.2f} рендеров/с")
+    if stage_totals:
+        stages = ", ".join(f"{k}={v * 1000 / len(photos):.1f}" for k, v in stage_totals.items())
+        print(f"Среднее по этапам, мс на фото: {stages}")
+    return 0 if not no_face and not errors else 1
 
 
 def main() -> int:
@@ -19,13 +169,28 @@ def main() -> int:
         description="Собрать штендер: шаблон + фото (файл или URL) → PDF. Лицо на фото обязательно."
     )
     parser.add_argument("--template", required=True, help="Путь к PNG-шаблону штендера")
-    parser.add_argument("--photo", required=True, help="Путь к файлу фото (jpg/png) или URL")
-    parser.add_argument("--output", required=True, help="Путь для сохранения PDF")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--photo", help="Путь к файлу фото (jpg/png) или URL")
+    source.add_argument("--input-dir", help="Пакетный режим: папка с фото (jpg/png)")
+    source.add_argument("--glob", help="Пакетный режим: glob-шаблон фото, например \"photos/**/*.jpg\"")
+    source.add_argument("--manifest", help="Пакетный режим: файл со списком путей/URL фото")
+    parser.add_argument("--detector", choices=FACE_DETECTOR_BACKENDS, default="haar", help="Детектор лица")
+    parser.add_argument("--pdf-writer", choices=PDF_WRITERS, default="pil", help="Сборщик PDF: pil (по умолчанию) или direct (включается явно)")
+    parser.add_argument("--output", help="Путь для сохранения PDF (одиночный режим)")
+    parser.add_argument("--output-dir", help="Папка для PDF (пакетный режим)")
+    parser.add_argument("--workers", type=int, default=0, help="Число процессов (по умолчанию — число CPU)")
+    parser.add_argument("--quiet", action="store_true", help="Не печатать прогресс по каждому фото")
     args = parser.parse_args()
 
+    if args.photo is None:
+        if not args.output_dir:
+            parser.error("в пакетном режиме нужен --output-dir")
+        return run_batch(args)
+    if not args.output:
+        parser.error("нужен --output")
+
     try:
-        build_shtender_pdf(
-            template_path=args.template,
+        get_renderer(args.template, backend=args.detector, pdf_writer=args.pdf_writer).render(
             photo_source=args.photo,
             output_path=args.output,
         )
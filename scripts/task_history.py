@@ -0,0 +1,55 @@
+"""
+Запросы администратора к истории задач по индексам S3 (без обхода tasks/).
+
+Запуск из корня проекта (нужен .env с доступом к бакету):
+  python -m scripts.task_history --chat-id 123456789 [--limit 20] [--pending] [--full]
+  python -m scripts.task_history --day 2026-01-21
+
+Вывод — JSON по строке на задачу: запись индекса, с --full — полное состояние задачи.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from src.domain import history  # noqa: E402
+from src.services import s3_async  # noqa: E402
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        if args.day:
+            for prediction_id in await history.get_day_tasks(date.fromisoformat(args.day)):
+                print(json.dumps({"id": prediction_id}))
+            return 0
+
+        statuses = history.PENDING_STATUSES if args.pending else None
+        entries = await history.get_chat_history(args.chat_id, limit=args.limit, statuses=statuses)
+        rows = await history.load_task_states(entries) if args.full else entries
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False, default=str))
+        return 0
+    finally:
+        s3_async.shutdown_executor()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="История задач чата / задачи дня по индексам S3")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--chat-id", type=int, help="ID чата Telegram")
+    target.add_argument("--day", help="День создания задач (UTC), YYYY-MM-DD")
+    parser.add_argument("--limit", type=int, default=20, help="Сколько последних задач чата")
+    parser.add_argument("--pending", action="store_true", help="Только незавершенные (queued / processing)")
+    parser.add_argument("--full", action="store_true", help="Загрузить полные состояния задач")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
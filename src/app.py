@@ -1,13 +1,18 @@
 """
 FastAPI приложение - точка входа для локальной разработки.
 """
+import asyncio
 import logging
+import os
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from src.config import config
 from src.handlers import telegram_webhook, replicate_webhook
+from src.services import admission, file_id_cache, preprocess, s3_async, result_cache, telegram_api, transcode, update_dedup
+from src.utils.dispatcher import webhook_dispatcher
+from src.utils.http import get_http_client, close_http_client
 
 # Настройка логирования
 logging.basicConfig(
@@ -53,6 +58,23 @@ async def health_check():
     })
 
 
+# Счетчики процесса (кэши, очереди) для мониторинга
+@app.get("/metrics")
+async def metrics():
+    """Метрики процесса в JSON."""
+    return JSONResponse(content={
+        "result_cache": result_cache.get_stats(),
+        "file_id_cache": file_id_cache.get_stats(),
+        "preprocess": preprocess.get_stats(),
+        "transcode": transcode.get_stats(),
+        "user_state_cache": s3_async.user_state_cache.get_stats(),
+        "telegram_rate_limiter": telegram_api.rate_limiter.get_stats(),
+        "admission": admission.governor.get_stats(),
+        "webhook_dispatcher": webhook_dispatcher.get_stats(),
+        "update_dedup": update_dedup.deduplicator.get_stats(),
+    })
+
+
 # Корневой endpoint для Telegram webhook (совместимость)
 # Поддерживает как /, так и /webhook/telegram
 @app.post("/")
@@ -73,6 +95,26 @@ async def startup_event():
     logger.info(f"S3 endpoint: {config.S3_ENDPOINT_URL}")
     logger.info(f"S3 bucket: {config.S3_BUCKET}")
     logger.info(f"Base URL: {config.BASE_URL}")
+
+    # Общий пул HTTP-соединений (Telegram / Replicate) живет вместе с приложением
+    get_http_client()
+
+    # Бакет проверяется (и для MinIO создается) один раз при запуске, а не на пути запроса
+    try:
+        await s3_async.ensure_bucket()
+    except Exception as e:
+        logger.error(f"Бакет {config.S3_BUCKET} недоступен: {e}")
+
+    # Воркеры фоновой обработки вебхуков
+    webhook_dispatcher.start()
+
+    # Прогреть генератор штендеров (шаблон + каскад), чтобы первое фото не платило за загрузку
+    if os.path.isfile(config.SHTENDER_TEMPLATE_PATH):
+        try:
+            from src.domain.logic import get_shtender_renderer
+            await asyncio.to_thread(get_shtender_renderer)
+        except ImportError:
+            logger.info("Штендер недоступен (opencv не установлен)")
     
     # Проверка конфигурации Replicate
     if config.MOCK_REPLICATE_URL:
@@ -94,6 +136,10 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при остановке приложения."""
+    # Сначала дождаться принятых вебхуков: им еще нужны HTTP-клиент и S3
+    await webhook_dispatcher.drain()
+    await close_http_client()
+    s3_async.shutdown_executor()
     logger.info("Приложение остановлено")
 
 
@@ -3,7 +3,7 @@
 """
 import os
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения из .env
@@ -17,6 +17,7 @@ class Config:
     
     # Telegram
     TG_BOT_TOKEN: str
+    TG_API_BASE_URL: str = "https://api.telegram.org"
     
     # S3 / MinIO
     S3_BUCKET: str
@@ -26,6 +27,8 @@ class Config:
     S3_FORCE_PATH_STYLE: bool = True
     S3_USE_SSL: bool = False
     S3_PRESIGN_EXPIRES_SECONDS: int = 3600
+    S3_MAX_POOL_CONNECTIONS: int = 10
+    S3_MULTIPART_CHUNK_MB: int = 5
     
     # Webhook
     BASE_URL: str
@@ -37,12 +40,88 @@ class Config:
     
     # Штендер
     SHTENDER_TEMPLATE_PATH: str = "assets/shtender_template.png"
+    SHTENDER_DETECT_MAX_SIDE: int = 480
+    SHTENDER_DETECT_SCALE_FACTOR: float = 1.1
+    SHTENDER_DETECT_MIN_NEIGHBORS: int = 5
+    SHTENDER_DETECT_MIN_SIZE: int = 30
+    SHTENDER_FACE_DETECTOR: str = "haar"
+    SHTENDER_YUNET_MODEL_PATH: str = "assets/face_detection_yunet_2023mar.onnx"
+    SHTENDER_PDF_WRITER: str = "pil"
 
     # Лимиты
     MAX_IMAGE_MB: int = 10
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    FILE_ID_CACHE_ENABLED: bool = True
+    FILE_ID_CACHE_SIZE: int = 10000
+    FILE_ID_CACHE_TTL_SECONDS: int = 24 * 3600
+    PREPROCESS_ENABLED: bool = True
+    PREPROCESS_MAX_SIDE: int = 2048
+    PREPROCESS_MAX_SIDE_BY_MODE: Dict[str, int] = {"upscale": 1024}
+    PREPROCESS_JPEG_QUALITY: int = 90
+    OUTPUT_TRANSCODE_ENABLED: bool = True
+    OUTPUT_PHOTO_MAX_SIDE: int = 2560
+    OUTPUT_JPEG_QUALITY: int = 90
+    OUTPUT_ORIGINAL_BUTTON: bool = True
+    JSON_CODEC: str = "auto"
+    TASK_INDEX_MAX_ENTRIES: int = 50
+    ALBUM_BATCHING_ENABLED: bool = True
+    ALBUM_BUFFER_SECONDS: float = 1.0
+    ALBUM_SEAL_SECONDS: float = 3.0
+    USER_STATE_CACHE_SIZE: int = 10000
+    USER_STATE_CACHE_TTL_SECONDS: int = 300
+    USER_STATE_CACHE_NEGATIVE_TTL_SECONDS: int = 60
     ALLOWED_IMAGE_MIME: List[str] = ["image/jpeg", "image/png"]
     DEFAULT_MODE: str = "restoration"
     
+    # HTTP-клиент (общий пул соединений)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = False
+
+    # Исходящие сообщения Telegram (планировщик отправок)
+    TG_RATE_LIMIT_PER_SECOND: float = 25.0
+    TG_RATE_LIMIT_BURST: int = 5
+    TG_CHAT_RATE_LIMIT_PER_SECOND: float = 1.0
+    TG_CHAT_RATE_LIMIT_BURST: int = 2
+    TG_RATE_LIMIT_MAX_RETRIES: int = 3
+    TG_RATE_LIMIT_MAX_RETRY_AFTER: float = 30.0
+
+    # Допуск задач в Replicate (src/services/admission.py)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_INITIAL_LIMIT: float = 8.0
+    ADMISSION_MIN_LIMIT: float = 1.0
+    ADMISSION_MAX_LIMIT: float = 32.0
+    ADMISSION_SHED_QUEUE: int = 20
+    ADMISSION_MAX_WAIT_SECONDS: float = 120.0
+    ADMISSION_REFRESH_SECONDS: float = 2.0
+    ADMISSION_DECREASE_COOLDOWN_SECONDS: float = 5.0
+    ADMISSION_INFLIGHT_TTL_SECONDS: int = 900
+    ADMISSION_OVERLOAD_RETRIES: int = 2
+
+    # Защита от повторов Update Telegram (src/services/update_dedup.py)
+    UPDATE_DEDUP_ENABLED: bool = True
+    UPDATE_DEDUP_S3_ENABLED: bool = True
+    UPDATE_DEDUP_CACHE_SIZE: int = 10000
+    UPDATE_DEDUP_TTL_SECONDS: int = 3600
+    UPDATE_DEDUP_LEASE_SECONDS: int = 120
+
+    # Фоновая обработка вебхуков в FastAPI (src/utils/dispatcher.py)
+    DISPATCHER_WORKERS: int = 32
+    DISPATCHER_MAX_QUEUE: int = 1000
+    DISPATCHER_ENQUEUE_TIMEOUT_SECONDS: float = 5.0
+    DISPATCHER_DRAIN_TIMEOUT_SECONDS: float = 25.0
+
+    # Сверка зависших задач с Replicate (src/domain/reconcile.py)
+    RECONCILE_MIN_AGE_SECONDS: int = 600
+    RECONCILE_LOOKBACK_DAYS: int = 0
+    RECONCILE_CONCURRENCY: int = 8
+
+    # Постоянный event loop Cloud Functions между вызовами (src/utils/runtime.py)
+    FUNCTION_PERSISTENT_LOOP: bool = True
+    FUNCTION_LOOP_PING_TIMEOUT_SECONDS: float = 2.0
+
     # Логирование
     LOG_LEVEL: str = "INFO"
     
@@ -50,6 +129,7 @@ class Config:
         """Инициализация конфигурации с валидацией обязательных переменных."""
         # Обязательные переменные
         self.TG_BOT_TOKEN = self._get_required("TG_BOT_TOKEN")
+        self.TG_API_BASE_URL = os.getenv("TG_API_BASE_URL", "https://api.telegram.org").rstrip("/")
         self.S3_BUCKET = self._get_required("S3_BUCKET")
         self.S3_ENDPOINT_URL = self._get_required("S3_ENDPOINT_URL")
         self.AWS_ACCESS_KEY_ID = self._get_required("AWS_ACCESS_KEY_ID")
@@ -60,7 +140,29 @@ class Config:
         self.S3_FORCE_PATH_STYLE = self._get_bool("S3_FORCE_PATH_STYLE", True)
         self.S3_USE_SSL = self._get_bool("S3_USE_SSL", False)
         self.S3_PRESIGN_EXPIRES_SECONDS = self._get_int("S3_PRESIGN_EXPIRES_SECONDS", 3600)
+        self.S3_MAX_POOL_CONNECTIONS = self._get_int("S3_MAX_POOL_CONNECTIONS", 10)
+        self.S3_MULTIPART_CHUNK_MB = self._get_int("S3_MULTIPART_CHUNK_MB", 5)
         self.MAX_IMAGE_MB = self._get_int("MAX_IMAGE_MB", 10)
+        self.RESULT_CACHE_ENABLED = self._get_bool("RESULT_CACHE_ENABLED", True)
+        self.RESULT_CACHE_TTL_SECONDS = self._get_int("RESULT_CACHE_TTL_SECONDS", 30 * 24 * 3600)
+        self.FILE_ID_CACHE_ENABLED = self._get_bool("FILE_ID_CACHE_ENABLED", True)
+        self.FILE_ID_CACHE_SIZE = self._get_int("FILE_ID_CACHE_SIZE", 10000)
+        self.FILE_ID_CACHE_TTL_SECONDS = self._get_int("FILE_ID_CACHE_TTL_SECONDS", 24 * 3600)
+        self.PREPROCESS_ENABLED = self._get_bool("PREPROCESS_ENABLED", True)
+        self.PREPROCESS_MAX_SIDE = self._get_int("PREPROCESS_MAX_SIDE", 2048)
+        self.PREPROCESS_JPEG_QUALITY = self._get_int("PREPROCESS_JPEG_QUALITY", 90)
+        self.OUTPUT_TRANSCODE_ENABLED = self._get_bool("OUTPUT_TRANSCODE_ENABLED", True)
+        self.OUTPUT_PHOTO_MAX_SIDE = self._get_int("OUTPUT_PHOTO_MAX_SIDE", 2560)
+        self.OUTPUT_JPEG_QUALITY = self._get_int("OUTPUT_JPEG_QUALITY", 90)
+        self.OUTPUT_ORIGINAL_BUTTON = self._get_bool("OUTPUT_ORIGINAL_BUTTON", True)
+        self.JSON_CODEC = os.getenv("JSON_CODEC", "auto").strip().lower()
+        self.TASK_INDEX_MAX_ENTRIES = self._get_int("TASK_INDEX_MAX_ENTRIES", 50)
+        self.ALBUM_BATCHING_ENABLED = self._get_bool("ALBUM_BATCHING_ENABLED", True)
+        self.ALBUM_BUFFER_SECONDS = self._get_float("ALBUM_BUFFER_SECONDS", 1.0)
+        self.ALBUM_SEAL_SECONDS = self._get_float("ALBUM_SEAL_SECONDS", 3.0)
+        self.USER_STATE_CACHE_SIZE = self._get_int("USER_STATE_CACHE_SIZE", 10000)
+        self.USER_STATE_CACHE_TTL_SECONDS = self._get_int("USER_STATE_CACHE_TTL_SECONDS", 300)
+        self.USER_STATE_CACHE_NEGATIVE_TTL_SECONDS = self._get_int("USER_STATE_CACHE_NEGATIVE_TTL_SECONDS", 60)
         self.DEFAULT_MODE = os.getenv("DEFAULT_MODE", "restoration")
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
         self.MOCK_REPLICATE_URL = os.getenv("MOCK_REPLICATE_URL")
@@ -68,6 +170,66 @@ class Config:
         # В реальном Replicate API требуется именно version id модели
         self.REPLICATE_MODEL_VERSION = os.getenv("REPLICATE_MODEL_VERSION")
         self.SHTENDER_TEMPLATE_PATH = os.getenv("SHTENDER_TEMPLATE_PATH", "assets/shtender_template.png")
+        self.SHTENDER_DETECT_MAX_SIDE = self._get_int("SHTENDER_DETECT_MAX_SIDE", 480)
+        self.SHTENDER_DETECT_SCALE_FACTOR = self._get_float("SHTENDER_DETECT_SCALE_FACTOR", 1.1)
+        self.SHTENDER_DETECT_MIN_NEIGHBORS = self._get_int("SHTENDER_DETECT_MIN_NEIGHBORS", 5)
+        self.SHTENDER_DETECT_MIN_SIZE = self._get_int("SHTENDER_DETECT_MIN_SIZE", 30)
+        self.SHTENDER_FACE_DETECTOR = os.getenv("SHTENDER_FACE_DETECTOR", "haar").strip().lower()
+        self.SHTENDER_YUNET_MODEL_PATH = os.getenv(
+            "SHTENDER_YUNET_MODEL_PATH", "assets/face_detection_yunet_2023mar.onnx"
+        )
+        self.SHTENDER_PDF_WRITER = os.getenv("SHTENDER_PDF_WRITER", "pil").strip().lower()
+
+        self.HTTP_MAX_CONNECTIONS = self._get_int("HTTP_MAX_CONNECTIONS", 100)
+        self.HTTP_MAX_KEEPALIVE_CONNECTIONS = self._get_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+        self.HTTP_KEEPALIVE_EXPIRY = self._get_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+        self.HTTP2_ENABLED = self._get_bool("HTTP2_ENABLED", False)
+
+        self.TG_RATE_LIMIT_PER_SECOND = self._get_float("TG_RATE_LIMIT_PER_SECOND", 25.0)
+        self.TG_RATE_LIMIT_BURST = self._get_int("TG_RATE_LIMIT_BURST", 5)
+        self.TG_CHAT_RATE_LIMIT_PER_SECOND = self._get_float("TG_CHAT_RATE_LIMIT_PER_SECOND", 1.0)
+        self.TG_CHAT_RATE_LIMIT_BURST = self._get_int("TG_CHAT_RATE_LIMIT_BURST", 2)
+        self.TG_RATE_LIMIT_MAX_RETRIES = self._get_int("TG_RATE_LIMIT_MAX_RETRIES", 3)
+        self.TG_RATE_LIMIT_MAX_RETRY_AFTER = self._get_float("TG_RATE_LIMIT_MAX_RETRY_AFTER", 30.0)
+
+        self.ADMISSION_ENABLED = self._get_bool("ADMISSION_ENABLED", True)
+        self.ADMISSION_INITIAL_LIMIT = self._get_float("ADMISSION_INITIAL_LIMIT", 8.0)
+        self.ADMISSION_MIN_LIMIT = self._get_float("ADMISSION_MIN_LIMIT", 1.0)
+        self.ADMISSION_MAX_LIMIT = self._get_float("ADMISSION_MAX_LIMIT", 32.0)
+        self.ADMISSION_SHED_QUEUE = self._get_int("ADMISSION_SHED_QUEUE", 20)
+        self.ADMISSION_MAX_WAIT_SECONDS = self._get_float("ADMISSION_MAX_WAIT_SECONDS", 120.0)
+        self.ADMISSION_REFRESH_SECONDS = self._get_float("ADMISSION_REFRESH_SECONDS", 2.0)
+        self.ADMISSION_DECREASE_COOLDOWN_SECONDS = self._get_float("ADMISSION_DECREASE_COOLDOWN_SECONDS", 5.0)
+        self.ADMISSION_INFLIGHT_TTL_SECONDS = self._get_int("ADMISSION_INFLIGHT_TTL_SECONDS", 900)
+        self.ADMISSION_OVERLOAD_RETRIES = self._get_int("ADMISSION_OVERLOAD_RETRIES", 2)
+
+        self.UPDATE_DEDUP_ENABLED = self._get_bool("UPDATE_DEDUP_ENABLED", True)
+        self.UPDATE_DEDUP_S3_ENABLED = self._get_bool("UPDATE_DEDUP_S3_ENABLED", True)
+        self.UPDATE_DEDUP_CACHE_SIZE = self._get_int("UPDATE_DEDUP_CACHE_SIZE", 10000)
+        self.UPDATE_DEDUP_TTL_SECONDS = self._get_int("UPDATE_DEDUP_TTL_SECONDS", 3600)
+        self.UPDATE_DEDUP_LEASE_SECONDS = self._get_int("UPDATE_DEDUP_LEASE_SECONDS", 120)
+
+        self.DISPATCHER_WORKERS = self._get_int("DISPATCHER_WORKERS", 32)
+        self.DISPATCHER_MAX_QUEUE = self._get_int("DISPATCHER_MAX_QUEUE", 1000)
+        self.DISPATCHER_ENQUEUE_TIMEOUT_SECONDS = self._get_float("DISPATCHER_ENQUEUE_TIMEOUT_SECONDS", 5.0)
+        self.DISPATCHER_DRAIN_TIMEOUT_SECONDS = self._get_float("DISPATCHER_DRAIN_TIMEOUT_SECONDS", 25.0)
+
+        self.RECONCILE_MIN_AGE_SECONDS = self._get_int("RECONCILE_MIN_AGE_SECONDS", 600)
+        self.RECONCILE_LOOKBACK_DAYS = self._get_int("RECONCILE_LOOKBACK_DAYS", 0)
+        self.RECONCILE_CONCURRENCY = self._get_int("RECONCILE_CONCURRENCY", 8)
+
+        self.FUNCTION_PERSISTENT_LOOP = self._get_bool("FUNCTION_PERSISTENT_LOOP", True)
+        self.FUNCTION_LOOP_PING_TIMEOUT_SECONDS = self._get_float("FUNCTION_LOOP_PING_TIMEOUT_SECONDS", 2.0)
+
+        # Разбор PREPROCESS_MAX_SIDE_BY_MODE: "upscale=1024,restoration=2048"
+        self.PREPROCESS_MAX_SIDE_BY_MODE = {}
+        for item in os.getenv("PREPROCESS_MAX_SIDE_BY_MODE", "upscale=1024").split(","):
+            mode, sep, value = item.partition("=")
+            if sep and mode.strip():
+                try:
+                    self.PREPROCESS_MAX_SIDE_BY_MODE[mode.strip()] = int(value)
+                except ValueError:
+                    logger.warning(f"PREPROCESS_MAX_SIDE_BY_MODE: некорректное значение {item!r}, пропущено")
 
         # Разбор ALLOWED_IMAGE_MIME
         mime_str = os.getenv("ALLOWED_IMAGE_MIME", "image/jpeg,image/png")
@@ -100,6 +262,17 @@ class Config:
             logger.warning(f"Не удалось преобразовать {key}={value} в int, используется дефолт {default}")
             return default
 
+    def _get_float(self, key: str, default: float) -> float:
+        """Получить вещественную переменную окружения."""
+        value = os.getenv(key)
+        if value is None:
+            return default
+        try:
+            return float(value)
+        except ValueError:
+            logger.warning(f"Не удалось преобразовать {key}={value} в float, используется дефолт {default}")
+            return default
+
 
 # Глобальный экземпляр конфигурации
 config = Config()
@@ -0,0 +1,403 @@
+"""
+Альбомы Telegram (media group): одна партия на media_group_id.
+
+Telegram присылает альбом из N фото N отдельными Update с общим media_group_id.
+Вместо N подтверждений и N сообщений с результатом:
+
+1. Update альбома в процессе копятся ALBUM_BUFFER_SECONDS, затем партия
+   обрабатывается целиком: одно чтение режима пользователя, параллельные
+   prediction в Replicate, одно подтверждение.
+2. Экземпляры Cloud Function (каждый видит свою часть альбома) сводятся через S3,
+   albums/{chat_id}/{media_group_id}/:
+   - started.json — время начала альбома (условная запись: первая партия);
+   - members/{message_id} — фото, принятые в обработку;
+   - confirmed — условная запись: подтверждение «принял» отправляет один экземпляр;
+   - results/{message_id}.json — итог по фото (из вебхука Replicate или кэша);
+   - delivered.json — условная запись: альбом отправляет ровно один экземпляр.
+3. Когда у всех участников есть итог (и прошло ALBUM_SEAL_SECONDS с начала альбома),
+   результаты уходят одним sendMediaGroup. Фото, принятое после отправки альбома,
+   доставляется отдельно.
+
+Записи под albums/ удаляет lifecycle-правило бакета (см. spec/04-s3-data.md).
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.config import config
+from src.domain import logic
+from src.domain.models import BotMode
+from src.services import result_cache, s3_async, telegram_api, transcode
+from src.utils import codec
+from src.utils.http import download_url
+
+logger = logging.getLogger(__name__)
+
+ALBUMS_PREFIX = "albums"
+
+# Партии, которые копятся в этом процессе: (chat_id, media_group_id) -> (loop, updates)
+_buffers: Dict[Tuple[int, str], Tuple[asyncio.AbstractEventLoop, List[Dict[str, Any]]]] = {}
+
+
+def _album_prefix(chat_id: int, media_group_id: str) -> str:
+    return f"{ALBUMS_PREFIX}/{chat_id}/{media_group_id}/"
+
+
+async def handle_album_update(update_data: Dict[str, Any], buffer_seconds: Optional[float] = None) -> None:
+    """
+    Принять Update с фото из альбома. Первый Update альбома ждет
+    buffer_seconds (None — ALBUM_BUFFER_SECONDS) и обрабатывает всю накопленную
+    партию; остальные добавляются в нее и возвращаются сразу.
+    """
+    message = update_data.get("message", {})
+    key = (message.get("chat", {}).get("id"), str(message.get("media_group_id")))
+    loop = asyncio.get_running_loop()
+
+    buffered = _buffers.get(key)
+    if buffered is not None and buffered[0] is loop:
+        buffered[1].append(update_data)
+        return
+
+    updates = [update_data]
+    _buffers[key] = (loop, updates)
+    try:
+        if buffer_seconds is None:
+            buffer_seconds = config.ALBUM_BUFFER_SECONDS
+        if buffer_seconds > 0:
+            await asyncio.sleep(buffer_seconds)
+    finally:
+        if _buffers.get(key, (None, None))[1] is updates:
+            del _buffers[key]
+    await process_album(updates)
+
+
+async def process_album(updates: List[Dict[str, Any]]) -> None:
+    """Обработать партию Update одного альбома."""
+    first = updates[0].get("message", {})
+    chat_id = first.get("chat", {}).get("id")
+    user_id = first.get("from", {}).get("id")
+    media_group_id = str(first.get("media_group_id"))
+    if not chat_id or not user_id:
+        logger.error("Не удалось извлечь chat_id или user_id из сообщения альбома")
+        return
+
+    try:
+        user_mode = logic.resolve_mode(await s3_async.load_user_state(chat_id))
+        if user_mode == BotMode.SHTENDER.value:
+            # Штендер строится по каждому фото без Replicate — как отдельные фото
+            for update in updates:
+                if "document" in update.get("message", {}):
+                    await logic.process_telegram_document(update)
+                else:
+                    await logic.process_telegram_photo(update)
+            return
+        try:
+            mode = BotMode(user_mode)
+        except ValueError:
+            mode = BotMode.RESTORATION
+
+        items = []
+        for update in updates:
+            message = update.get("message", {})
+            image = logic.image_from_message(message)
+            if image is None:
+                logger.info(f"Элемент альбома {media_group_id} без изображения пропущен (chat {chat_id})")
+                continue
+            items.append((message.get("message_id"), image))
+        if not items:
+            return
+        logger.info(f"Альбом {media_group_id} (chat {chat_id}): {len(items)} фото в партии")
+
+        prefix = _album_prefix(chat_id, media_group_id)
+        # Начало альбома (для ALBUM_SEAL_SECONDS) фиксирует первая партия
+        await s3_async.put_object_if_absent(
+            bucket=config.S3_BUCKET,
+            key=f"{prefix}started.json",
+            data=codec.dumps({"chat_id": chat_id, "media_group_id": media_group_id, "started_at": datetime.utcnow()}),
+            content_type="application/json; charset=utf-8",
+        )
+        # Участники регистрируются до prediction: альбом не считается готовым,
+        # пока загружается хотя бы одно его фото
+        await asyncio.gather(*(
+            s3_async.upload_to_s3(config.S3_BUCKET, f"{prefix}members/{message_id}", b"")
+            for message_id, _ in items
+        ))
+
+        outcomes = await asyncio.gather(
+            *(
+                logic.submit_image(
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    message_id=message_id,
+                    mode=mode,
+                    media_group_id=media_group_id,
+                    notify_queue=False,
+                    **image,
+                )
+                for message_id, image in items
+            ),
+            return_exceptions=True,
+        )
+
+        submitted = 0
+        recorded = []
+        for (message_id, _), outcome in zip(items, outcomes):
+            if isinstance(outcome, BaseException):
+                # Ошибка войдет в итог альбома («не удалось обработать N из M»)
+                logger.error(f"Ошибка при обработке фото альбома {media_group_id}: {outcome}", exc_info=outcome)
+                result = {"status": "failed"}
+            elif outcome is None:
+                # Фото отклонено, пользователь получил сообщение — в альбоме его не будет
+                result = {"status": "rejected"}
+            elif outcome["status"] == "cached":
+                cached = outcome["cached"]
+                result = {
+                    "status": "succeeded",
+                    "cache_key": cached["key"],
+                    "output_sha256": cached.get("output_sha256"),
+                    "content_type": cached.get("content_type", "image/jpeg"),
+                    "filename": cached.get("filename", "photo.jpg"),
+                }
+            else:
+                submitted += 1
+                continue
+            await record_result(chat_id, media_group_id, message_id, result)
+            recorded.append(message_id)
+
+        # Подтверждение — одно на альбом: его отправляет первая партия, создавшая задачи
+        if submitted and await s3_async.put_object_if_absent(
+            bucket=config.S3_BUCKET,
+            key=f"{prefix}confirmed",
+            data=b"",
+        ):
+            await telegram_api.send_message(
+                chat_id,
+                "✅ Принял альбом. Обрабатываю фото, результаты пришлю одним сообщением..."
+            )
+
+        # Итоги без Replicate (кэш, отказы, ошибки) уже записаны — возможно, альбом готов
+        if recorded:
+            await try_deliver(chat_id, media_group_id, recorded)
+
+    except Exception as e:
+        logger.error(f"Ошибка при обработке альбома {media_group_id}: {e}", exc_info=True)
+        try:
+            await telegram_api.send_message(chat_id, "❌ Произошла ошибка при обработке фото. Попробуйте еще раз.")
+        except Exception:
+            pass
+
+
+async def record_result(chat_id: int, media_group_id: str, message_id: Any, result: Dict[str, Any]) -> None:
+    """Записать итог по фото альбома (results/{message_id}.json)."""
+    result = dict(result, message_id=message_id)
+    await s3_async.upload_to_s3(
+        bucket=config.S3_BUCKET,
+        key=f"{_album_prefix(chat_id, media_group_id)}results/{message_id}.json",
+        data=codec.dumps(result),
+        content_type="application/json; charset=utf-8",
+    )
+
+
+async def complete_member(chat_id: int, media_group_id: str, message_id: Any, result: Dict[str, Any]) -> None:
+    """
+    Итог по фото альбома из вебхука Replicate: записать и, если альбом готов,
+    отправить его. Ошибки логируются — вебхук не должен падать из-за альбома.
+    """
+    try:
+        await record_result(chat_id, media_group_id, message_id, result)
+        await try_deliver(chat_id, media_group_id, [message_id])
+    except Exception as e:
+        logger.error(f"Ошибка при завершении фото альбома {media_group_id}: {e}", exc_info=True)
+
+
+async def _album_state(prefix: str) -> Tuple[List[str], List[str], bool]:
+    """(участники, участники с итогом, альбом уже отправлен) по LIST префикса альбома."""
+    keys = await s3_async.list_keys(config.S3_BUCKET, prefix)
+    members = [k[len(prefix) + len("members/"):] for k in keys if k.startswith(f"{prefix}members/")]
+    results = [
+        k[len(prefix) + len("results/"):-len(".json")]
+        for k in keys
+        if k.startswith(f"{prefix}results/") and k.endswith(".json")
+    ]
+    return members, results, f"{prefix}delivered.json" in keys
+
+
+async def try_deliver(chat_id: int, media_group_id: str, message_ids: Sequence[Any] = ()) -> bool:
+    """
+    Отправить альбом, если у всех участников есть итог. Из нескольких вызовов
+    отправляет ровно один (условная запись delivered.json).
+
+    Args:
+        message_ids: Фото, итоги которых только что записаны: если альбом уже ушел
+            без них, они отправляются отдельно
+
+    Returns:
+        True, если этот вызов что-то отправил
+    """
+    prefix = _album_prefix(chat_id, media_group_id)
+    members, results, delivered = await _album_state(prefix)
+    if delivered:
+        return await _deliver_late(chat_id, media_group_id, message_ids)
+    if set(members) - set(results):
+        return False
+
+    # Участники одного альбома приходят почти одновременно: ждем, пока состав устоится
+    try:
+        started = codec.loads(await s3_async.download_from_s3(config.S3_BUCKET, f"{prefix}started.json"))
+        started_at = datetime.fromisoformat(started["started_at"].replace("Z", ""))
+        remaining = config.ALBUM_SEAL_SECONDS - (datetime.utcnow() - started_at).total_seconds()
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать начало альбома {media_group_id}: {e}")
+        remaining = config.ALBUM_SEAL_SECONDS
+    if remaining > 0:
+        await asyncio.sleep(remaining)
+        members, results, delivered = await _album_state(prefix)
+        if delivered:
+            return await _deliver_late(chat_id, media_group_id, message_ids)
+        if set(members) - set(results):
+            return False
+
+    claimed = await s3_async.put_object_if_absent(
+        bucket=config.S3_BUCKET,
+        key=f"{prefix}delivered.json",
+        data=codec.dumps({"message_ids": sorted(results), "delivered_at": datetime.utcnow()}),
+        content_type="application/json; charset=utf-8",
+    )
+    if not claimed:
+        return await _deliver_late(chat_id, media_group_id, message_ids)
+
+    records = await asyncio.gather(*(
+        s3_async.download_from_s3(config.S3_BUCKET, f"{prefix}results/{mid}.json") for mid in results
+    ))
+    await deliver_album(chat_id, [codec.loads(r) for r in records])
+    return True
+
+
+async def _deliver_late(chat_id: int, media_group_id: str, message_ids: Sequence[Any]) -> bool:
+    """Альбом уже отправлен: фото из message_ids, не попавшие в него, отправить отдельно."""
+    if not message_ids:
+        return False
+    prefix = _album_prefix(chat_id, media_group_id)
+    delivered = codec.loads(await s3_async.download_from_s3(config.S3_BUCKET, f"{prefix}delivered.json"))
+    late = [mid for mid in message_ids if str(mid) not in delivered.get("message_ids", [])]
+    if not late:
+        return False
+    records = await asyncio.gather(*(
+        s3_async.download_from_s3(config.S3_BUCKET, f"{prefix}results/{mid}.json") for mid in late
+    ))
+    logger.info(f"Фото {late} пришли после отправки альбома {media_group_id} — отправляются отдельно")
+    await deliver_album(chat_id, [codec.loads(r) for r in records])
+    return True
+
+
+async def _load_output(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Байты результата: из кэша результатов, иначе по URL Replicate."""
+    if record.get("cache_key"):
+        try:
+            data = await result_cache.load_output({"key": record["cache_key"]})
+            return {"data": data, "content_type": record["content_type"], "filename": record["filename"]}
+        except Exception as e:
+            if not record.get("output_url"):
+                raise
+            logger.warning(f"Результат из кэша недоступен ({record['cache_key']}), скачивание по URL: {e}")
+    data, content_type = await download_url(record["output_url"])
+    return {"data": data, "content_type": content_type, "filename": record.get("filename", "photo.jpg")}
+
+
+async def deliver_album(chat_id: int, records: List[Dict[str, Any]]) -> None:
+    """Отправить итоги альбома: результаты одним sendMediaGroup, штендеры — вторым."""
+    records = sorted(records, key=lambda r: int(r.get("message_id") or 0))
+    succeeded = [r for r in records if r.get("status") == "succeeded"]
+    failed = sum(1 for r in records if r.get("status") == "failed")
+
+    if len(succeeded) == 1:
+        # Одно фото — обычная доставка: по file_id, если результат уже отправлялся
+        record = succeeded[0]
+
+        async def load_data() -> bytes:
+            return (await _load_output(record))["data"]
+
+        try:
+            await logic._deliver_result(
+                chat_id,
+                None,
+                record.get("content_type", "image/jpeg"),
+                record.get("filename", "photo.jpg"),
+                output_sha256=record.get("output_sha256"),
+                load_data=load_data,
+            )
+        except Exception as e:
+            logger.error(f"Не удалось отправить результат фото {record.get('message_id')}: {e}")
+            failed += 1
+        succeeded = []
+
+    outputs = await asyncio.gather(*(_load_output(r) for r in succeeded), return_exceptions=True)
+    items = []
+    for record, output in zip(succeeded, outputs):
+        if isinstance(output, BaseException):
+            logger.error(f"Не удалось загрузить результат фото {record.get('message_id')}: {output}")
+            failed += 1
+        else:
+            items.append(output)
+
+    if len(items) == 1:
+        await logic._deliver_result(chat_id, items[0]["data"], items[0]["content_type"], items[0]["filename"])
+    elif items:
+        started = time.perf_counter()
+        # Перекодировать заранее: иначе один неподходящий файл отправляет весь альбом документами
+        photos = []
+        for item, (data, content_type, info) in zip(
+            items,
+            await asyncio.gather(*(transcode.for_telegram(i["data"], i["content_type"]) for i in items)),
+        ):
+            filename = f"{os.path.splitext(item['filename'])[0]}.jpg" if info["transcoded"] else item["filename"]
+            photos.append({"data": data, "content_type": content_type, "filename": filename})
+        await telegram_api.send_media_group_bytes(chat_id, photos, caption="✅ Обработка завершена!")
+        logger.info(
+            f"Альбом из {len(items)} результатов отправлен пользователю {chat_id} "
+            f"за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
+        await _deliver_shtenders(chat_id, items)
+
+    if failed:
+        await telegram_api.send_message(
+            chat_id,
+            f"❌ Не удалось обработать фото: {failed} из {len(records)}. Попробуйте отправить их еще раз."
+        )
+
+
+async def _deliver_shtenders(chat_id: int, items: List[Dict[str, Any]]) -> None:
+    """Штендеры (PDF) по результатам альбома — одним альбомом документов."""
+    try:
+        from src.services.shtender import FaceNotFoundError
+    except ImportError:
+        return
+
+    pdfs = []
+    no_face = 0
+    for item in items:
+        try:
+            pdf_bytes = await logic.build_shtender(item["data"], item["filename"])
+        except FaceNotFoundError:
+            no_face += 1
+            continue
+        except Exception as e:
+            logger.warning("Не удалось сгенерировать штендер: %s", e, exc_info=True)
+            continue
+        if pdf_bytes is None:
+            # Штендер здесь не собирается (нет шаблона) — остальные фото тоже;
+            # уже собранные PDF и сообщение о фото без лица все равно отправляются
+            break
+        pdfs.append({"data": pdf_bytes, "filename": f"shtender_{len(pdfs) + 1}.pdf", "content_type": "application/pdf"})
+
+    if pdfs:
+        await telegram_api.send_media_group_bytes(chat_id, pdfs, caption="Штендер", media_type="document")
+        logger.info("Штендеры (PDF, %d шт.) отправлены пользователю %s", len(pdfs), chat_id)
+    if no_face:
+        await telegram_api.send_message(
+            chat_id,
+            f"На {no_face} фото не обнаружено лицо — штендер для них не сформирован.",
+        )
@@ -0,0 +1,92 @@
+"""
+История задач по индексам S3 (index/chats/, index/days/): команда /history и
+запросы администратора без обхода tasks/.
+
+Поля истории (статус, режим, время создания) — в ключах маркеров
+index/chats/{chat_id}/: история чата — один LIST, без чтения объектов.
+"""
+import asyncio
+import logging
+from datetime import date
+from typing import Iterable, List, Optional
+
+from src.config import config
+from src.domain.models import BotMode, TaskStatus
+from src.services import s3_async
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = (TaskStatus.QUEUED.value, TaskStatus.PROCESSING.value)
+
+_STATUS_LABELS = {
+    TaskStatus.QUEUED.value: "⏳ в очереди",
+    TaskStatus.PROCESSING.value: "⚙️ обрабатывается",
+    TaskStatus.SUCCEEDED.value: "✅ готово",
+    TaskStatus.FAILED.value: "❌ ошибка",
+    TaskStatus.CANCELED.value: "🚫 отменено",
+}
+
+_MODE_LABELS = {
+    BotMode.RESTORATION.value: "Детализация",
+    BotMode.PROCESS_PHOTO.value: "Детализация",
+    BotMode.SHTENDER.value: "Штендер",
+    BotMode.UPSCALE.value: "Увеличение",
+    BotMode.FRAME_VETERAN.value: "Рамка",
+    BotMode.FRAME.value: "Рамка",
+}
+
+
+async def get_chat_history(
+    chat_id: int,
+    limit: int = 10,
+    statuses: Optional[Iterable[str]] = None,
+) -> List[dict]:
+    """
+    Последние задачи чата из индекса: один LIST index/chats/{chat_id}/.
+
+    Args:
+        chat_id: ID чата Telegram
+        limit: Сколько задач вернуть (новые первыми)
+        statuses: Оставить только задачи с этими статусами (просматриваются
+            последние TASK_INDEX_MAX_ENTRIES задач чата)
+
+    Returns:
+        Записи индекса: {"id", "status", "mode", "created_at"}; задача в обработке
+        остается queued до итогового статуса
+    """
+    tasks = await s3_async.list_chat_index(
+        chat_id, limit=limit if statuses is None else max(limit, config.TASK_INDEX_MAX_ENTRIES)
+    )
+    if statuses is not None:
+        allowed = set(statuses)
+        tasks = [t for t in tasks if t.get("status") in allowed]
+    return tasks[:limit]
+
+
+async def get_pending_tasks(chat_id: int, limit: int = 50) -> List[dict]:
+    """Незавершенные задачи чата (queued / processing) из индекса."""
+    return await get_chat_history(chat_id, limit=limit, statuses=PENDING_STATUSES)
+
+
+async def load_task_states(entries: List[dict]) -> List[dict]:
+    """Полные состояния задач для записей индекса (параллельно, без обхода бакета)."""
+    states = await asyncio.gather(*(s3_async.load_task_state(e["id"]) for e in entries))
+    return [s for s in states if s]
+
+
+async def get_day_tasks(day: date) -> List[str]:
+    """prediction_id задач, созданных в указанный день (UTC)."""
+    return await s3_async.list_day_tasks(day)
+
+
+def format_history(tasks: List[dict]) -> str:
+    """Текст ответа на /history."""
+    if not tasks:
+        return "История пуста: вы еще не отправляли фото на обработку."
+    lines = [f"Последние задачи ({len(tasks)}):"]
+    for task in tasks:
+        created = (task.get("created_at") or "")[:16].replace("T", " ")
+        mode = _MODE_LABELS.get(task.get("mode"), task.get("mode") or "—")
+        status = _STATUS_LABELS.get(task.get("status"), task.get("status") or "—")
+        lines.append(f"• {created} UTC — {mode}: {status}")
+    return "\n".join(lines)
@@ -2,23 +2,284 @@
 Бизнес-логика обработки фото и вебхуков.
 """
 import asyncio
+import hashlib
 import os
 import uuid
 import tempfile
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import AsyncIterable, Awaitable, Callable, Dict, Any, Optional
 import mimetypes
 
 import httpx
 
 from src.config import config
 from src.domain.models import TaskState, TaskStatus, BotMode
-from src.services import s3_storage, telegram_api, replicate_api
+from src.services import (
+    admission, file_id_cache, preprocess, s3_async, telegram_api, replicate_api, result_cache, transcode,
+)
+from src.utils.http import download_url
 from src.utils.images import get_largest_photo, validate_image_mime, validate_image_size
 
 logger = logging.getLogger(__name__)
 
+# Ответы POST /predictions, после которых prediction точно не создан: задача
+# возвращается в очередь допуска (остальные 5xx — итоговая ошибка)
+PREDICTION_RETRY_STATUSES = (429, 503)
+
+
+def get_shtender_renderer():
+    """
+    Общий ShtenderRenderer: шаблон, детектор и параметры детекции лица из конфига.
+    Требует opencv (ImportError, если его нет — как в облачной сборке).
+
+    Выбранный детектор не подменяется молча: если SHTENDER_FACE_DETECTOR=yunet,
+    а модели нет (python -m scripts.fetch_yunet), ошибка поднимается — при
+    запуске приложения (прогрев) и при каждом штендере.
+    """
+    from src.services.shtender import get_renderer, FaceDetectionParams
+
+    detection = FaceDetectionParams(
+        scale_factor=config.SHTENDER_DETECT_SCALE_FACTOR,
+        min_neighbors=config.SHTENDER_DETECT_MIN_NEIGHBORS,
+        min_size=config.SHTENDER_DETECT_MIN_SIZE,
+        coarse_max_side=config.SHTENDER_DETECT_MAX_SIDE,
+    )
+    return get_renderer(
+        config.SHTENDER_TEMPLATE_PATH,
+        detection,
+        backend=config.SHTENDER_FACE_DETECTOR,
+        yunet_model_path=config.SHTENDER_YUNET_MODEL_PATH,
+        pdf_writer=config.SHTENDER_PDF_WRITER,
+    )
+
+
+def render_shtender(photo_source: str) -> bytes:
+    """Собрать PDF-штендер (синхронно — вызывать через asyncio.to_thread)."""
+    return get_shtender_renderer().render(photo_source)
+
+
+async def build_shtender(image_data: bytes, filename: str = "photo.jpg") -> Optional[bytes]:
+    """
+    Собрать PDF-штендер по готовому результату.
+
+    Returns:
+        Байты PDF или None, если штендер здесь не собирается (нет opencv / шаблона)
+
+    Raises:
+        FaceNotFoundError: На фото не найдено лицо
+    """
+    # В облаке opencv не ставим — штендер не генерируется
+    try:
+        import src.services.shtender  # noqa: F401
+    except ImportError:
+        logger.debug("Шаблон штендера не генерируется в облаке (нет opencv)")
+        return None
+    template_path = config.SHTENDER_TEMPLATE_PATH
+    if not os.path.isfile(template_path):
+        logger.debug("Шаблон штендера не найден: %s", template_path)
+        return None
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(filename)[1] or ".jpg", delete=False) as tmp:
+        tmp.write(image_data)
+        tmp_path = tmp.name
+    try:
+        return await asyncio.to_thread(render_shtender, tmp_path)
+    finally:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+async def _deliver_result(
+    chat_id: int,
+    image_data: Optional[bytes],
+    content_type: str,
+    filename: str = "photo.jpg",
+    output_sha256: Optional[str] = None,
+    load_data: Optional[Callable[[], Awaitable[bytes]]] = None,
+) -> Dict[str, str]:
+    """
+    Отправить пользователю готовый результат обработки и, если доступен, штендер (PDF)
+    по нему. Общий путь для вебхука Replicate и попадания в кэш результатов.
+
+    Результат и штендер, уже отправленные раньше, уходят по file_id Telegram
+    (src/services/file_id_cache.py); байты результата нужны только при промахе —
+    image_data или load_data() (например, чтение из кэша результатов).
+    Результат, который sendPhoto не примет как есть, перекодируется в JPEG
+    (src/services/transcode.py); оригинал — документом по кнопке под фото.
+
+    Returns:
+        file_id отправленных файлов: {"file_id": ..., "shtender_file_id": ...}
+    """
+    async def get_data() -> bytes:
+        nonlocal image_data
+        if image_data is None:
+            image_data = await load_data()
+        return image_data
+
+    if output_sha256 is None:
+        output_sha256 = file_id_cache.content_sha256(await get_data())
+    delivered: Dict[str, str] = {}
+
+    caption = "✅ Обработка завершена!"
+    file_id = await file_id_cache.send(chat_id, output_sha256, file_id_cache.RESULT, caption)
+    if file_id is None:
+        photo, photo_type, transcoded = await transcode.for_telegram(await get_data(), content_type)
+        reply_markup = None
+        if transcoded["transcoded"]:
+            filename = f"{os.path.splitext(filename)[0]}.jpg"
+            if config.OUTPUT_ORIGINAL_BUTTON:
+                try:
+                    token = await transcode.store_original(await get_data(), content_type, output_sha256)
+                    reply_markup = transcode.original_keyboard(token)
+                except Exception as e:
+                    logger.warning(f"Не удалось сохранить оригинал результата, фото без кнопки: {e}")
+        response = await telegram_api.send_photo_bytes(
+            chat_id=chat_id,
+            photo=photo,
+            filename=filename,
+            caption=caption,
+            content_type=photo_type,
+            reply_markup=reply_markup,
+        )
+        file_id = await file_id_cache.remember(output_sha256, file_id_cache.RESULT, response, reply_markup)
+    if file_id:
+        delivered["file_id"] = file_id
+    logger.info(f"Результат отправлен пользователю {chat_id}")
+
+    # Сгенерировать штендер (PDF), если доступен (в облаке opencv не ставим — пропускаем)
+    try:
+        from src.services.shtender import FaceNotFoundError
+    except ImportError:
+        logger.debug("Шаблон штендера не генерируется в облаке (нет opencv)")
+        return delivered
+    if not os.path.isfile(config.SHTENDER_TEMPLATE_PATH):
+        # Не скачивать результат ради штендера, который не соберется
+        logger.debug("Шаблон штендера не найден: %s", config.SHTENDER_TEMPLATE_PATH)
+        return delivered
+    try:
+        shtender_file_id = await file_id_cache.send(chat_id, output_sha256, file_id_cache.SHTENDER, "Штендер")
+        if shtender_file_id is None:
+            pdf_bytes = await build_shtender(await get_data(), filename)
+            if pdf_bytes is None:
+                return delivered
+            response = await telegram_api.send_document_bytes(
+                chat_id=chat_id,
+                document=pdf_bytes,
+                filename="shtender.pdf",
+                caption="Штендер",
+                content_type="application/pdf",
+            )
+            shtender_file_id = await file_id_cache.remember(output_sha256, file_id_cache.SHTENDER, response)
+        if shtender_file_id:
+            delivered["shtender_file_id"] = shtender_file_id
+        logger.info("Штендер (PDF) отправлен пользователю %s", chat_id)
+    except FaceNotFoundError:
+        await telegram_api.send_message(
+            chat_id,
+            "На фото не обнаружено лицо. Отправьте фото, где чётко видно лицо — тогда можно будет сформировать штендер.",
+        )
+        logger.info("Штендер не создан: лицо не найдено для %s", chat_id)
+    except Exception as shtender_err:
+        logger.warning(
+            "Не удалось сгенерировать штендер: %s",
+            shtender_err,
+            exc_info=True,
+        )
+    return delivered
+
+
+async def send_original(chat_id: int, token: str) -> None:
+    """Отправить оригинал перекодированного результата документом (кнопка под фото)."""
+    original = await transcode.load_original(token)
+    if original is None:
+        await telegram_api.send_message(
+            chat_id, "Оригинал больше недоступен. Отправьте фото еще раз, чтобы обработать его заново."
+        )
+        return
+    data, content_type, filename = original
+    await telegram_api.send_document_bytes(
+        chat_id=chat_id,
+        document=data,
+        filename=filename,
+        caption="Оригинал",
+        content_type=content_type,
+    )
+    logger.info(f"Оригинал результата ({len(data) / 1024:.0f} КБ) отправлен пользователю {chat_id}")
+
+
+async def _discard_input(s3_key: str) -> None:
+    """Удалить загруженный вход, для которого prediction не создан (ошибка не пробрасывается)."""
+    try:
+        await s3_async.delete_object(bucket=config.S3_BUCKET, key=s3_key)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить вход {s3_key}: {e}")
+
+
+async def _read_limited(chunks: AsyncIterable[bytes], max_bytes: int) -> bytes:
+    """Собрать поток в память; больше max_bytes — UploadTooLargeError."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise s3_async.UploadTooLargeError(f"Размер файла превысил лимит {max_bytes} байт")
+    return bytes(buffer)
+
+
+def resolve_mode(user_state: Optional[Dict[str, Any]]) -> str:
+    """Режим обработки из состояния пользователя (users/{chat_id}.json) или конфиг по умолчанию."""
+    return (user_state or {}).get("mode", config.DEFAULT_MODE)
+
+
+def image_from_message(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Описание изображения из сообщения: самое большое фото или документ-изображение.
+
+    Returns:
+        {"file_id", "file_size", "file_name", "mime_type", "width", "height"} или None,
+        если изображения нет (размеры известны только для фото)
+    """
+    photos = message.get("photo")
+    if photos:
+        largest_photo = get_largest_photo(photos)
+        return {
+            "file_id": largest_photo.get("file_id"),
+            "file_size": largest_photo.get("file_size", 0),
+            "file_name": None,
+            "mime_type": None,
+            "width": largest_photo.get("width"),
+            "height": largest_photo.get("height"),
+        }
+    document = message.get("document")
+    if document and _is_image_document(document):
+        return {
+            "file_id": document.get("file_id"),
+            "file_size": document.get("file_size", 0),
+            "file_name": document.get("file_name", ""),
+            "mime_type": document.get("mime_type", ""),
+            "width": None,
+            "height": None,
+        }
+    return None
+
+
+def _is_image_document(document: Dict[str, Any]) -> bool:
+    """Документ — изображение (по MIME-типу или расширению имени файла)."""
+    doc_mime_type = document.get("mime_type", "")
+    doc_file_name = document.get("file_name", "")
+
+    # Список разрешенных MIME-типов изображений
+    image_mime_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp', 'image/bmp']
+    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
+
+    if doc_mime_type and doc_mime_type.lower() in image_mime_types:
+        return True
+    if doc_file_name:
+        file_ext = doc_file_name.lower()
+        return any(file_ext.endswith(ext) for ext in image_extensions)
+    return False
+
 
 async def process_telegram_image(
     update_data: Dict[str, Any],
@@ -30,7 +291,7 @@ async def process_telegram_image(
     """
     Обработать изображение от пользователя: скачать, загрузить в S3, отправить в Replicate.
     Универсальная функция для обработки как фото, так и документов-изображений.
-    
+
     Args:
         update_data: Данные Update от Telegram API
         file_id: ID файла (если уже известен, например из document)
@@ -43,11 +304,11 @@ async def process_telegram_image(
         chat_id = message.get("chat", {}).get("id")
         user_id = message.get("from", {}).get("id")
         message_id = message.get("message_id")
-        
+
         if not chat_id or not user_id:
             logger.error("Не удалось извлечь chat_id или user_id из сообщения")
             return
-        
+
         # Если file_id не передан, попробовать извлечь из фото
         if not file_id:
             photos = message.get("photo", [])
@@ -58,240 +319,65 @@ async def process_telegram_image(
                     "Пожалуйста, отправьте фото для обработки."
                 )
                 return
-            
+
             largest_photo = get_largest_photo(photos)
             file_id = largest_photo.get("file_id")
             file_size = largest_photo.get("file_size", 0)
-        
+            width, height = largest_photo.get("width"), largest_photo.get("height")
+        else:
+            width = height = None
+
         logger.info(f"Обработка изображения от пользователя {user_id} (chat {chat_id}), file_id: {file_id}")
-        
-        # Скачать файл через Telegram API
-        file_info = await telegram_api.get_file_info(file_id)
-        file_path = file_info.get("file_path")
-        actual_file_size = file_info.get("file_size", file_size)
-        
-        # Проверить размер
-        if not validate_image_size(actual_file_size, config.MAX_IMAGE_MB):
-            await telegram_api.send_message(
-                chat_id,
-                f"Размер файла превышает лимит {config.MAX_IMAGE_MB} MB. Пожалуйста, отправьте файл меньшего размера."
-            )
-            return
-        
-        # Скачать файл
-        file_data = await telegram_api.download_file(file_path)
-        
+
         # Режим из меню (users/{chat_id}.json)
-        user_state = s3_storage.load_user_state(chat_id)
-        user_mode = (user_state or {}).get("mode", config.DEFAULT_MODE)
-        
+        user_mode = resolve_mode(await s3_async.load_user_state(chat_id))
+
         # Режим «Создание штендера»: только детекция лица + PDF, без Replicate
         if user_mode == BotMode.SHTENDER.value:
-            try:
-                from src.services.shtender import build_shtender_pdf, FaceNotFoundError
-            except ImportError:
-                await telegram_api.send_message(
-                    chat_id,
-                    "Режим «Создание штендера» в облачной версии недоступен. Выберите «Детализация» и отправьте фото.",
-                )
-                return
-            template_path = config.SHTENDER_TEMPLATE_PATH
-            if not os.path.isfile(template_path):
-                await telegram_api.send_message(
-                    chat_id,
-                    "Шаблон штендера не найден. Обратитесь к администратору.",
-                )
-                return
-            ext = ".jpg"
-            if file_name and file_name.lower().endswith(".png"):
-                ext = ".png"
-            elif file_path and file_path.lower().endswith(".png"):
-                ext = ".png"
-            try:
-                with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                    tmp.write(file_data)
-                    tmp_path = tmp.name
-                try:
-                    pdf_bytes = await asyncio.to_thread(
-                        build_shtender_pdf,
-                        template_path,
-                        tmp_path,
-                    )
-                    await telegram_api.send_message(chat_id, "✅ Готово! Отправляю штендер...")
-                    await telegram_api.send_document_bytes(
-                        chat_id=chat_id,
-                        document=pdf_bytes,
-                        filename="shtender.pdf",
-                        caption="Штендер",
-                        content_type="application/pdf",
-                    )
-                    logger.info("Штендер (PDF) отправлен пользователю %s (режим shtender)", chat_id)
-                finally:
-                    try:
-                        os.unlink(tmp_path)
-                    except OSError:
-                        pass
-            except FaceNotFoundError:
-                await telegram_api.send_message(
-                    chat_id,
-                    "На фото не обнаружено лицо. Отправьте фото, где чётко видно лицо — тогда можно будет сформировать штендер.",
-                )
-                logger.info("Штендер не создан: лицо не найдено для %s", chat_id)
-            except Exception as shtender_err:
-                logger.warning("Не удалось сгенерировать штендер: %s", shtender_err, exc_info=True)
-                await telegram_api.send_message(
-                    chat_id,
-                    "❌ Не удалось создать штендер. Попробуйте другое фото.",
-                )
-            return
-        
-        # Определить MIME-тип (если не передан)
-        if not mime_type:
-            # Сначала попробовать из file_name (для документов)
-            if file_name:
-                mime_type, _ = mimetypes.guess_type(file_name)
-            
-            # Если не получилось, попробовать из file_path
-            if not mime_type:
-                mime_type, _ = mimetypes.guess_type(file_path or "")
-            
-            # Если все еще не получилось, определить по расширению
-            if not mime_type:
-                if file_path and file_path.lower().endswith(('.jpg', '.jpeg')):
-                    mime_type = "image/jpeg"
-                elif file_path and file_path.lower().endswith('.png'):
-                    mime_type = "image/png"
-                elif file_name:
-                    if file_name.lower().endswith(('.jpg', '.jpeg')):
-                        mime_type = "image/jpeg"
-                    elif file_name.lower().endswith('.png'):
-                        mime_type = "image/png"
-                else:
-                    mime_type = "image/jpeg"  # Дефолт
-        
-        # Проверить MIME-тип
-        if not validate_image_mime(mime_type, config.ALLOWED_IMAGE_MIME):
-            await telegram_api.send_message(
-                chat_id,
-                f"Неподдерживаемый формат изображения. Разрешены: {', '.join(config.ALLOWED_IMAGE_MIME)}"
-            )
+            await _process_shtender_image(chat_id, file_id, file_size, file_name)
             return
-        
-        # Генерировать UUID для имени файла
-        file_uuid = str(uuid.uuid4())
-        now = datetime.utcnow()
-        date_path = f"{now.year}/{now.month:02d}/{now.day:02d}"
-        
-        # Определить расширение из MIME-типа или имени файла
-        if mime_type == "image/jpeg":
-            extension = ".jpg"
-        elif mime_type == "image/png":
-            extension = ".png"
-        elif file_name:
-            # Попробовать извлечь расширение из имени файла
-            if file_name.lower().endswith(('.jpg', '.jpeg')):
-                extension = ".jpg"
-            elif file_name.lower().endswith('.png'):
-                extension = ".png"
-            else:
-                extension = ".jpg"  # Дефолт
-        else:
-            extension = ".jpg"  # Дефолт
-        
-        s3_key = f"images/input/{date_path}/{file_uuid}{extension}"
-        
-        # Загрузить в S3
-        s3_storage.upload_to_s3(
-            bucket=config.S3_BUCKET,
-            key=s3_key,
-            data=file_data,
-            content_type=mime_type
-        )
-        logger.info(f"Фото загружено в S3: {s3_key}")
-        
-        # Генерировать presigned URL
-        presigned_url = s3_storage.generate_presigned_url(
-            bucket=config.S3_BUCKET,
-            key=s3_key,
-            expires_in=config.S3_PRESIGN_EXPIRES_SECONDS
-        )
-        
+
         # Режим обработки — из меню (user_state) или конфиг по умолчанию
         try:
             mode = BotMode(user_mode)
         except ValueError:
             mode = BotMode.RESTORATION
-        
-        # Создать prediction в Mock Replicate
-        webhook_url = f"{config.BASE_URL}/webhook/replicate"
-        
-        try:
-            # В real-режиме Replicate требует version id модели. В mock-режиме параметр игнорируется.
-            prediction_response = await replicate_api.create_prediction(
-                image_url=presigned_url,
-                webhook_url=webhook_url,
-                model=config.REPLICATE_MODEL_VERSION,
-                webhook_events_filter=["completed"]
-            )
-            prediction_id = prediction_response.get("id")
-            
-            if not prediction_id:
-                raise ValueError("Replicate API не вернул prediction_id")
-            
-            logger.info(f"Prediction создан: {prediction_id}")
-        except Exception as e:
-            # Более понятные сообщения для типовых ошибок реального Replicate
-            user_message = "Произошла ошибка при отправке задачи на обработку. Попробуйте позже."
-            if isinstance(e, ValueError):
-                # Например: не задан REPLICATE_API_TOKEN или REPLICATE_MODEL_VERSION
-                user_message = "Сервис обработки не настроен. Сообщите администратору (Replicate config)."
-            elif isinstance(e, httpx.HTTPStatusError):
-                status = e.response.status_code
-                if status in (401, 403):
-                    user_message = "Сервис обработки недоступен из‑за ошибки авторизации. Попробуйте позже."
-                elif status == 429:
-                    user_message = "Слишком много запросов к сервису обработки. Попробуйте чуть позже."
-                elif 500 <= status <= 599:
-                    user_message = "Сервис обработки временно недоступен. Попробуйте позже."
-
-            logger.error(
-                f"Ошибка при создании prediction (chat_id={chat_id}, user_id={user_id}): {e}",
-                exc_info=True
-            )
-            await telegram_api.send_message(
-                chat_id,
-                user_message
-            )
-            return
-        
-        # Сохранить состояние задачи в S3
-        task_state = TaskState(
-            prediction_id=prediction_id,
+
+        outcome = await submit_image(
             chat_id=chat_id,
             user_id=user_id,
+            message_id=message_id,
+            file_id=file_id,
+            file_size=file_size,
+            file_name=file_name,
+            mime_type=mime_type,
             mode=mode,
-            input_s3_key=s3_key,
-            status=TaskStatus.QUEUED,
-            telegram={
-                "file_id": file_id,
-                "message_id": message_id
-            },
-            input={
-                "s3_key": s3_key,
-                "mime": mime_type,
-                "size_bytes": actual_file_size
-            }
+            width=width,
+            height=height,
         )
-        
-        s3_storage.save_task_state(prediction_id, task_state.to_dict())
-        logger.info(f"Состояние задачи сохранено: {prediction_id}")
-        
+        if outcome is None:
+            return
+
+        # То же фото в том же режиме уже обрабатывалось — ответить готовым результатом
+        if outcome["status"] == "cached":
+            cached = outcome["cached"]
+            # Байты результата читаются из кэша, только если file_id еще не известен
+            await _deliver_result(
+                chat_id,
+                None,
+                cached.get("content_type", "image/jpeg"),
+                cached.get("filename", "photo.jpg"),
+                output_sha256=cached.get("output_sha256"),
+                load_data=lambda: result_cache.load_output(cached),
+            )
+            return
+
         # Отправить пользователю подтверждение
         await telegram_api.send_message(
             chat_id,
             "✅ Принял. Обрабатываю изображение, ожидайте результат..."
         )
-        
+
     except Exception as e:
         logger.error(f"Ошибка при обработке фото: {e}", exc_info=True)
         # Попытаться отправить сообщение об ошибке пользователю
@@ -307,6 +393,356 @@ async def process_telegram_image(
             pass
 
 
+async def _process_shtender_image(
+    chat_id: int,
+    file_id: str,
+    file_size: Optional[int],
+    file_name: Optional[str],
+) -> None:
+    """Режим «Создание штендера»: скачать фото, найти лицо, отправить PDF (без Replicate)."""
+    file_info = await telegram_api.get_file_info(file_id)
+    file_path = file_info.get("file_path")
+    actual_file_size = file_info.get("file_size", file_size)
+
+    # Проверить размер
+    if not validate_image_size(actual_file_size, config.MAX_IMAGE_MB):
+        await telegram_api.send_message(
+            chat_id,
+            f"Размер файла превышает лимит {config.MAX_IMAGE_MB} MB. Пожалуйста, отправьте файл меньшего размера."
+        )
+        return
+
+    # Для штендера файл нужен целиком (декодирование на месте)
+    file_data = await telegram_api.download_file(file_path)
+    try:
+        from src.services.shtender import FaceNotFoundError
+    except ImportError:
+        await telegram_api.send_message(
+            chat_id,
+            "Режим «Создание штендера» в облачной версии недоступен. Выберите «Детализация» и отправьте фото.",
+        )
+        return
+    template_path = config.SHTENDER_TEMPLATE_PATH
+    if not os.path.isfile(template_path):
+        await telegram_api.send_message(
+            chat_id,
+            "Шаблон штендера не найден. Обратитесь к администратору.",
+        )
+        return
+    # Штендер по этому фото уже отправлялся — повторить по file_id, без рендера и загрузки
+    source_sha256 = file_id_cache.content_sha256(file_data)
+    announced = False
+    if await file_id_cache.lookup(source_sha256, file_id_cache.SHTENDER):
+        await telegram_api.send_message(chat_id, "✅ Готово! Отправляю штендер...")
+        announced = True
+        if await file_id_cache.send(chat_id, source_sha256, file_id_cache.SHTENDER, "Штендер"):
+            logger.info("Штендер (PDF) отправлен пользователю %s по file_id (режим shtender)", chat_id)
+            return
+    ext = ".jpg"
+    if file_name and file_name.lower().endswith(".png"):
+        ext = ".png"
+    elif file_path and file_path.lower().endswith(".png"):
+        ext = ".png"
+    try:
+        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+            tmp.write(file_data)
+            tmp_path = tmp.name
+        try:
+            pdf_bytes = await asyncio.to_thread(render_shtender, tmp_path)
+            if not announced:
+                await telegram_api.send_message(chat_id, "✅ Готово! Отправляю штендер...")
+            response = await telegram_api.send_document_bytes(
+                chat_id=chat_id,
+                document=pdf_bytes,
+                filename="shtender.pdf",
+                caption="Штендер",
+                content_type="application/pdf",
+            )
+            await file_id_cache.remember(source_sha256, file_id_cache.SHTENDER, response)
+            logger.info("Штендер (PDF) отправлен пользователю %s (режим shtender)", chat_id)
+        finally:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    except FaceNotFoundError:
+        await telegram_api.send_message(
+            chat_id,
+            "На фото не обнаружено лицо. Отправьте фото, где чётко видно лицо — тогда можно будет сформировать штендер.",
+        )
+        logger.info("Штендер не создан: лицо не найдено для %s", chat_id)
+    except Exception as shtender_err:
+        logger.warning("Не удалось сгенерировать штендер: %s", shtender_err, exc_info=True)
+        await telegram_api.send_message(
+            chat_id,
+            "❌ Не удалось создать штендер. Попробуйте другое фото.",
+        )
+
+
+async def submit_image(
+    chat_id: int,
+    user_id: int,
+    message_id: Optional[int],
+    file_id: str,
+    file_size: Optional[int],
+    file_name: Optional[str],
+    mime_type: Optional[str],
+    mode: BotMode,
+    media_group_id: Optional[str] = None,
+    notify_queue: bool = True,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Принять изображение в обработку: проверки, загрузка в S3, кэш результатов,
+    prediction в Replicate и состояние задачи. Подтверждение пользователю не отправляет.
+
+    Args:
+        media_group_id: Альбом Telegram, к которому относится фото (сохраняется в задаче)
+        notify_queue: Сообщить пользователю позицию, если задача ждет слота в Replicate
+        width, height: Размеры фото из сообщения — по ним решается, нужна ли предобработка
+
+    Returns:
+        {"status": "submitted", "prediction_id": ...} — задача создана;
+        {"status": "cached", "cached": meta} — результат есть в кэше (вход удален из S3);
+        None — изображение отклонено, пользователь уже получил сообщение
+    """
+    # Скачать файл через Telegram API
+    file_info = await telegram_api.get_file_info(file_id)
+    file_path = file_info.get("file_path")
+    actual_file_size = file_info.get("file_size", file_size)
+
+    # Проверить размер
+    if not validate_image_size(actual_file_size, config.MAX_IMAGE_MB):
+        await telegram_api.send_message(
+            chat_id,
+            f"Размер файла превышает лимит {config.MAX_IMAGE_MB} MB. Пожалуйста, отправьте файл меньшего размера."
+        )
+        return None
+
+    # Определить MIME-тип (если не передан)
+    if not mime_type:
+        # Сначала попробовать из file_name (для документов)
+        if file_name:
+            mime_type, _ = mimetypes.guess_type(file_name)
+
+        # Если не получилось, попробовать из file_path
+        if not mime_type:
+            mime_type, _ = mimetypes.guess_type(file_path or "")
+
+        # Если все еще не получилось, определить по расширению
+        if not mime_type:
+            if file_path and file_path.lower().endswith(('.jpg', '.jpeg')):
+                mime_type = "image/jpeg"
+            elif file_path and file_path.lower().endswith('.png'):
+                mime_type = "image/png"
+            elif file_name:
+                if file_name.lower().endswith(('.jpg', '.jpeg')):
+                    mime_type = "image/jpeg"
+                elif file_name.lower().endswith('.png'):
+                    mime_type = "image/png"
+            else:
+                mime_type = "image/jpeg"  # Дефолт
+
+    # Проверить MIME-тип
+    if not validate_image_mime(mime_type, config.ALLOWED_IMAGE_MIME):
+        await telegram_api.send_message(
+            chat_id,
+            f"Неподдерживаемый формат изображения. Разрешены: {', '.join(config.ALLOWED_IMAGE_MIME)}"
+        )
+        return None
+
+    # Генерировать UUID для имени файла
+    file_uuid = str(uuid.uuid4())
+    now = datetime.utcnow()
+    date_path = f"{now.year}/{now.month:02d}/{now.day:02d}"
+
+    # Определить расширение из MIME-типа или имени файла
+    if mime_type == "image/jpeg":
+        extension = ".jpg"
+    elif mime_type == "image/png":
+        extension = ".png"
+    elif file_name:
+        # Попробовать извлечь расширение из имени файла
+        if file_name.lower().endswith(('.jpg', '.jpeg')):
+            extension = ".jpg"
+        elif file_name.lower().endswith('.png'):
+            extension = ".png"
+        else:
+            extension = ".jpg"  # Дефолт
+    else:
+        extension = ".jpg"  # Дефолт
+
+    max_bytes = config.MAX_IMAGE_MB * 1024 * 1024
+    preprocess_info: Optional[Dict[str, Any]] = None
+    try:
+        if preprocess.needs_buffering(mime_type, width, height, mode.value):
+            # Фото целиком в памяти (не больше MAX_IMAGE_MB): поворот по EXIF, без
+            # метаданных, с ограничением размера для режима — Replicate получает меньше байтов
+            raw = await _read_limited(telegram_api.iter_file_chunks(file_path), max_bytes)
+            data, preprocess_info = await preprocess.prepare(raw, mode.value)
+            if preprocess_info.get("reencoded"):
+                mime_type, extension = "image/jpeg", ".jpg"
+            s3_key = f"images/input/{date_path}/{file_uuid}{extension}"
+            await s3_async.upload_to_s3(config.S3_BUCKET, s3_key, data, content_type=mime_type)
+            # Ключ кэша результатов — по тому, что уходит в Replicate
+            upload_info = {"size_bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+        else:
+            # Загрузить в S3 потоком: скачивание из Telegram и загрузка идут одновременно,
+            # в памяти не больше пары частей multipart
+            s3_key = f"images/input/{date_path}/{file_uuid}{extension}"
+            upload_info = await s3_async.upload_stream_to_s3(
+                bucket=config.S3_BUCKET,
+                key=s3_key,
+                chunks=telegram_api.iter_file_chunks(file_path),
+                content_type=mime_type,
+                max_bytes=max_bytes,
+            )
+    except s3_async.UploadTooLargeError:
+        await telegram_api.send_message(
+            chat_id,
+            f"Размер файла превышает лимит {config.MAX_IMAGE_MB} MB. Пожалуйста, отправьте файл меньшего размера."
+        )
+        return None
+    actual_file_size = upload_info["size_bytes"]
+    logger.info(f"Фото загружено в S3: {s3_key}")
+
+    cached = await result_cache.lookup(upload_info["sha256"], mode.value)
+    if cached:
+        # Вход для Replicate не понадобился
+        await _discard_input(s3_key)
+        return {"status": "cached", "cached": cached}
+
+    # Создать prediction в Mock Replicate
+    webhook_url = f"{config.BASE_URL}/webhook/replicate"
+
+    async def notify_queued(position: int) -> None:
+        if notify_queue:
+            await telegram_api.send_message(
+                chat_id,
+                f"⏳ Сейчас много заявок. Ваше фото в очереди: {position}-е. Обработка начнется автоматически."
+            )
+
+    attempts = max(0, config.ADMISSION_OVERLOAD_RETRIES) + 1
+    try:
+        # Генерировать presigned URL
+        presigned_url = await s3_async.generate_presigned_url(
+            bucket=config.S3_BUCKET,
+            key=s3_key,
+            expires_in=config.S3_PRESIGN_EXPIRES_SECONDS
+        )
+        for attempt in range(attempts):
+            # Слот в Replicate: лимит одновременных prediction (src/services/admission.py)
+            try:
+                await admission.governor.acquire(on_queued=notify_queued if attempt == 0 else None)
+            except admission.AdmissionRejected as rejected:
+                await _discard_input(s3_key)
+                await telegram_api.send_message(
+                    chat_id,
+                    f"Сейчас очень много заявок (в очереди: {rejected.position - 1}). "
+                    "Пожалуйста, отправьте фото через несколько минут."
+                )
+                return None
+            try:
+                # В real-режиме Replicate требует version id модели. В mock-режиме параметр игнорируется.
+                prediction_response = await replicate_api.create_prediction(
+                    image_url=presigned_url,
+                    webhook_url=webhook_url,
+                    model=config.REPLICATE_MODEL_VERSION,
+                    webhook_events_filter=["completed"]
+                )
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status != 429 and status < 500:
+                    admission.governor.on_failure()
+                    raise
+                # Replicate перегружен: лимит вниз
+                admission.governor.on_overload()
+                if status not in PREDICTION_RETRY_STATUSES or attempt == attempts - 1:
+                    # 500 / 502 / 504 шлюза могут прийти, когда prediction уже создан:
+                    # повтор создал бы платный дубль без состояния задачи
+                    raise
+                logger.warning(f"Replicate вернул {status}, повтор через очередь ({attempt + 1}/{attempts - 1})")
+                continue
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Соединение не установлено — запрос до Replicate не дошел, повтор безопасен
+                admission.governor.on_failure()
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"Replicate недоступен ({e}), повтор через очередь ({attempt + 1}/{attempts - 1})")
+                continue
+            except BaseException:
+                admission.governor.on_failure()
+                raise
+            admission.governor.on_success(prediction_response.get("id"))
+            break
+        prediction_id = prediction_response.get("id")
+
+        if not prediction_id:
+            raise ValueError("Replicate API не вернул prediction_id")
+
+        logger.info(f"Prediction создан: {prediction_id}")
+    except Exception as e:
+        # Более понятные сообщения для типовых ошибок реального Replicate
+        user_message = "Произошла ошибка при отправке задачи на обработку. Попробуйте позже."
+        if isinstance(e, ValueError):
+            # Например: не задан REPLICATE_API_TOKEN или REPLICATE_MODEL_VERSION
+            user_message = "Сервис обработки не настроен. Сообщите администратору (Replicate config)."
+        elif isinstance(e, httpx.HTTPStatusError):
+            status = e.response.status_code
+            if status in (401, 403):
+                user_message = "Сервис обработки недоступен из‑за ошибки авторизации. Попробуйте позже."
+            elif status == 429:
+                user_message = "Слишком много запросов к сервису обработки. Попробуйте чуть позже."
+            elif 500 <= status <= 599:
+                user_message = "Сервис обработки временно недоступен. Попробуйте позже."
+
+        logger.error(
+            f"Ошибка при создании prediction (chat_id={chat_id}, user_id={user_id}): {e}",
+            exc_info=True
+        )
+        # Prediction не создан — вход в S3 больше не нужен
+        await _discard_input(s3_key)
+        await telegram_api.send_message(
+            chat_id,
+            user_message
+        )
+        return None
+
+    telegram_info: Dict[str, Any] = {
+        "file_id": file_id,
+        "message_id": message_id
+    }
+    if media_group_id:
+        telegram_info["media_group_id"] = media_group_id
+
+    # Сохранить состояние задачи в S3
+    task_state = TaskState(
+        prediction_id=prediction_id,
+        chat_id=chat_id,
+        user_id=user_id,
+        mode=mode,
+        input_s3_key=s3_key,
+        status=TaskStatus.QUEUED,
+        telegram=telegram_info,
+        replicate={
+            "version": result_cache.model_tag(),
+            "webhook_events_filter": ["completed"]
+        },
+        input={
+            "s3_key": s3_key,
+            "mime": mime_type,
+            "size_bytes": actual_file_size,
+            "sha256": upload_info["sha256"],
+            "preprocess": preprocess_info,
+        }
+    )
+
+    await s3_async.save_task_state(prediction_id, task_state.to_dict())
+    logger.info(f"Состояние задачи сохранено: {prediction_id}")
+    return {"status": "submitted", "prediction_id": prediction_id}
+
+
 async def process_telegram_photo(update_data: Dict[str, Any]) -> None:
     """
     Обработать фото от пользователя (обертка для обратной совместимости).
@@ -335,18 +771,7 @@ async def process_telegram_document(update_data: Dict[str, Any]) -> None:
         doc_mime_type = document.get("mime_type", "")
         doc_file_name = document.get("file_name", "")
         
-        # Список разрешенных MIME-типов изображений
-        image_mime_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp', 'image/bmp']
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
-        
-        is_image = False
-        if doc_mime_type and doc_mime_type.lower() in image_mime_types:
-            is_image = True
-        elif doc_file_name:
-            file_ext = doc_file_name.lower()
-            is_image = any(file_ext.endswith(ext) for ext in image_extensions)
-        
-        if not is_image:
+        if not _is_image_document(document):
             logger.info(f"Получен документ, но не изображение: {doc_mime_type} от {message.get('chat', {}).get('id')}")
             return
         
@@ -397,7 +822,7 @@ async def process_replicate_webhook(webhook_data: Dict[str, Any]) -> None:
         logger.info(f"Обработка вебхука для prediction {prediction_id}, статус: {status}")
         
         # Загрузить состояние задачи из S3
-        task_dict = s3_storage.load_task_state(prediction_id)
+        task_dict = await s3_async.load_task_state(prediction_id)
         if not task_dict:
             logger.warning(f"Состояние задачи не найдено для prediction {prediction_id}, возможно уже обработано")
             return
@@ -405,28 +830,41 @@ async def process_replicate_webhook(webhook_data: Dict[str, Any]) -> None:
         task_state = TaskState.from_dict(task_dict)
         
         # Проверка идемпотентности: если уже обработано, просто вернуть 200
-        if task_state.status in (TaskStatus.SUCCEEDED, TaskStatus.FAILED):
+        if task_state.status in (TaskStatus.SUCCEEDED, TaskStatus.FAILED, TaskStatus.CANCELED):
             logger.info(f"Задача {prediction_id} уже обработана (статус: {task_state.status}), пропускаем")
             return
         
+        # Итоговый статус: prediction больше не занимает слот в Replicate
+        if status in ("succeeded", "failed", "canceled"):
+            admission.governor.on_complete(prediction_id)
+
         # Обновить статус
         if status == "succeeded":
             task_state.update_status(TaskStatus.SUCCEEDED)
         elif status == "failed":
             task_state.update_status(TaskStatus.FAILED)
+        elif status == "canceled":
+            task_state.update_status(TaskStatus.CANCELED)
         elif status == "processing":
             task_state.update_status(TaskStatus.PROCESSING)
         
+        # Фото из альбома: результат копится в albums/ и уходит пользователю одним альбомом
+        media_group_id = (task_state.telegram or {}).get("media_group_id")
+        album_result: Optional[Dict[str, Any]] = None
+
         # Обработать результат
         if status == "succeeded":
             output = webhook_data.get("output")
             if not output:
                 logger.error(f"Вебхук succeeded, но output отсутствует для {prediction_id}")
                 task_state.error = {"message": "Результат обработки отсутствует"}
-                await telegram_api.send_message(
-                    task_state.chat_id,
-                    "❌ Ошибка: результат обработки не получен."
-                )
+                if media_group_id:
+                    album_result = {"status": "failed"}
+                else:
+                    await telegram_api.send_message(
+                        task_state.chat_id,
+                        "❌ Ошибка: результат обработки не получен."
+                    )
             else:
                 # output может быть строкой (URL) или массивом
                 if isinstance(output, list) and len(output) > 0:
@@ -440,55 +878,44 @@ async def process_replicate_webhook(webhook_data: Dict[str, Any]) -> None:
                     "output_url": output_url
                 }
                 
-                # Отправить фото пользователю
-                await telegram_api.send_photo(
-                    chat_id=task_state.chat_id,
-                    photo=output_url,
-                    caption="✅ Обработка завершена!"
-                )
-                logger.info(f"Результат отправлен пользователю {task_state.chat_id}")
-
-                # Сгенерировать штендер (PDF), если доступен (в облаке opencv не ставим — пропускаем)
-                build_shtender_pdf_fn = None
-                try:
-                    from src.services.shtender import build_shtender_pdf as build_shtender_pdf_fn, FaceNotFoundError
-                except ImportError:
-                    logger.debug("Штендер недоступен (opencv не установлен)")
-                template_path = config.SHTENDER_TEMPLATE_PATH
-                if build_shtender_pdf_fn and os.path.isfile(template_path):
-                    try:
-                        pdf_bytes = await asyncio.to_thread(
-                            build_shtender_pdf_fn,
-                            template_path,
-                            output_url,
-                        )
-                        await telegram_api.send_document_bytes(
-                            chat_id=task_state.chat_id,
-                            document=pdf_bytes,
-                            filename="shtender.pdf",
-                            caption="Штендер",
-                            content_type="application/pdf",
-                        )
-                        logger.info("Штендер (PDF) отправлен пользователю %s", task_state.chat_id)
-                    except FaceNotFoundError:
-                        await telegram_api.send_message(
-                            task_state.chat_id,
-                            "На фото не обнаружено лицо. Отправьте фото, где чётко видно лицо — тогда можно будет сформировать штендер.",
-                        )
-                        logger.info("Штендер не создан: лицо не найдено для %s", task_state.chat_id)
-                    except Exception as shtender_err:
-                        logger.warning(
-                            "Не удалось сгенерировать штендер: %s",
-                            shtender_err,
-                            exc_info=True,
-                        )
-                elif not build_shtender_pdf_fn:
-                    logger.debug("Шаблон штендера не генерируется в облаке (нет opencv)")
-                else:
-                    logger.debug("Шаблон штендера не найден: %s", template_path)
-        
-        elif status == "failed":
-            error_info = webhook_data.get("error", "Неизвестная ошибка")
+                # Скачать результат один раз: для отправки, штендера и кэша результатов
+                output_data, output_content_type = await download_url(output_url)
+                output_filename = telegram_api.photo_filename(output_url)
+                output_sha256 = file_id_cache.content_sha256(output_data)
+                task_state.result["output_sha256"] = output_sha256
+                if not media_group_id:
+                    task_state.result.update(await _deliver_result(
+                        task_state.chat_id, output_data, output_content_type, output_filename, output_sha256
+                    ))
+                
+                sha256 = (task_state.input or {}).get("sha256")
+                if sha256:
+                    cache_key = await result_cache.store(
+                        sha256=sha256,
+                        mode=task_state.mode.value if isinstance(task_state.mode, BotMode) else task_state.mode,
+                        data=output_data,
+                        content_type=output_content_type,
+                        filename=output_filename,
+                        prediction_id=prediction_id,
+                        model=(task_state.replicate or {}).get("version"),
+                        output_sha256=output_sha256,
+                    )
+                    if cache_key:
+                        task_state.result["cache_key"] = cache_key
+                if media_group_id:
+                    album_result = {
+                        "status": "succeeded",
+                        "output_url": output_url,
+                        "cache_key": task_state.result.get("cache_key"),
+                        "output_sha256": output_sha256,
+                        "content_type": output_content_type,
+                        "filename": output_filename,
+                    }
+        
+        elif status in ("failed", "canceled"):
+            error_info = webhook_data.get("error") or (
+                "Prediction отменен" if status == "canceled" else "Неизвестная ошибка"
+            )
             error_message = error_info if isinstance(error_info, str) else error_info.get("message", "Неизвестная ошибка")
             
             task_state.error = {
@@ -496,15 +923,29 @@ async def process_replicate_webhook(webhook_data: Dict[str, Any]) -> None:
             }
             
             # Отправить сообщение об ошибке пользователю (без технических деталей)
-            await telegram_api.send_message(
+            if media_group_id:
+                album_result = {"status": "failed"}
+            else:
+                await telegram_api.send_message(
+                    task_state.chat_id,
+                    "❌ Произошла ошибка при обработке изображения. Попробуйте еще раз."
+                )
+            logger.warning(f"Обработка завершилась ошибкой для {prediction_id}: {error_message}")
+
+        if album_result is not None:
+            # albums импортирует logic — импорт здесь, чтобы не было цикла
+            from src.domain import albums
+
+            await albums.complete_member(
                 task_state.chat_id,
-                "❌ Произошла ошибка при обработке изображения. Попробуйте еще раз."
+                media_group_id,
+                (task_state.telegram or {}).get("message_id"),
+                album_result,
             )
-            logger.warning(f"Обработка завершилась ошибкой для {prediction_id}: {error_message}")
         
         # Обновить состояние в S3
         task_state.updated_at = datetime.utcnow()
-        s3_storage.save_task_state(prediction_id, task_state.to_dict())
+        await s3_async.save_task_state(prediction_id, task_state.to_dict())
         logger.info(f"Состояние задачи обновлено: {prediction_id}, статус: {status}")
         
     except Exception as e:
@@ -59,27 +59,19 @@ class TaskState(BaseModel):
         self.updated_at = datetime.utcnow()
     
     def to_dict(self) -> dict:
-        """Преобразовать в словарь для сохранения в JSON."""
+        """
+        Преобразовать в словарь для сохранения в S3.
+
+        datetime остаются объектами: их сериализует src/utils/codec (ISO 8601 с "Z").
+        """
         # Совместимость с Pydantic v1 и v2
         if hasattr(self, 'model_dump'):
-            data = self.model_dump(exclude_none=True, mode='json')
-        else:
-            data = self.dict(exclude_none=True)
-        
-        # Конвертировать datetime в строки для JSON сериализации
-        if "created_at" in data and isinstance(data["created_at"], datetime):
-            data["created_at"] = data["created_at"].isoformat() + "Z"
-        if "updated_at" in data and isinstance(data["updated_at"], datetime):
-            data["updated_at"] = data["updated_at"].isoformat() + "Z"
-        
-        return data
+            return self.model_dump(exclude_none=True)
+        return self.dict(exclude_none=True)
     
     @classmethod
     def from_dict(cls, data: dict) -> "TaskState":
-        """Создать из словаря (при загрузке из S3)."""
-        # Преобразование строк в datetime
-        if "created_at" in data and isinstance(data["created_at"], str):
-            data["created_at"] = datetime.fromisoformat(data["created_at"].replace("Z", "+00:00"))
-        if "updated_at" in data and isinstance(data["updated_at"], str):
-            data["updated_at"] = datetime.fromisoformat(data["updated_at"].replace("Z", "+00:00"))
-        return cls(**data)
+        """Создать из словаря (при загрузке из S3). Строки ISO 8601 разбирает pydantic."""
+        if hasattr(cls, 'model_validate'):
+            return cls.model_validate(data)
+        return cls.parse_obj(data)
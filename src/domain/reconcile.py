@@ -0,0 +1,163 @@
+"""
+Сверка зависших задач с Replicate: если вебхук потерян (BASE_URL недоступен,
+функция упала по таймауту), задача навсегда остается queued / processing.
+
+Кандидаты — маркеры index/inflight/ старше RECONCILE_MIN_AGE_SECONDS (и, по
+желанию, задачи последних дней из index/days/). Состояние каждой prediction
+запрашивается GET /v1/predictions/{id} с ограниченной параллельностью; итог
+проходит тот же путь, что и вебхук (logic.process_replicate_webhook), поэтому
+пользователь получает результат, а альбом — свое сведение.
+
+Запуск: python -m scripts.reconcile или Cloud Function reconciler.handler по таймеру.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from src.config import config
+from src.domain import logic
+from src.domain.models import TaskStatus
+from src.services import replicate_api, s3_async
+from src.services.s3_storage import INFLIGHT_PREFIX
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = (
+    TaskStatus.SUCCEEDED.value,
+    TaskStatus.FAILED.value,
+    TaskStatus.CANCELED.value,
+)
+
+
+def _parse_time(value) -> Optional[datetime]:
+    """created_at из состояния задачи (строка ISO или datetime) → aware UTC."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+async def find_candidates(min_age_seconds: int, lookback_days: int) -> Dict[str, bool]:
+    """
+    prediction_id кандидатов на сверку.
+
+    Returns:
+        {prediction_id: есть ли маркер index/inflight/}
+    """
+    candidates: Dict[str, bool] = {
+        prediction_id: True
+        for prediction_id in await s3_async.list_inflight_tasks(min_age_seconds=min_age_seconds)
+    }
+    if lookback_days > 0:
+        today = datetime.now(timezone.utc).date()
+        days = [today - timedelta(days=offset) for offset in range(lookback_days + 1)]
+        for ids in await asyncio.gather(*(s3_async.list_day_tasks(day) for day in days)):
+            for prediction_id in ids:
+                candidates.setdefault(prediction_id, False)
+    return candidates
+
+
+async def reconcile_task(
+    prediction_id: str,
+    min_age_seconds: int,
+    has_marker: bool = True,
+    dry_run: bool = False,
+) -> str:
+    """
+    Сверить одну задачу с Replicate.
+
+    Returns:
+        Итог: succeeded / failed / canceled — итог доставлен; running — prediction
+        еще выполняется; done — задача уже завершена; young — моложе порога;
+        orphaned — маркер без задачи; error — сверка не удалась
+    """
+    try:
+        state = await s3_async.load_task_state(prediction_id)
+        if not state:
+            if has_marker and not dry_run:
+                await s3_async.delete_object(config.S3_BUCKET, f"{INFLIGHT_PREFIX}{prediction_id}")
+            return "orphaned"
+        if state.get("status") in TERMINAL_STATUSES:
+            # Маркер мог остаться после сбоя при обновлении индексов
+            if has_marker and not dry_run:
+                await s3_async.delete_object(config.S3_BUCKET, f"{INFLIGHT_PREFIX}{prediction_id}")
+            return "done"
+        created_at = _parse_time(state.get("created_at"))
+        if created_at and datetime.now(timezone.utc) - created_at < timedelta(seconds=min_age_seconds):
+            return "young"
+
+        prediction = await replicate_api.get_prediction(prediction_id)
+        if prediction is None:
+            prediction = {
+                "id": prediction_id,
+                "status": "failed",
+                "error": {"message": "Prediction не найден в Replicate"},
+            }
+        remote_status = prediction.get("status")
+        if remote_status in TERMINAL_STATUSES:
+            logger.warning(f"Вебхук для {prediction_id} не пришел: статус в Replicate {remote_status}, доставляем")
+            if not dry_run:
+                await logic.process_replicate_webhook(prediction)
+            return remote_status
+        if remote_status == "processing" and state.get("status") == TaskStatus.QUEUED.value and not dry_run:
+            await logic.process_replicate_webhook(prediction)
+        return "running"
+    except Exception as e:
+        logger.error(f"Ошибка сверки задачи {prediction_id}: {e}", exc_info=True)
+        return "error"
+
+
+async def reconcile_stuck_tasks(
+    min_age_seconds: Optional[int] = None,
+    lookback_days: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    dry_run: bool = False,
+    prediction_ids: Optional[Iterable[str]] = None,
+) -> Dict[str, int]:
+    """
+    Найти зависшие задачи и доставить итоги prediction, завершившихся без вебхука.
+
+    Args:
+        min_age_seconds: Порог возраста задачи (по умолчанию RECONCILE_MIN_AGE_SECONDS)
+        lookback_days: Дополнительно проверить задачи за столько прошлых дней из
+            index/days/ (по умолчанию RECONCILE_LOOKBACK_DAYS; 0 — только маркеры)
+        concurrency: Одновременных запросов к Replicate (по умолчанию RECONCILE_CONCURRENCY)
+        dry_run: Только показать итоги, ничего не отправлять и не сохранять
+        prediction_ids: Сверить только эти задачи (без поиска кандидатов)
+
+    Returns:
+        Счетчики итогов (см. reconcile_task) и candidates — сколько задач проверено
+    """
+    if min_age_seconds is None:
+        min_age_seconds = config.RECONCILE_MIN_AGE_SECONDS
+    if lookback_days is None:
+        lookback_days = config.RECONCILE_LOOKBACK_DAYS
+    if concurrency is None:
+        concurrency = config.RECONCILE_CONCURRENCY
+
+    if prediction_ids is not None:
+        candidates = {prediction_id: True for prediction_id in prediction_ids}
+    else:
+        candidates = await find_candidates(min_age_seconds, lookback_days)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(prediction_id: str, has_marker: bool) -> str:
+        async with semaphore:
+            return await reconcile_task(prediction_id, min_age_seconds, has_marker, dry_run)
+
+    outcomes = await asyncio.gather(*(run(pid, marker) for pid, marker in candidates.items()))
+    summary: Dict[str, int] = dict(Counter(outcomes))
+    summary["candidates"] = len(candidates)
+    if summary.get("error") or any(summary.get(s) for s in TERMINAL_STATUSES):
+        logger.warning(f"Сверка задач с Replicate: {summary}")
+    else:
+        logger.info(f"Сверка задач с Replicate: {summary}")
+    return summary
@@ -6,6 +6,7 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
 
 from src.domain import logic
+from src.utils.dispatcher import webhook_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +24,13 @@ async def replicate_webhook(request: Request):
         webhook_data = await request.json()
         logger.info(f"Получен вебхук от Replicate: {webhook_data.get('id')}, статус: {webhook_data.get('status')}")
         
-        # Обработать вебхук асинхронно
-        import asyncio
-        asyncio.create_task(logic.process_replicate_webhook(webhook_data))
+        # Обработать вебхук в фоне; повторы по одной prediction идут по порядку
+        queued = await webhook_dispatcher.submit(
+            ("prediction", webhook_data.get("id")), logic.process_replicate_webhook, webhook_data
+        )
+        if not queued:
+            # Очередь переполнена: Replicate повторит вебхук позже
+            return JSONResponse(content={"ok": False, "error": "overloaded"}, status_code=503)
         
         # Всегда возвращаем 200 OK, чтобы Replicate не ретраил
         return JSONResponse(content={"ok": True})
@@ -3,16 +3,23 @@
 
 Этот модуль нужен, чтобы Yandex Cloud Function (`handler.py`) мог импортировать
 обработчик без подтягивания `fastapi` (которого нет в requirements.functions.txt).
+
+Обработка фото (src.domain.logic / albums, pydantic-модели задач) и истории
+импортируется в своих ветках: команды и кнопки меню на холодном старте
+за эти импорты не платят.
 """
 
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Hashable, Optional
 
-from src.domain import logic
-from src.services import telegram_api, s3_storage
+from src.config import config
+from src.services import telegram_api, s3_async, update_dedup
 
 logger = logging.getLogger(__name__)
 
+# Сколько последних задач показывать по /history
+HISTORY_LIMIT = 10
+
 # Кнопки меню: Детализация (обработка фото), Создание штендера (лицо + PDF)
 MENU_INLINE_KEYBOARD = {
     "inline_keyboard": [
@@ -25,52 +32,112 @@ MENU_INLINE_KEYBOARD = {
 }
 
 
-async def process_telegram_update(update_data: Dict[str, Any]) -> None:
+def update_dispatch_key(update_data: Dict[str, Any]) -> Hashable:
+    """
+    Ключ упорядочивания Update для src/utils/dispatcher.py: Update одного чата
+    обрабатываются по порядку.
+
+    Части альбома получают собственный ключ: первая из них ждет остальные
+    ALBUM_BUFFER_SECONDS (albums.handle_album_update), и очередь чата их бы не пропустила.
+    """
+    message = update_data.get("message") or update_data.get("edited_message")
+    if message is None and "callback_query" in update_data:
+        message = update_data["callback_query"].get("message")
+    message = message or {}
+    chat_id = message.get("chat", {}).get("id")
+    if chat_id is None:
+        return ("update", update_data.get("update_id"))
+    if message.get("media_group_id") and config.ALBUM_BATCHING_ENABLED:
+        return ("album", chat_id, update_data.get("update_id"))
+    return chat_id
+
+
+async def process_telegram_update(
+    update_data: Dict[str, Any],
+    album_buffer_seconds: Optional[float] = None,
+) -> None:
     """
     Обработать обновление от Telegram.
 
     Args:
         update_data: Данные Update от Telegram API
+        album_buffer_seconds: Сколько копить части альбома в процессе
+            (None — ALBUM_BUFFER_SECONDS; Cloud Function передает 0)
     """
+    update_id = update_data.get("update_id")
+    durable = update_dedup.has_side_effects(update_data)
     try:
-        # Обработка нажатий на кнопки меню (callback_query)
-        if "callback_query" in update_data:
-            await handle_callback_query(update_data["callback_query"])
+        # Повтор вебхука (Telegram не дождался ответа): подтверждаем без работы
+        if not await update_dedup.deduplicator.claim(update_id, durable=durable):
             return
+    except Exception as e:
+        logger.error("Ошибка при обработке обновления от Telegram: %s", e, exc_info=True)
+        return
 
-        # Обработка сообщений
-        if "message" in update_data:
-            message = update_data["message"]
+    try:
+        await _dispatch_update(update_data, album_buffer_seconds)
+    except Exception as e:
+        logger.error("Ошибка при обработке обновления от Telegram: %s", e, exc_info=True)
+        # Повтор Telegram должен обработать Update заново
+        await update_dedup.deduplicator.release(update_id, durable=durable)
+        return
+    await update_dedup.deduplicator.complete(update_id, durable=durable)
 
-            # Обработка команд
-            if "text" in message:
-                text = (message.get("text") or "").strip()
-                chat_id = message.get("chat", {}).get("id")
 
-                if text == "/start":
-                    await handle_start_command(chat_id)
-                    return
-                if text == "/menu":
-                    await handle_menu_command(chat_id)
-                    return
+async def _dispatch_update(update_data: Dict[str, Any], album_buffer_seconds: Optional[float] = None) -> None:
+    """Передать Update обработчику по его типу."""
+    # Обработка нажатий на кнопки меню (callback_query)
+    if "callback_query" in update_data:
+        await handle_callback_query(update_data["callback_query"])
+        return
 
-                # Текстовое сообщение без команды
-                await handle_text_message(chat_id)
-                return
+    # Обработка сообщений
+    if "message" in update_data:
+        message = update_data["message"]
 
-            # Обработка фото
-            if "photo" in message:
-                await logic.process_telegram_photo(update_data)
-                return
+        # Обработка команд
+        if "text" in message:
+            text = (message.get("text") or "").strip()
+            chat_id = message.get("chat", {}).get("id")
 
-            # Обработка документов (несжатые изображения)
-            if "document" in message:
-                await logic.process_telegram_document(update_data)
+            if text == "/start":
+                await handle_start_command(chat_id)
+                return
+            if text == "/menu":
+                await handle_menu_command(chat_id)
+                return
+            if text == "/history":
+                await handle_history_command(chat_id)
                 return
 
-        logger.warning("Неизвестный тип обновления: %s", list(update_data.keys()))
-    except Exception as e:
-        logger.error("Ошибка при обработке обновления от Telegram: %s", e, exc_info=True)
+            # Текстовое сообщение без команды
+            await handle_text_message(chat_id)
+            return
+
+        # Фото / документы альбома — одной партией на media_group_id
+        if message.get("media_group_id") and config.ALBUM_BATCHING_ENABLED and (
+            "photo" in message or "document" in message
+        ):
+            from src.domain import albums
+
+            await albums.handle_album_update(update_data, buffer_seconds=album_buffer_seconds)
+            return
+
+        # Обработка фото
+        if "photo" in message:
+            from src.domain import logic
+
+            await logic.process_telegram_photo(update_data)
+            return
+
+        # Обработка документов (несжатые изображения)
+        if "document" in message:
+            from src.domain import logic
+
+            await logic.process_telegram_document(update_data)
+            return
+
+    logger.warning("Неизвестный тип обновления: %s", list(update_data.keys()))
 
 
 async def handle_start_command(chat_id: int) -> None:
@@ -78,6 +145,7 @@ async def handle_start_command(chat_id: int) -> None:
     welcome_text = (
         "👋 Привет! Я бот для обработки изображений.\n\n"
         "Выберите режим в меню: /menu\n"
+        "История обработок: /history\n"
         "• **Детализация** — улучшение фото (реставрация).\n"
         "• **Создание штендера** — распознавание лица и генерация PDF-штендера.\n\n"
         "Отправьте фото после выбора режима."
@@ -97,6 +165,15 @@ async def handle_menu_command(chat_id: int) -> None:
     logger.info("Отправлено меню пользователю %s", chat_id)
 
 
+async def handle_history_command(chat_id: int) -> None:
+    """Последние задачи пользователя (из маркеров индекса чата, см. src/domain/history.py)."""
+    from src.domain import history
+
+    tasks = await history.get_chat_history(chat_id, limit=HISTORY_LIMIT)
+    await telegram_api.send_message(chat_id, history.format_history(tasks))
+    logger.info("Отправлена история задач пользователю %s (%d)", chat_id, len(tasks))
+
+
 async def handle_callback_query(callback: Dict[str, Any]) -> None:
     """Обработка нажатия на кнопку меню (callback_query)."""
     callback_id = callback.get("id")
@@ -121,15 +198,21 @@ async def handle_callback_query(callback: Dict[str, Any]) -> None:
         return
 
     if data == "mode=detailization":
-        s3_storage.save_user_state(chat_id, {"mode": "restoration"})
+        await s3_async.save_user_state(chat_id, {"mode": "restoration"})
         await telegram_api.send_message(chat_id, "✅ Выбран режим: **Детализация**. Отправьте фото для обработки.", parse_mode="Markdown")
         logger.info("Пользователь %s выбрал режим: детализация", chat_id)
         return
     if data == "mode=shtender":
-        s3_storage.save_user_state(chat_id, {"mode": "shtender"})
+        await s3_async.save_user_state(chat_id, {"mode": "shtender"})
         await telegram_api.send_message(chat_id, "✅ Выбран режим: **Создание штендера**. Отправьте фото с лицом для генерации PDF.", parse_mode="Markdown")
         logger.info("Пользователь %s выбрал режим: штендер", chat_id)
         return
+    if data.startswith("original="):
+        # Кнопка под перекодированным результатом (src/services/transcode.py)
+        from src.domain import logic
+
+        await logic.send_original(chat_id, data.split("=", 1)[1])
+        return
 
     logger.warning("Неизвестный callback_data: %s", data)
 
@@ -2,11 +2,11 @@
 Обработчик вебхуков от Telegram.
 """
 import logging
-import asyncio
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 
-from src.handlers.telegram_processor import process_telegram_update
+from src.handlers.telegram_processor import process_telegram_update, update_dispatch_key
+from src.utils.dispatcher import webhook_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +27,13 @@ async def telegram_webhook(request: Request):
         update_data = await request.json()
         logger.info(f"Получен Update от Telegram: {update_data.get('update_id')}")
         
-        # Обработать обновление асинхронно, чтобы быстро ответить Telegram
-        asyncio.create_task(process_telegram_update(update_data))
+        # Обработать обновление в фоне (очередь чата), чтобы быстро ответить Telegram
+        queued = await webhook_dispatcher.submit(
+            update_dispatch_key(update_data), process_telegram_update, update_data
+        )
+        if not queued:
+            # Очередь переполнена: Telegram повторит Update позже
+            return JSONResponse(content={"ok": False, "error": "overloaded"}, status_code=503)
         
         # Всегда возвращаем 200 OK быстро, чтобы Telegram не ретраил
         return JSONResponse(content={"ok": True})
@@ -0,0 +1,280 @@
+"""
+Допуск задач в Replicate: ограничение числа одновременных prediction (AIMD).
+
+- В полете (in-flight) — задачи, созданные в Replicate и еще без итогового вебхука.
+  Общий счетчик для всех экземпляров — маркеры index/inflight/ (их ставит и снимает
+  s3_storage.task_index_changes по статусу задачи). Маркер пишется уже после
+  ответа Replicate, поэтому к снимку LIST добавляются допуски этого экземпляра:
+  ждущие ответа create_prediction и созданные prediction, маркер которых еще не
+  попал в снимок. Созданный prediction считается локально, пока его маркер не
+  появится в снимке, пока не придет его итоговый вебхук на этот экземпляр или
+  пока не пройдет _MARKER_GRACE_SECONDS (маркер так и не увиден — задача уже
+  завершилась на другом экземпляре).
+- Лимит адаптируется: успешное создание prediction — аддитивный рост (+1 за
+  «окно» из limit успехов), 429 / 5xx от Replicate — уменьшение вдвое (не чаще
+  раза в ADMISSION_DECREASE_COOLDOWN_SECONDS).
+- Сверх лимита задачи ждут в FIFO-очереди процесса; если очередь длиннее
+  ADMISSION_SHED_QUEUE или ожидание дольше ADMISSION_MAX_WAIT_SECONDS —
+  задача отклоняется сразу (AdmissionRejected), а не копит таймауты.
+
+Очередь — в памяти процесса и без объектов, привязанных к event loop (в Cloud
+Function loop может смениться между вызовами): ожидающие опрашивают оценку с шагом
+_POLL_SECONDS.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from src.config import config
+from src.services import s3_async
+
+logger = logging.getLogger(__name__)
+
+# Шаг опроса очереди ожидающими
+_POLL_SECONDS = 0.2
+# Сколько последних ожиданий хранить для перцентилей в метриках
+_WAIT_SAMPLES = 1000
+# Созданный prediction, которого нет в снимке LIST, начатом позже на столько
+# секунд, считается завершенным (маркер пишется сразу после создания)
+_MARKER_GRACE_SECONDS = 30.0
+
+
+class AdmissionRejected(Exception):
+    """Задача не допущена: очередь переполнена или ожидание слишком долгое."""
+
+    def __init__(self, position: int, reason: str):
+        super().__init__(f"{reason} (позиция в очереди: {position})")
+        self.position = position
+        self.reason = reason
+
+
+class AdmissionGovernor:
+    """
+    Лимит одновременных prediction с AIMD-адаптацией и FIFO-очередью.
+
+    acquire() — дождаться слота перед create_prediction; затем on_success(id) или
+    on_overload() по ответу Replicate; on_complete(id) — пришел итоговый вебхук.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        shed_queue: int,
+        max_wait: float,
+        refresh_interval: float,
+        decrease_cooldown: float,
+        list_inflight: Optional[Callable[[], Any]] = None,
+    ):
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial_limit))
+        self.shed_queue = shed_queue
+        self.max_wait = max_wait
+        self.refresh_interval = refresh_interval
+        self.decrease_cooldown = decrease_cooldown
+        self._list_inflight = list_inflight
+        # Последний снимок маркеров index/inflight/
+        self._inflight_snapshot = 0
+        self._snapshot_at = float("-inf")
+        # Допущены, ответа create_prediction еще нет
+        self._pending = 0
+        # Созданы этим экземпляром, маркер еще не в снимке: prediction_id -> time.monotonic()
+        self._admitted_ids: Dict[str, float] = {}
+        self._refreshing = False
+        self._last_decrease = float("-inf")
+        self._queue: Deque[int] = deque()
+        self._tickets = itertools.count(1)
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self._stats: Dict[str, Any] = {
+            "admitted": 0,
+            "queued": 0,
+            "shed": 0,
+            "timeouts": 0,
+            "overloads": 0,
+            "decreases": 0,
+            "completed": 0,
+            "refresh_errors": 0,
+            "queue_depth_max": 0,
+            "wait_seconds_max": 0.0,
+        }
+
+    @property
+    def inflight(self) -> int:
+        """Оценка числа prediction в полете."""
+        return self._inflight_snapshot + self._pending + len(self._admitted_ids)
+
+    async def _refresh(self, force: bool = False) -> None:
+        """Перечитать маркеры in-flight (не чаще refresh_interval)."""
+        if self._list_inflight is None or self._refreshing:
+            return
+        now = time.monotonic()
+        if not force and now - self._snapshot_at < self.refresh_interval:
+            return
+        self._refreshing = True
+        try:
+            ids = set(await self._list_inflight())
+        except Exception as e:
+            # Без общего счетчика работаем по локальной оценке
+            self._stats["refresh_errors"] += 1
+            logger.warning(f"Не удалось получить число задач в полете: {e}")
+            self._snapshot_at = now
+            return
+        finally:
+            self._refreshing = False
+        self._inflight_snapshot = len(ids)
+        self._snapshot_at = now
+        # Маркер в снимке — prediction учтен в нем; не видно долго — уже завершен
+        for prediction_id, admitted_at in list(self._admitted_ids.items()):
+            if prediction_id in ids or now - admitted_at > _MARKER_GRACE_SECONDS:
+                del self._admitted_ids[prediction_id]
+
+    def _has_slot(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    async def acquire(self, on_queued: Optional[Callable[[int], Any]] = None) -> float:
+        """
+        Дождаться слота для нового prediction.
+
+        Args:
+            on_queued: Вызывается один раз с позицией в очереди, если слота нет сразу
+                (например, чтобы сообщить пользователю)
+
+        Returns:
+            Время ожидания в секундах
+
+        Raises:
+            AdmissionRejected: очередь длиннее shed_queue или ожидание дольше max_wait
+        """
+        if not config.ADMISSION_ENABLED:
+            return 0.0
+        started = time.monotonic()
+        await self._refresh()
+        if not self._queue and self._has_slot():
+            self._admit(0.0)
+            return 0.0
+
+        position = len(self._queue) + 1
+        if self.shed_queue > 0 and position > self.shed_queue:
+            self._stats["shed"] += 1
+            logger.warning(
+                f"Задача отклонена: очередь {len(self._queue)}, в полете {self.inflight}, лимит {self.limit:.1f}"
+            )
+            raise AdmissionRejected(position, "Очередь переполнена")
+
+        ticket = next(self._tickets)
+        self._queue.append(ticket)
+        self._stats["queued"] += 1
+        self._stats["queue_depth_max"] = max(self._stats["queue_depth_max"], len(self._queue))
+        logger.info(f"Задача в очереди на Replicate: позиция {position}, в полете {self.inflight}, лимит {self.limit:.1f}")
+        try:
+            if on_queued is not None:
+                result = on_queued(position)
+                if asyncio.iscoroutine(result):
+                    await result
+            while True:
+                # Свободных слотов может быть несколько — проходят первые в очереди
+                await self._refresh()
+                if self._queue.index(ticket) < int(self.limit) - self.inflight:
+                    break
+                if self.max_wait > 0 and time.monotonic() - started > self.max_wait:
+                    self._stats["timeouts"] += 1
+                    raise AdmissionRejected(self._queue.index(ticket) + 1, "Превышено время ожидания")
+                await asyncio.sleep(_POLL_SECONDS)
+        finally:
+            self._queue.remove(ticket)
+        wait = time.monotonic() - started
+        self._admit(wait)
+        return wait
+
+    def _admit(self, wait: float) -> None:
+        self._pending += 1
+        self._stats["admitted"] += 1
+        self._waits.append(wait)
+        self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+
+    def on_success(self, prediction_id: Optional[str] = None) -> None:
+        """Prediction создан: аддитивный рост лимита."""
+        if not config.ADMISSION_ENABLED:
+            return
+        self._release()
+        if prediction_id:
+            self._admitted_ids[prediction_id] = time.monotonic()
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_overload(self) -> None:
+        """
+        Replicate ответил 429 / 5xx: prediction не создан — слот освобождается,
+        лимит уменьшается вдвое (одна серия ошибок — одно уменьшение).
+        """
+        if not config.ADMISSION_ENABLED:
+            return
+        self._stats["overloads"] += 1
+        self._release()
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(self.min_limit, self.limit / 2)
+        self._stats["decreases"] += 1
+        logger.warning(f"Replicate перегружен: лимит одновременных задач {old:.1f} → {self.limit:.1f}")
+
+    def on_failure(self) -> None:
+        """Prediction не создан по другой причине: освободить слот без изменения лимита."""
+        if config.ADMISSION_ENABLED:
+            self._release()
+
+    def on_complete(self, prediction_id: str) -> None:
+        """
+        Итоговый вебхук: prediction больше не в полете.
+
+        Оценка уменьшается, только если prediction считается локально (его
+        маркера еще нет в снимке): иначе он учтен в снимке и выпадет из него при
+        следующем LIST — повторное вычитание занижало бы число задач в полете.
+        """
+        if not config.ADMISSION_ENABLED:
+            return
+        self._stats["completed"] += 1
+        self._admitted_ids.pop(prediction_id, None)
+
+    def _release(self) -> None:
+        """Ответ create_prediction получен: допуск больше не ждет."""
+        if self._pending > 0:
+            self._pending -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Лимит, оценка in-flight, очередь и перцентили ожидания."""
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["limit"] = round(self.limit, 2)
+        stats["inflight"] = self.inflight
+        stats["inflight_local"] = self._pending + len(self._admitted_ids)
+        stats["queue_depth"] = len(self._queue)
+        stats["wait_seconds_max"] = round(stats["wait_seconds_max"], 3)
+        waits = sorted(self._waits)
+        if waits:
+            stats["wait_seconds_p50"] = round(waits[len(waits) // 2], 3)
+            stats["wait_seconds_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3)
+        else:
+            stats["wait_seconds_p50"] = stats["wait_seconds_p95"] = 0.0
+        return stats
+
+
+async def _list_inflight() -> List[str]:
+    return await s3_async.list_inflight_tasks(config.ADMISSION_INFLIGHT_TTL_SECONDS)
+
+
+governor = AdmissionGovernor(
+    initial_limit=config.ADMISSION_INITIAL_LIMIT,
+    min_limit=config.ADMISSION_MIN_LIMIT,
+    max_limit=config.ADMISSION_MAX_LIMIT,
+    shed_queue=config.ADMISSION_SHED_QUEUE,
+    max_wait=config.ADMISSION_MAX_WAIT_SECONDS,
+    refresh_interval=config.ADMISSION_REFRESH_SECONDS,
+    decrease_cooldown=config.ADMISSION_DECREASE_COOLDOWN_SECONDS,
+    list_inflight=_list_inflight,
+)
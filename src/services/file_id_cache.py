@@ -0,0 +1,168 @@
+"""
+Кэш file_id Telegram для повторной отправки готовых файлов.
+
+Telegram возвращает file_id загруженного файла; повторная отправка по file_id —
+один JSON-запрос без скачивания результата из S3 / Replicate и без загрузки байтов.
+
+Ключ — SHA-256 содержимого исходного изображения + вариант:
+- RESULT — сам результат обработки (фото или документ — как его принял Telegram);
+- SHTENDER — PDF-штендер, собранный по этому изображению.
+
+Записи лежат в памяти процесса (FILE_ID_CACHE_TTL_SECONDS) и в S3 под префиксом
+cache/file_ids/ (их удаляет lifecycle-правило, см. spec/04-s3-data.md). file_id
+действует только для своего бота: если Telegram его не принял, запись удаляется
+и файл загружается заново.
+"""
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+from botocore.exceptions import ClientError
+
+from src.config import config
+from src.services import s3_async, telegram_api
+from src.utils import codec
+from src.utils.cache import AsyncLRUCache
+
+logger = logging.getLogger(__name__)
+
+FILE_IDS_PREFIX = "cache/file_ids"
+
+RESULT = "result"
+SHTENDER = "shtender"
+
+_memory = AsyncLRUCache(
+    "file_id",
+    max_size=config.FILE_ID_CACHE_SIZE,
+    ttl=config.FILE_ID_CACHE_TTL_SECONDS,
+    negative_ttl=60,
+)
+
+# Счетчики процесса (отдаются в /metrics)
+_stats: Dict[str, int] = {
+    "sent": 0,
+    "misses": 0,
+    "stores": 0,
+    "invalid": 0,
+    "errors": 0,
+}
+
+
+def get_stats() -> Dict[str, Any]:
+    """Счетчики кэша file_id и его части в памяти."""
+    stats: Dict[str, Any] = dict(_stats)
+    stats["memory"] = _memory.get_stats()
+    return stats
+
+
+def content_sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _key(sha256: str, variant: str) -> str:
+    return f"{FILE_IDS_PREFIX}/{variant}/{sha256[:2]}/{sha256}.json"
+
+
+async def _load(sha256: str, variant: str) -> Optional[dict]:
+    try:
+        return codec.loads(await s3_async.download_from_s3(config.S3_BUCKET, _key(sha256, variant)))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in ("NoSuchKey", "404"):
+            return None
+        raise
+
+
+async def lookup(sha256: Optional[str], variant: str) -> Optional[dict]:
+    """
+    Запись кэша: {"kind": "photo" | "document", "file_id": ...} или None
+    (промах, кэш выключен, ошибка чтения).
+    """
+    if not config.FILE_ID_CACHE_ENABLED or not sha256:
+        return None
+    try:
+        return await _memory.get_or_load((variant, sha256), lambda: _load(sha256, variant))
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Кэш file_id недоступен ({variant}/{sha256}): {e}")
+        return None
+
+
+async def remember(
+    sha256: Optional[str],
+    variant: str,
+    response: Dict[str, Any],
+    reply_markup: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    """
+    Запомнить file_id из ответа sendPhoto / sendDocument (и кнопки под файлом —
+    они повторяются при отправке по file_id). Ошибки S3 не пробрасываются:
+    файл пользователю уже отправлен.
+
+    Returns:
+        file_id отправленного файла или None, если его нет в ответе
+    """
+    sent = telegram_api.sent_file(response)
+    if sent is None:
+        return None
+    kind, file_id = sent
+    if not config.FILE_ID_CACHE_ENABLED or not sha256:
+        return file_id
+    record = {"kind": kind, "file_id": file_id, "created_at": datetime.utcnow().isoformat() + "Z"}
+    if reply_markup:
+        record["reply_markup"] = reply_markup
+    _memory.set((variant, sha256), record)
+    try:
+        await s3_async.upload_to_s3(
+            config.S3_BUCKET,
+            _key(sha256, variant),
+            codec.dumps(record),
+            content_type="application/json; charset=utf-8",
+        )
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Не удалось сохранить file_id в S3 ({variant}/{sha256}): {e}")
+        return file_id
+    _stats["stores"] += 1
+    return file_id
+
+
+async def _forget(sha256: str, variant: str) -> None:
+    _memory.invalidate((variant, sha256))
+    try:
+        await s3_async.delete_object(config.S3_BUCKET, _key(sha256, variant))
+    except Exception as e:
+        logger.warning(f"Не удалось удалить file_id из S3 ({variant}/{sha256}): {e}")
+
+
+async def send(chat_id: int, sha256: Optional[str], variant: str, caption: Optional[str] = None) -> Optional[str]:
+    """
+    Отправить файл по file_id из кэша.
+
+    Returns:
+        file_id, если файл отправлен; None — записи нет или Telegram отклонил
+        file_id (запись удалена) — файл нужно загрузить заново
+    """
+    record = await lookup(sha256, variant)
+    if not record:
+        if config.FILE_ID_CACHE_ENABLED and sha256:
+            _stats["misses"] += 1
+        return None
+    try:
+        await telegram_api.send_file_id(
+            chat_id, record["kind"], record["file_id"], caption=caption, reply_markup=record.get("reply_markup")
+        )
+    except httpx.HTTPStatusError as e:
+        if e.response is None or e.response.status_code != 400:
+            raise
+        _stats["invalid"] += 1
+        logger.warning(
+            f"Telegram не принял file_id ({variant}/{sha256}), файл будет загружен заново: "
+            f"{(e.response.text or '').strip()}"
+        )
+        await _forget(sha256, variant)
+        return None
+    _stats["sent"] += 1
+    logger.info(f"Файл отправлен по file_id ({variant}/{sha256}) пользователю {chat_id}")
+    return record["file_id"]
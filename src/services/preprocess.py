@@ -0,0 +1,167 @@
+"""
+Подготовка входного изображения перед загрузкой в S3 и Replicate.
+
+Оригинал из Telegram (до MAX_IMAGE_MB) Replicate скачивал и обрабатывал целиком.
+Здесь, в потоке (asyncio.to_thread — Pillow не блокирует event loop):
+
+- поворот по EXIF Orientation (после него тег не нужен);
+- удаление метаданных (EXIF с геопозицией, XMP, комментарии); ICC-профиль
+  сохраняется — от него зависят цвета;
+- ограничение длинной стороны: PREPROCESS_MAX_SIDE_BY_MODE для режима, иначе
+  PREPROCESS_MAX_SIDE; большой JPEG уменьшается еще при декодировании (draft);
+- перекодирование в JPEG с качеством PREPROCESS_JPEG_QUALITY.
+
+JPEG, которому ничего из этого не нужно, остается как есть (без потерь на
+повторном сжатии). Если Pillow не смог открыть файл, уходит оригинал.
+
+Для этого файл приходится читать в память целиком, поэтому needs_buffering()
+решает заранее, по данным из сообщения Telegram: сжатое фото (JPEG без
+метаданных, размеры известны) в пределах лимита загружается потоком, как без
+предобработки; в память читаются только фото больше лимита и документы.
+"""
+import asyncio
+import io
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import config
+from src.utils.images import to_rgb
+
+logger = logging.getLogger(__name__)
+
+# EXIF-тег Orientation
+_ORIENTATION = 0x0112
+# Ориентации, при которых ширина и высота меняются местами
+_TRANSPOSED = (5, 6, 7, 8)
+
+# Счетчики процесса (отдаются в /metrics)
+_stats: Dict[str, Any] = {
+    "processed": 0,
+    "streamed": 0,
+    "reencoded": 0,
+    "kept": 0,
+    "errors": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "seconds_total": 0.0,
+}
+
+
+def get_stats() -> Dict[str, Any]:
+    """Счетчики предобработки: файлы, байты до/после, суммарное время."""
+    stats = dict(_stats)
+    stats["seconds_total"] = round(stats["seconds_total"], 3)
+    stats["ratio"] = round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else 0.0
+    return stats
+
+
+def max_side_for(mode: str) -> int:
+    """Предел длинной стороны для режима (0 — без ограничения)."""
+    return config.PREPROCESS_MAX_SIDE_BY_MODE.get(mode, config.PREPROCESS_MAX_SIDE)
+
+
+def needs_buffering(
+    mime_type: Optional[str],
+    width: Optional[int],
+    height: Optional[int],
+    mode: str,
+) -> bool:
+    """
+    Нужно ли читать файл в память для prepare() (иначе — потоковая загрузка).
+
+    Args:
+        width, height: Размеры из message.photo (для документов неизвестны — None)
+    """
+    if not config.PREPROCESS_ENABLED:
+        return False
+    if width and height and mime_type == "image/jpeg":
+        # Сжатое фото Telegram: JPEG без EXIF — перекодировать, только если больше предела
+        max_side = max_side_for(mode)
+        if not 0 < max_side < max(width, height):
+            _stats["streamed"] += 1
+            return False
+    return True
+
+
+def _prepare(data: bytes, max_side: int, quality: int) -> Tuple[bytes, Dict[str, Any]]:
+    """Синхронная часть: декодирование, поворот, уменьшение, JPEG."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        source_format = img.format
+        orientation = img.getexif().get(_ORIENTATION, 1)
+        width, height = img.size
+        if orientation in _TRANSPOSED:
+            width, height = height, width
+        scale = max_side / max(width, height) if 0 < max_side < max(width, height) else 1.0
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        has_metadata = any(key in img.info for key in ("exif", "xmp", "XML:com.adobe.xmp", "comment"))
+        info: Dict[str, Any] = {
+            "format": source_format,
+            "input_bytes": len(data),
+            "input_size": [width, height],
+            "output_size": list(target),
+        }
+
+        if (
+            source_format == "JPEG"
+            and img.mode in ("RGB", "L")
+            and scale == 1.0
+            and orientation in (0, 1)
+            and not has_metadata
+        ):
+            info.update({"reencoded": False, "output_bytes": len(data), "content_type": "image/jpeg"})
+            return data, info
+
+        if source_format == "JPEG" and scale < 1.0:
+            # DCT-масштабирование при декодировании: не распаковывать JPEG в полный размер
+            stored = (target[1], target[0]) if orientation in _TRANSPOSED else target
+            img.draft("RGB", stored)
+        icc_profile = img.info.get("icc_profile")
+        image = to_rgb(ImageOps.exif_transpose(img))
+        if image.size != target:
+            image = image.resize(target, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        save_args: Dict[str, Any] = {"quality": quality, "optimize": True}
+        if icc_profile:
+            save_args["icc_profile"] = icc_profile
+        image.save(buffer, format="JPEG", **save_args)
+    output = buffer.getvalue()
+    info.update({"reencoded": True, "output_bytes": len(output), "content_type": "image/jpeg"})
+    return output, info
+
+
+async def prepare(data: bytes, mode: str) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Подготовить входное изображение для режима mode.
+
+    Returns:
+        (байты для загрузки в S3, сведения: размеры и байты до/после,
+        content_type, reencoded, ms — время этапа; error — если оставлен оригинал)
+    """
+    started = time.perf_counter()
+    try:
+        output, info = await asyncio.to_thread(
+            _prepare, data, max_side_for(mode), config.PREPROCESS_JPEG_QUALITY
+        )
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Предобработка изображения не удалась, загружается оригинал: {e}")
+        return data, {"input_bytes": len(data), "output_bytes": len(data), "error": str(e)}
+    elapsed = time.perf_counter() - started
+    info["ms"] = round(elapsed * 1000, 1)
+
+    _stats["processed"] += 1
+    _stats["reencoded" if info["reencoded"] else "kept"] += 1
+    _stats["bytes_in"] += info["input_bytes"]
+    _stats["bytes_out"] += info["output_bytes"]
+    _stats["seconds_total"] += elapsed
+    logger.info(
+        f"Предобработка ({mode}): {info['input_size'][0]}x{info['input_size'][1]} → "
+        f"{info['output_size'][0]}x{info['output_size'][1]}, "
+        f"{info['input_bytes'] / 1024:.0f} → {info['output_bytes'] / 1024:.0f} КБ за {info['ms']:.0f} мс"
+        + ("" if info["reencoded"] else " (оригинал без изменений)")
+    )
+    return output, info
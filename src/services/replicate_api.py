@@ -82,7 +82,12 @@ async def create_prediction(
             api_url,
             json=payload,
             headers=headers,
-            timeout=15.0
+            timeout=15.0,
+            # POST /predictions не идемпотентен: каждый повтор, дошедший до Replicate, —
+            # платный prediction без состояния задачи. Повторы — только через очередь
+            # допуска (src/services/admission.py, src/domain/logic.py)
+            max_retries=1,
+            retry_on=(),
         )
         data = response.json()
         logger.info(f"Prediction создан: {data.get('id')}, статус: {data.get('status')}")
@@ -113,3 +118,39 @@ async def create_prediction(
         else:
             logger.error(f"Ошибка при создании prediction в Replicate: {e}")
         raise
+
+
+async def get_prediction(prediction_id: str) -> Optional[dict]:
+    """
+    Получить текущее состояние prediction (GET /v1/predictions/{id}).
+
+    Используется сверкой зависших задач (src/domain/reconcile.py), когда вебхук
+    потерян. Ответ того же вида, что и тело вебхука (id, status, output, error).
+
+    Args:
+        prediction_id: ID prediction
+
+    Returns:
+        Состояние prediction или None, если Replicate его не знает (404)
+    """
+    if config.MOCK_REPLICATE_URL:
+        api_url = f"{config.MOCK_REPLICATE_URL}/v1/predictions/{prediction_id}"
+        headers = {}
+    else:
+        if not config.REPLICATE_API_TOKEN:
+            raise ValueError("Для реального Replicate API требуется REPLICATE_API_TOKEN")
+        api_url = f"https://api.replicate.com/v1/predictions/{prediction_id}"
+        headers = {"Authorization": f"Token {config.REPLICATE_API_TOKEN}"}
+
+    try:
+        response = await make_request("GET", api_url, headers=headers, timeout=15.0)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            logger.warning(f"Prediction {prediction_id} не найден в Replicate")
+            return None
+        logger.error(
+            "HTTP ошибка Replicate при получении prediction: "
+            f"status={e.response.status_code}, url={api_url}"
+        )
+        raise
+    return response.json()
@@ -0,0 +1,167 @@
+"""
+Кэш результатов обработки по содержимому входа (S3-as-DB).
+
+Ключ — SHA-256 байтов входного фото + режим (BotMode) + версия модели Replicate:
+повторно отправленное или пересланное фото получает готовый результат без нового
+prediction. Записи лежат под префиксом cache/results/:
+
+- {key}.json — метаданные (тип контента, имя файла, SHA-256 результата — ключ
+  кэша file_id Telegram, prediction_id, срок жизни);
+- {key}.out — байты результата.
+
+Срок жизни — RESULT_CACHE_TTL_SECONDS: просроченная запись считается промахом и
+удаляется при чтении; бакет дополнительно чистит lifecycle-правило на префикс
+(см. spec/04-s3-data.md). Смена REPLICATE_MODEL_VERSION меняет ключ, старые
+записи уходят по сроку жизни.
+"""
+import hashlib
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from src.config import config
+from src.services import s3_async
+from src.utils import codec
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_PREFIX = "cache/results"
+
+# Счетчики процесса (отдаются в /metrics)
+_stats: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "expired": 0,
+    "stores": 0,
+    "errors": 0,
+}
+
+
+def get_stats() -> Dict[str, int]:
+    """Счетчики кэша результатов с момента запуска процесса."""
+    return dict(_stats)
+
+
+def model_tag() -> str:
+    """Версия модели для ключа кэша: REPLICATE_MODEL_VERSION, "mock" для Mock Replicate."""
+    if config.MOCK_REPLICATE_URL:
+        return "mock"
+    return config.REPLICATE_MODEL_VERSION or "default"
+
+
+def cache_key(sha256: str, mode: str, model: Optional[str] = None) -> str:
+    """Базовый ключ записи (без расширения) для входа, режима и версии модели."""
+    model = re.sub(r"[^A-Za-z0-9._-]", "_", model or model_tag())
+    return f"{RESULT_CACHE_PREFIX}/{mode}/{model}/{sha256[:2]}/{sha256}"
+
+
+def _is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code", "") in ("NoSuchKey", "404")
+
+
+async def lookup(sha256: str, mode: str, model: Optional[str] = None) -> Optional[dict]:
+    """
+    Найти готовый результат для входа.
+
+    Args:
+        sha256: SHA-256 байтов входного фото
+        mode: Режим обработки (значение BotMode)
+        model: Версия модели (по умолчанию model_tag())
+
+    Returns:
+        Метаданные записи (с полем "key") или None при промахе / ошибке
+    """
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    key = cache_key(sha256, mode, model)
+    try:
+        meta = codec.loads(await s3_async.download_from_s3(config.S3_BUCKET, f"{key}.json"))
+    except Exception as e:
+        # Кэш — оптимизация: любая ошибка чтения считается промахом
+        if not (isinstance(e, ClientError) and _is_not_found(e)):
+            _stats["errors"] += 1
+            logger.warning(f"Кэш результатов недоступен ({key}): {e}")
+        _stats["misses"] += 1
+        return None
+
+    expires_at = meta.get("expires_at")
+    if expires_at and datetime.fromisoformat(expires_at.replace("Z", "")) <= datetime.utcnow():
+        _stats["expired"] += 1
+        _stats["misses"] += 1
+        logger.info(f"Запись кэша результатов просрочена: {key}")
+        await _evict(key)
+        return None
+
+    _stats["hits"] += 1
+    meta["key"] = key
+    logger.info(f"Попадание в кэш результатов: {key}")
+    return meta
+
+
+async def load_output(meta: dict) -> bytes:
+    """Скачать байты результата по метаданным из lookup."""
+    return await s3_async.download_from_s3(config.S3_BUCKET, f"{meta['key']}.out")
+
+
+async def store(
+    sha256: str,
+    mode: str,
+    data: bytes,
+    content_type: str,
+    filename: str = "photo.jpg",
+    prediction_id: Optional[str] = None,
+    model: Optional[str] = None,
+    output_sha256: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Сохранить результат обработки в кэш. Ошибки S3 не пробрасываются:
+    кэш — оптимизация, результат пользователю уже отправлен.
+
+    Returns:
+        Базовый ключ записи или None, если кэш выключен / запись не удалась
+    """
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    key = cache_key(sha256, mode, model)
+    now = datetime.utcnow()
+    meta = {
+        "sha256": sha256,
+        "mode": mode,
+        "model": model or model_tag(),
+        "content_type": content_type,
+        "filename": filename,
+        "size_bytes": len(data),
+        "output_sha256": output_sha256 or hashlib.sha256(data).hexdigest(),
+        "prediction_id": prediction_id,
+        "created_at": now.isoformat() + "Z",
+    }
+    if config.RESULT_CACHE_TTL_SECONDS > 0:
+        meta["expires_at"] = (now + timedelta(seconds=config.RESULT_CACHE_TTL_SECONDS)).isoformat() + "Z"
+    try:
+        # Сначала результат, потом метаданные: запись видна только целиком
+        await s3_async.upload_to_s3(config.S3_BUCKET, f"{key}.out", data, content_type=content_type)
+        await s3_async.upload_to_s3(
+            config.S3_BUCKET,
+            f"{key}.json",
+            codec.dumps(meta),
+            content_type="application/json; charset=utf-8",
+        )
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Не удалось сохранить результат в кэш ({key}): {e}")
+        return None
+    _stats["stores"] += 1
+    logger.info(f"Результат сохранен в кэш: {key}, {len(data)} байт")
+    return key
+
+
+async def _evict(key: str) -> None:
+    """Удалить запись кэша (метаданные, затем результат)."""
+    for suffix in (".json", ".out"):
+        try:
+            await s3_async.delete_object(config.S3_BUCKET, f"{key}{suffix}")
+        except Exception as e:
+            logger.warning(f"Не удалось удалить запись кэша {key}{suffix}: {e}")
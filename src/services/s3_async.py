@@ -0,0 +1,293 @@
+"""
+Асинхронный слой над s3_storage: те же функции, но вызовы boto3 выполняются
+в ограниченном пуле потоков и не блокируют event loop.
+
+Размер пула совпадает с S3_MAX_POOL_CONNECTIONS (размер пула соединений boto3),
+поэтому параллельные запросы к S3 не ждут свободного соединения внутри потока.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional
+
+from src.config import config
+from src.services import s3_storage
+from src.utils.cache import AsyncLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Пул потоков для boto3 (создается при первом использовании)
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Состояние пользователя (режим из меню) читается на каждое фото — держим его в памяти
+user_state_cache = AsyncLRUCache(
+    "user_state",
+    max_size=config.USER_STATE_CACHE_SIZE,
+    ttl=config.USER_STATE_CACHE_TTL_SECONDS,
+    negative_ttl=config.USER_STATE_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+# Минимальный размер части multipart-загрузки в S3 (кроме последней)
+MIN_MULTIPART_CHUNK_BYTES = 5 * 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """Поток превысил допустимый размер; загрузка в S3 отменена."""
+
+    pass
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Получить или создать пул потоков для вызовов S3.
+
+    Returns:
+        ThreadPoolExecutor на S3_MAX_POOL_CONNECTIONS потоков
+    """
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.S3_MAX_POOL_CONNECTIONS,
+            thread_name_prefix="s3",
+        )
+        logger.info(f"Создан пул потоков S3: max_workers={config.S3_MAX_POOL_CONNECTIONS}")
+
+    return _executor
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    """Остановить пул потоков S3 (при остановке приложения)."""
+    global _executor
+
+    executor = _executor
+    _executor = None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+        logger.info("Пул потоков S3 остановлен")
+
+
+async def _run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Выполнить синхронную функцию s3_storage в пуле потоков S3."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def ensure_bucket() -> None:
+    """Проверить / создать бакет (см. s3_storage.ensure_bucket)."""
+    await _run(s3_storage.ensure_bucket)
+
+
+async def upload_to_s3(
+    bucket: str,
+    key: str,
+    data: bytes,
+    content_type: str = "application/octet-stream"
+) -> None:
+    """Загрузить данные в S3 (см. s3_storage.upload_to_s3)."""
+    await _run(s3_storage.upload_to_s3, bucket=bucket, key=key, data=data, content_type=content_type)
+
+
+async def put_object_if_absent(
+    bucket: str,
+    key: str,
+    data: bytes,
+    content_type: str = "application/octet-stream"
+) -> bool:
+    """Создать объект, если его еще нет (см. s3_storage.put_object_if_absent)."""
+    return await _run(s3_storage.put_object_if_absent, bucket=bucket, key=key, data=data, content_type=content_type)
+
+
+async def object_exists(bucket: str, key: str) -> bool:
+    """Проверить наличие объекта (см. s3_storage.object_exists)."""
+    return await _run(s3_storage.object_exists, bucket=bucket, key=key)
+
+
+async def download_from_s3(bucket: str, key: str) -> bytes:
+    """Скачать данные из S3 (см. s3_storage.download_from_s3)."""
+    return await _run(s3_storage.download_from_s3, bucket=bucket, key=key)
+
+
+async def upload_stream_to_s3(
+    bucket: str,
+    key: str,
+    chunks: AsyncIterable[bytes],
+    content_type: str = "application/octet-stream",
+    max_bytes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Загрузить в S3 поток байтов, не собирая его целиком в памяти.
+
+    Данные копятся в буфер размером S3_MULTIPART_CHUNK_MB; как только буфер заполнен,
+    он уходит в S3 частью multipart-загрузки, пока следующая часть еще скачивается.
+    В памяти одновременно не больше двух частей. Если поток меньше одной части,
+    выполняется обычный put_object. По ходу считается SHA-256 и проверяется размер.
+
+    Args:
+        bucket: Имя бакета
+        key: Ключ (путь) объекта
+        chunks: Асинхронный источник кусков данных (например, telegram_api.iter_file_chunks)
+        content_type: MIME-тип контента
+        max_bytes: Лимит размера; при превышении загрузка отменяется
+
+    Returns:
+        {"size_bytes": ..., "sha256": ..., "parts": ...}
+
+    Raises:
+        UploadTooLargeError: Поток превысил max_bytes
+    """
+    part_size = max(MIN_MULTIPART_CHUNK_BYTES, config.S3_MULTIPART_CHUNK_MB * 1024 * 1024)
+    hasher = hashlib.sha256()
+    buffer = bytearray()
+    size_bytes = 0
+    upload_id: Optional[str] = None
+    etags: List[str] = []
+    pending_part: Optional[asyncio.Future] = None
+
+    async def flush_part(data: bytes) -> None:
+        nonlocal upload_id, pending_part
+        if upload_id is None:
+            upload_id = await _run(s3_storage.create_multipart_upload, bucket, key, content_type)
+        # Не больше одной части в полете: ограничивает память на запрос
+        if pending_part is not None:
+            etags.append(await pending_part)
+        part_number = len(etags) + 1
+        pending_part = asyncio.ensure_future(
+            _run(s3_storage.upload_part, bucket, key, upload_id, part_number, data)
+        )
+
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size_bytes += len(chunk)
+            if max_bytes is not None and size_bytes > max_bytes:
+                raise UploadTooLargeError(
+                    f"Размер потока превысил лимит {max_bytes} байт: {bucket}/{key}"
+                )
+            hasher.update(chunk)
+            buffer += chunk
+            if len(buffer) >= part_size:
+                await flush_part(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+
+        if upload_id is None:
+            await upload_to_s3(bucket=bucket, key=key, data=bytes(buffer), content_type=content_type)
+        else:
+            if buffer:
+                await flush_part(bytes(buffer))
+            etags.append(await pending_part)
+            pending_part = None
+            await _run(s3_storage.complete_multipart_upload, bucket, key, upload_id, etags)
+    except BaseException:
+        if pending_part is not None:
+            pending_part.cancel()
+        if upload_id is not None:
+            try:
+                await _run(s3_storage.abort_multipart_upload, bucket, key, upload_id)
+            except Exception:
+                pass
+        raise
+
+    sha256 = hasher.hexdigest()
+    logger.info(
+        f"Поток загружен в S3: {bucket}/{key}, размер: {size_bytes} байт, "
+        f"частей: {len(etags) or 1}, sha256: {sha256[:12]}…"
+    )
+    return {"size_bytes": size_bytes, "sha256": sha256, "parts": len(etags) or 1}
+
+
+async def generate_presigned_url(
+    bucket: str,
+    key: str,
+    expires_in: Optional[int] = None
+) -> str:
+    """Сгенерировать presigned URL (см. s3_storage.generate_presigned_url)."""
+    return await _run(s3_storage.generate_presigned_url, bucket=bucket, key=key, expires_in=expires_in)
+
+
+async def save_task_state(prediction_id: str, state: dict) -> None:
+    """
+    Сохранить состояние задачи (см. s3_storage.save_task_state) и параллельно
+    обновить индексы задачи (см. s3_storage.task_index_changes).
+    """
+    await asyncio.gather(
+        _run(s3_storage.save_task_state, prediction_id, state),
+        _update_task_index(state),
+    )
+
+
+async def _update_task_index(state: dict) -> None:
+    """
+    Обновить индексы задачи: пустые маркеры пишутся параллельно, удаления — одним
+    DeleteObjects. Ошибка индекса не должна ронять сохранение задачи.
+    """
+    try:
+        puts, deletes = s3_storage.task_index_changes(state)
+        requests = [
+            _run(s3_storage.upload_to_s3, bucket=config.S3_BUCKET, key=key, data=b"", content_type="application/octet-stream")
+            for key in puts
+        ]
+        if deletes:
+            requests.append(_run(s3_storage.delete_objects, config.S3_BUCKET, deletes))
+        await asyncio.gather(*requests)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить индекс задачи {state.get('prediction_id')}: {e}")
+
+
+async def list_chat_index(chat_id: int, limit: Optional[int] = None) -> List[dict]:
+    """Последние задачи чата по маркерам, новые первыми (см. s3_storage.list_chat_index)."""
+    return await _run(s3_storage.list_chat_index, chat_id, limit)
+
+
+async def list_day_tasks(day: date) -> List[str]:
+    """prediction_id задач дня (см. s3_storage.list_day_tasks)."""
+    return await _run(s3_storage.list_day_tasks, day)
+
+
+async def list_inflight_tasks(
+    max_age_seconds: Optional[int] = None,
+    min_age_seconds: Optional[int] = None,
+) -> List[str]:
+    """prediction_id задач в полете (см. s3_storage.list_inflight_tasks)."""
+    return await _run(s3_storage.list_inflight_tasks, max_age_seconds, min_age_seconds)
+
+
+async def load_task_state(prediction_id: str) -> Optional[dict]:
+    """Загрузить состояние задачи (см. s3_storage.load_task_state)."""
+    return await _run(s3_storage.load_task_state, prediction_id)
+
+
+async def load_user_state(chat_id: int) -> Optional[dict]:
+    """
+    Загрузить состояние пользователя (см. s3_storage.load_user_state) через user_state_cache:
+    повторные чтения в пределах TTL не ходят в S3, одновременные — один GET на чат.
+    """
+    return await user_state_cache.get_or_load(
+        chat_id,
+        lambda: _run(s3_storage.load_user_state, chat_id),
+    )
+
+
+async def save_user_state(chat_id: int, state: dict) -> None:
+    """Сохранить состояние пользователя (см. s3_storage.save_user_state) и обновить кэш."""
+    try:
+        await _run(s3_storage.save_user_state, chat_id, state)
+    except BaseException:
+        # Неизвестно, дошла ли запись до S3 — следующее чтение пойдет в S3
+        user_state_cache.invalidate(chat_id)
+        raise
+    user_state_cache.set(chat_id, state)
+
+
+async def list_keys(bucket: str, prefix: str, limit: Optional[int] = None) -> List[str]:
+    """Ключи объектов под префиксом (см. s3_storage.list_keys)."""
+    return await _run(s3_storage.list_keys, bucket=bucket, prefix=prefix, limit=limit)
+
+
+async def delete_object(bucket: str, key: str) -> None:
+    """Удалить объект из S3 (см. s3_storage.delete_object)."""
+    await _run(s3_storage.delete_object, bucket=bucket, key=key)
@@ -5,40 +5,56 @@
 - Yandex Object Storage (рекомендуется, начиная с feature-2.5)
 - MinIO (альтернатива для ранних этапов разработки)
 """
-import json
 import logging
-from datetime import datetime
-from typing import Optional, BinaryIO
-import boto3
-from botocore.exceptions import ClientError, BotoCoreError
-from botocore.config import Config
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional, BinaryIO, List, Tuple
+from botocore.exceptions import ClientError, BotoCoreError, ParamValidationError
 
 from src.config import config
+from src.utils import codec
 
 logger = logging.getLogger(__name__)
 
 # Глобальный клиент S3 (создается при первом использовании)
-_s3_client: Optional[boto3.client] = None
+_s3_client: Optional[Any] = None
+# boto3.client() не потокобезопасен при создании, а s3_async вызывает нас из пула потоков
+_s3_client_lock = threading.Lock()
 
 
-def get_s3_client() -> boto3.client:
+def get_s3_client() -> Any:
     """
     Получить или создать клиент boto3 для S3.
+
+    boto3 импортируется здесь, а не при загрузке модуля: на холодном старте
+    Cloud Function импорт и создание клиента — заметная доля времени, и платить
+    за них нужно только при первом обращении к S3. Бакет при этом не
+    проверяется (см. ensure_bucket).
     
     Returns:
         boto3 S3 клиент с настройками из конфига
     """
     global _s3_client
     
-    if _s3_client is None:
+    if _s3_client is not None:
+        return _s3_client
+
+    with _s3_client_lock:
+        if _s3_client is not None:
+            return _s3_client
+
+        import boto3
+        from botocore.config import Config
+
         s3_config = Config(
             signature_version='s3v4',
             s3={
                 'addressing_style': 'path' if config.S3_FORCE_PATH_STYLE else 'auto'
-            }
+            },
+            max_pool_connections=config.S3_MAX_POOL_CONNECTIONS,
         )
         
-        _s3_client = boto3.client(
+        client = boto3.client(
             's3',
             endpoint_url=config.S3_ENDPOINT_URL,
             aws_access_key_id=config.AWS_ACCESS_KEY_ID,
@@ -46,31 +62,41 @@ def get_s3_client() -> boto3.client:
             use_ssl=config.S3_USE_SSL,
             config=s3_config
         )
-        
-        # Проверка доступности и создание бакета при необходимости
-        # Примечание: для Yandex Object Storage создание бакета через boto3 может не работать
-        # (нужны специальные права). Бакет должен быть создан заранее через YC CLI.
-        try:
-            _s3_client.head_bucket(Bucket=config.S3_BUCKET)
-            logger.info(f"Бакет {config.S3_BUCKET} доступен")
-        except ClientError as e:
-            error_code = e.response.get('Error', {}).get('Code', '')
-            if error_code == '404':
-                logger.info(f"Бакет {config.S3_BUCKET} не найден, пытаюсь создать...")
-                try:
-                    _s3_client.create_bucket(Bucket=config.S3_BUCKET)
-                    logger.info(f"Бакет {config.S3_BUCKET} создан")
-                except ClientError as create_error:
-                    logger.error(f"Не удалось создать бакет: {create_error}")
-                    logger.warning("Для Yandex Object Storage создайте бакет через YC CLI: yc storage bucket create --name <bucket-name> --folder-id <folder-id>")
-                    raise
-            else:
-                logger.error(f"Ошибка при проверке бакета: {e}")
-                raise
+        _s3_client = client
     
     return _s3_client
 
 
+def ensure_bucket() -> None:
+    """
+    Проверить доступность бакета и создать его при необходимости.
+
+    Вызывается при запуске приложения (FastAPI, MinIO в docker-compose), а не на
+    пути запроса: в Cloud Function бакет создан заранее (init-yandex-s3.ps1), и
+    лишний HEAD на каждом холодном старте не нужен.
+    """
+    client = get_s3_client()
+    # Примечание: для Yandex Object Storage создание бакета через boto3 может не работать
+    # (нужны специальные права). Бакет должен быть создан заранее через YC CLI.
+    try:
+        client.head_bucket(Bucket=config.S3_BUCKET)
+        logger.info(f"Бакет {config.S3_BUCKET} доступен")
+    except ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', '')
+        if error_code == '404':
+            logger.info(f"Бакет {config.S3_BUCKET} не найден, пытаюсь создать...")
+            try:
+                client.create_bucket(Bucket=config.S3_BUCKET)
+                logger.info(f"Бакет {config.S3_BUCKET} создан")
+            except ClientError as create_error:
+                logger.error(f"Не удалось создать бакет: {create_error}")
+                logger.warning("Для Yandex Object Storage создайте бакет через YC CLI: yc storage bucket create --name <bucket-name> --folder-id <folder-id>")
+                raise
+        else:
+            logger.error(f"Ошибка при проверке бакета: {e}")
+            raise
+
+
 def upload_to_s3(
     bucket: str,
     key: str,
@@ -101,6 +127,64 @@ def upload_to_s3(
         raise
 
 
+def put_object_if_absent(
+    bucket: str,
+    key: str,
+    data: bytes,
+    content_type: str = "application/octet-stream"
+) -> bool:
+    """
+    Создать объект, только если его еще нет (условная запись If-None-Match: *).
+    Из нескольких экземпляров, пишущих один ключ, True получит ровно один.
+
+    Returns:
+        True — объект создан этим вызовом, False — уже существовал
+    """
+    client = get_s3_client()
+
+    try:
+        client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            IfNoneMatch="*",
+        )
+    except ParamValidationError:
+        # boto3 < 1.35 не знает IfNoneMatch: проверка и запись не атомарны
+        logger.warning("boto3 без поддержки IfNoneMatch (нужен boto3>=1.35): условная запись неатомарна")
+        if object_exists(bucket, key):
+            return False
+        upload_to_s3(bucket=bucket, key=key, data=data, content_type=content_type)
+        return True
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code", "")
+        if error_code in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+            logger.info(f"Объект уже существует в S3: {bucket}/{key}")
+            return False
+        logger.error(f"Ошибка при условной загрузке в S3 {bucket}/{key}: {e}")
+        raise
+    except BotoCoreError as e:
+        logger.error(f"Ошибка при условной загрузке в S3 {bucket}/{key}: {e}")
+        raise
+    logger.info(f"Файл загружен в S3: {bucket}/{key}")
+    return True
+
+
+def object_exists(bucket: str, key: str) -> bool:
+    """Проверить наличие объекта (HEAD)."""
+    client = get_s3_client()
+
+    try:
+        client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in ("NoSuchKey", "404", "NotFound"):
+            return False
+        logger.error(f"Ошибка при проверке объекта {bucket}/{key}: {e}")
+        raise
+
+
 def download_from_s3(bucket: str, key: str) -> bytes:
     """
     Скачать данные из S3.
@@ -128,6 +212,120 @@ def download_from_s3(bucket: str, key: str) -> bytes:
         raise
 
 
+def create_multipart_upload(
+    bucket: str,
+    key: str,
+    content_type: str = "application/octet-stream"
+) -> str:
+    """
+    Начать multipart-загрузку.
+
+    Args:
+        bucket: Имя бакета
+        key: Ключ (путь) объекта
+        content_type: MIME-тип контента
+
+    Returns:
+        UploadId multipart-загрузки
+    """
+    client = get_s3_client()
+
+    try:
+        response = client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+        logger.debug(f"Начата multipart-загрузка {bucket}/{key}: {response['UploadId']}")
+        return response["UploadId"]
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при создании multipart-загрузки {bucket}/{key}: {e}")
+        raise
+
+
+def upload_part(
+    bucket: str,
+    key: str,
+    upload_id: str,
+    part_number: int,
+    data: bytes
+) -> str:
+    """
+    Загрузить одну часть multipart-загрузки.
+
+    Args:
+        bucket: Имя бакета
+        key: Ключ (путь) объекта
+        upload_id: UploadId из create_multipart_upload
+        part_number: Номер части (с 1)
+        data: Данные части (все части, кроме последней, не меньше 5 MB)
+
+    Returns:
+        ETag загруженной части
+    """
+    client = get_s3_client()
+
+    try:
+        response = client.upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return response["ETag"]
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при загрузке части {part_number} {bucket}/{key}: {e}")
+        raise
+
+
+def complete_multipart_upload(
+    bucket: str,
+    key: str,
+    upload_id: str,
+    etags: List[str]
+) -> None:
+    """
+    Завершить multipart-загрузку.
+
+    Args:
+        bucket: Имя бакета
+        key: Ключ (путь) объекта
+        upload_id: UploadId из create_multipart_upload
+        etags: ETag частей в порядке номеров (1..N)
+    """
+    client = get_s3_client()
+
+    try:
+        client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [{"ETag": etag, "PartNumber": i} for i, etag in enumerate(etags, start=1)]
+            }
+        )
+        logger.info(f"Файл загружен в S3 (multipart, {len(etags)} частей): {bucket}/{key}")
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при завершении multipart-загрузки {bucket}/{key}: {e}")
+        raise
+
+
+def abort_multipart_upload(bucket: str, key: str, upload_id: str) -> None:
+    """
+    Отменить multipart-загрузку (удалить уже загруженные части).
+
+    Args:
+        bucket: Имя бакета
+        key: Ключ (путь) объекта
+        upload_id: UploadId из create_multipart_upload
+    """
+    client = get_s3_client()
+
+    try:
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        logger.info(f"Multipart-загрузка отменена: {bucket}/{key}")
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при отмене multipart-загрузки {bucket}/{key}: {e}")
+        raise
+
+
 def generate_presigned_url(
     bucket: str,
     key: str,
@@ -172,18 +370,10 @@ def save_task_state(prediction_id: str, state: dict) -> None:
     """
     key = f"tasks/{prediction_id}.json"
     
-    # Кастомный encoder для datetime объектов (на случай, если они все еще есть)
-    def json_serializer(obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat() + "Z"
-        raise TypeError(f"Type {type(obj)} not serializable")
-    
-    json_data = json.dumps(state, ensure_ascii=False, indent=2, default=json_serializer)
-    
     upload_to_s3(
         bucket=config.S3_BUCKET,
         key=key,
-        data=json_data.encode('utf-8'),
+        data=codec.dumps(state),
         content_type="application/json; charset=utf-8"
     )
 
@@ -202,7 +392,7 @@ def load_task_state(prediction_id: str) -> Optional[dict]:
     
     try:
         data = download_from_s3(bucket=config.S3_BUCKET, key=key)
-        state = json.loads(data.decode('utf-8'))
+        state = codec.loads(data)
         logger.info(f"Состояние задачи загружено: {prediction_id}")
         return state
     except ClientError as e:
@@ -227,7 +417,7 @@ def load_user_state(chat_id: int) -> Optional[dict]:
     key = f"users/{chat_id}.json"
     try:
         data = download_from_s3(bucket=config.S3_BUCKET, key=key)
-        state = json.loads(data.decode("utf-8"))
+        state = codec.loads(data)
         return state
     except ClientError as e:
         error_code = e.response.get("Error", {}).get("Code", "")
@@ -246,11 +436,10 @@ def save_user_state(chat_id: int, state: dict) -> None:
         state: Словарь с состоянием (например {"mode": "restoration"})
     """
     key = f"users/{chat_id}.json"
-    json_data = json.dumps(state, ensure_ascii=False, indent=2)
     upload_to_s3(
         bucket=config.S3_BUCKET,
         key=key,
-        data=json_data.encode("utf-8"),
+        data=codec.dumps(state),
         content_type="application/json; charset=utf-8",
     )
     logger.info(f"Состояние пользователя сохранено: users/{chat_id}.json")
@@ -272,3 +461,202 @@ def delete_object(bucket: str, key: str) -> None:
     except (ClientError, BotoCoreError) as e:
         logger.error(f"Ошибка при удалении объекта {bucket}/{key}: {e}")
         raise
+
+
+def delete_objects(bucket: str, keys: List[str]) -> None:
+    """
+    Удалить несколько объектов одним запросом (DeleteObjects, до 1000 ключей).
+
+    Args:
+        bucket: Имя бакета
+        keys: Ключи объектов
+    """
+    if not keys:
+        return
+    client = get_s3_client()
+
+    try:
+        response = client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при удалении объектов {bucket}/{keys}: {e}")
+        raise
+    errors = response.get("Errors") or []
+    if errors:
+        raise RuntimeError(f"Не удалось удалить объекты {bucket}: {errors}")
+    logger.info(f"Объекты удалены из S3: {bucket}/{keys}")
+
+
+def list_keys(bucket: str, prefix: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Ключи объектов под префиксом (постранично, по 1000 за запрос).
+
+    Args:
+        bucket: Имя бакета
+        prefix: Префикс ключей
+        limit: Максимум ключей (None — все)
+    """
+    client = get_s3_client()
+    keys: List[str] = []
+    # С лимитом — MaxKeys: одна страница нужного размера, а не 1000 ключей
+    pagination = {"PageSize": min(limit, 1000)} if limit else {}
+    try:
+        pages = client.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket, Prefix=prefix, PaginationConfig=pagination
+        )
+        for page in pages:
+            for obj in page.get("Contents", []):
+                keys.append(obj["Key"])
+                if limit is not None and len(keys) >= limit:
+                    return keys
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при получении списка {bucket}/{prefix}: {e}")
+        raise
+    return keys
+
+
+# Маркеры задач, ожидающих итог от Replicate
+INFLIGHT_PREFIX = "index/inflight/"
+
+
+# Маркеры задач чата: index/chats/{chat_id}/{обратная метка}_{prediction_id}_{status}_{mode}
+CHAT_INDEX_PREFIX = "index/chats/"
+# Обратная метка (10**10 - unix-время создания): LIST отдает новые задачи первыми
+_REVERSE_TS_BASE = 10 ** 10
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+
+def _chat_index_prefix(chat_id: int) -> str:
+    return f"{CHAT_INDEX_PREFIX}{chat_id}/"
+
+
+def _chat_index_key(chat_id: int, created_at: datetime, prediction_id: str, status: str, mode: Any) -> str:
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    reverse_ts = _REVERSE_TS_BASE - int(created_at.timestamp())
+    return f"{_chat_index_prefix(chat_id)}{reverse_ts:010d}_{prediction_id}_{status}_{mode or ''}"
+
+
+def _parse_chat_index_key(key: str) -> Optional[dict]:
+    """Запись истории из ключа маркера: {"id", "status", "mode", "created_at"}."""
+    # prediction_id (Replicate, uuid) без "_"; mode последним — в нем "_" допустим
+    parts = key.rsplit("/", 1)[-1].split("_", 3)
+    if len(parts) != 4 or not parts[0].isdigit():
+        return None
+    reverse_ts, prediction_id, status, mode = parts
+    created_at = datetime.fromtimestamp(_REVERSE_TS_BASE - int(reverse_ts), tz=timezone.utc)
+    return {"id": prediction_id, "status": status, "mode": mode or None, "created_at": _iso(created_at)}
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    """created_at задачи (datetime или строка ISO 8601 с "Z") → datetime."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+
+def _day_index_prefix(day: date) -> str:
+    return f"index/days/{day.year}/{day.month:02d}/{day.day:02d}/"
+
+
+def _iso(value: Any) -> Any:
+    """datetime → строка ISO 8601 с "Z" (как в документах задач), прочее — как есть."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.replace(tzinfo=None).isoformat() + "Z"
+    return value
+
+
+def list_chat_index(chat_id: int, limit: Optional[int] = None) -> List[dict]:
+    """
+    Последние задачи чата по ключам маркеров (один LIST с MaxKeys=limit, без GET).
+
+    Args:
+        limit: Сколько последних задач (None — все)
+
+    Returns:
+        Записи {"id", "status", "mode", "created_at"}, новые первыми
+    """
+    entries = (_parse_chat_index_key(key) for key in list_keys(config.S3_BUCKET, _chat_index_prefix(chat_id), limit=limit))
+    return [entry for entry in entries if entry]
+
+
+def task_index_changes(state: dict) -> Tuple[List[str], List[str]]:
+    """
+    Изменения вторичных индексов задачи при save_task_state: (ключи пустых
+    маркеров для записи, ключи для удаления). Запросы выполняет
+    s3_async.save_task_state — параллельно, удаления одним DeleteObjects.
+
+    - index/chats/{chat_id}/{10**10 - unix-время создания}_{prediction_id}_{status}_{mode}
+      — маркер задачи чата, все поля истории в ключе: /history — один LIST без GET.
+      Пишется при создании; на итоговом статусе маркер queued заменяется итоговым
+      (processing маркер не трогает — в истории задача остается «в очереди»).
+      У каждой задачи свои ключи, поэтому экземпляры не перетирают записи друг друга;
+    - index/days/{yyyy}/{mm}/{dd}/{prediction_id} — при создании задачи:
+      задачи дня — LIST одного префикса, без обхода tasks/;
+    - index/inflight/{prediction_id} — маркер задачи в Replicate: ставится при создании,
+      снимается на итоговом статусе (счетчик для src/services/admission.py).
+
+    Индексы вторичны: источник истины — tasks/{prediction_id}.json.
+    """
+    chat_id = state.get("chat_id")
+    prediction_id = state.get("prediction_id")
+    created_at = _as_datetime(state.get("created_at"))
+    status = state.get("status")
+    puts: List[str] = []
+    deletes: List[str] = []
+    if chat_id is None or not prediction_id:
+        return puts, deletes
+    mode = state.get("mode")
+    if status == "queued":
+        puts.append(f"{INFLIGHT_PREFIX}{prediction_id}")
+        if created_at:
+            puts.append(_chat_index_key(chat_id, created_at, prediction_id, status, mode))
+            puts.append(f"{_day_index_prefix(created_at)}{prediction_id}")
+    elif status in TERMINAL_STATUSES:
+        deletes.append(f"{INFLIGHT_PREFIX}{prediction_id}")
+        if created_at:
+            puts.append(_chat_index_key(chat_id, created_at, prediction_id, status, mode))
+            deletes.append(_chat_index_key(chat_id, created_at, prediction_id, "queued", mode))
+    return puts, deletes
+
+
+def list_day_tasks(day: date) -> List[str]:
+    """prediction_id задач, созданных в указанный день (UTC), по маркерам index/days/."""
+    prefix = _day_index_prefix(day)
+    return [key[len(prefix):] for key in list_keys(config.S3_BUCKET, prefix)]
+
+
+def list_inflight_tasks(
+    max_age_seconds: Optional[int] = None,
+    min_age_seconds: Optional[int] = None,
+) -> List[str]:
+    """
+    prediction_id задач в полете (маркеры index/inflight/).
+
+    Args:
+        max_age_seconds: Маркеры старше считаются потерянными (вебхук не пришел) и не учитываются
+        min_age_seconds: Только маркеры не моложе (кандидаты на сверку с Replicate)
+    """
+    client = get_s3_client()
+    now = datetime.now(timezone.utc)
+    oldest = now - timedelta(seconds=max_age_seconds) if max_age_seconds else None
+    newest = now - timedelta(seconds=min_age_seconds) if min_age_seconds else None
+    ids: List[str] = []
+    try:
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=config.S3_BUCKET, Prefix=INFLIGHT_PREFIX):
+            for obj in page.get("Contents", []):
+                modified = obj.get("LastModified")
+                if modified is not None:
+                    if oldest is not None and modified < oldest:
+                        continue
+                    if newest is not None and modified > newest:
+                        continue
+                ids.append(obj["Key"][len(INFLIGHT_PREFIX):])
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Ошибка при получении списка {config.S3_BUCKET}/{INFLIGHT_PREFIX}: {e}")
+        raise
+    return ids
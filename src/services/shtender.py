@@ -4,7 +4,13 @@
 """
 import io
 import logging
-from typing import Optional, Tuple
+import math
+import os
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
 
 import cv2
 import httpx
@@ -24,55 +30,304 @@ class FaceNotFoundError(Exception):
 # Замерено по assets/shtender_template.png: левый верх (138, 205), правый низ (1061, 1335).
 TEMPLATE_PHOTO_RECT_PX = (138, 205, 923, 1130)
 FACE_CROP_PADDING = 0.4
+HAAR_CASCADE_PATH = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+# Модель YuNet (OpenCV Zoo, face_detection_yunet_2023mar.onnx) — в assets/, см. scripts/fetch_yunet.py
+YUNET_MODEL_PATH = "assets/face_detection_yunet_2023mar.onnx"
+FACE_DETECTOR_BACKENDS = ("haar", "yunet")
+PDF_WRITERS = ("pil", "direct")
+# Разрешение страницы PDF (пикселей шаблона на дюйм) и качество JPEG по умолчанию (как у PIL)
+PDF_RESOLUTION = 100.0
+PDF_JPEG_QUALITY = 75
 
 
-def _load_photo(photo_source: str) -> Image.Image:
-    """Загрузить фото из пути к файлу или по URL. Возвращает PIL Image в RGB."""
+def _read_photo_source(photo_source: str) -> Union[str, bytes]:
+    """Путь к файлу оставить как есть, URL — скачать в память (для повторного открытия)."""
     if photo_source.strip().lower().startswith(("http://", "https://")):
         with httpx.Client(timeout=30.0) as client:
             resp = client.get(photo_source)
             resp.raise_for_status()
-            data = resp.content
-        img = Image.open(io.BytesIO(data)).convert("RGB")
-    else:
-        img = Image.open(photo_source).convert("RGB")
+            return resp.content
+    return photo_source
+
+
+def _decode_photo(
+    source: Union[str, bytes],
+    min_size: Optional[Tuple[int, int]] = None,
+) -> Tuple[Image.Image, float]:
+    """
+    Декодировать фото в RGB.
+
+    Для JPEG с min_size используется draft-режим PIL: масштабирование в DCT-домене
+    (1/2, 1/4, 1/8) до наименьшего размера, который не меньше min_size по обеим
+    сторонам. Для остальных форматов и без min_size — полное декодирование.
+
+    Returns:
+        (изображение RGB, масштаб относительно оригинала: ширина декода / ширина оригинала)
+    """
+    img = Image.open(io.BytesIO(source)) if isinstance(source, bytes) else Image.open(source)
+    full_w = img.size[0]
+    if min_size is not None and img.format == "JPEG":
+        img.draft("RGB", min_size)
+    img = img.convert("RGB")
+    return img, img.size[0] / full_w
+
+
+def _load_photo(photo_source: str) -> Image.Image:
+    """Загрузить фото из пути к файлу или по URL. Возвращает PIL Image в RGB."""
+    img, _ = _decode_photo(_read_photo_source(photo_source))
     return img
 
 
-def _detect_face(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+@dataclass(frozen=True)
+class FaceDetectionParams:
     """
-    Найти одно лицо на изображении (самое большое по площади).
-    Возвращает (x, y, w, h) в пикселях или None.
+    Параметры детекции лица (Haar detectMultiScale + двухэтапный поиск).
+
+    coarse_max_side: длинная сторона уменьшенной копии для грубого поиска;
+        0 — искать сразу на полном изображении (одноэтапно, как раньше).
+    roi_padding: отступ вокруг найденного лица (доля от его размера) для уточнения
+        на полном разрешении.
+    full_scan_fallback: если на уменьшенной копии лицо не найдено — искать на полном
+        изображении (мелкие лица), прежде чем считать, что лица нет.
     """
-    gray = np.array(image.convert("L"))
-    cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    faces = face_cascade.detectMultiScale(
-        gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
-    )
+
+    scale_factor: float = 1.1
+    min_neighbors: int = 5
+    min_size: int = 30
+    coarse_max_side: int = 480
+    roi_padding: float = 0.5
+    full_scan_fallback: bool = True
+
+
+DEFAULT_DETECTION_PARAMS = FaceDetectionParams()
+
+
+def _largest(faces) -> Optional[Tuple[int, int, int, int]]:
+    """Самый большой по площади bbox из результата detectMultiScale или None."""
     if len(faces) == 0:
         return None
     areas = [w * h for (_, _, w, h) in faces]
-    i = int(np.argmax(areas))
-    x, y, w, h = faces[i]
+    x, y, w, h = faces[int(np.argmax(areas))]
     return (int(x), int(y), int(w), int(h))
 
 
-def _crop_around_face(
+def _detect_face(
     image: Image.Image,
+    cascade: Optional["cv2.CascadeClassifier"] = None,
+    params: FaceDetectionParams = DEFAULT_DETECTION_PARAMS,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Найти одно лицо на изображении (самое большое по площади).
+    Возвращает (x, y, w, h) в пикселях или None.
+
+    Двухэтапно: грубый поиск на копии с длинной стороной params.coarse_max_side,
+    затем уточнение самого большого лица в окрестности (ROI) на полном разрешении.
+    """
+    gray = np.array(image.convert("L"))
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+
+    def detect(img: np.ndarray, min_side: int, max_side: int = 0):
+        min_side = max(1, int(min_side))
+        return cascade.detectMultiScale(
+            img,
+            scaleFactor=params.scale_factor,
+            minNeighbors=params.min_neighbors,
+            minSize=(min_side, min_side),
+            maxSize=(max_side, max_side) if max_side else (0, 0),
+        )
+
+    height, width = gray.shape
+    k = params.coarse_max_side / max(width, height) if params.coarse_max_side else 1.0
+    if k >= 1.0:
+        return _largest(detect(gray, params.min_size))
+
+    small = cv2.resize(gray, (max(1, round(width * k)), max(1, round(height * k))), interpolation=cv2.INTER_AREA)
+    coarse = _largest(detect(small, params.min_size * k))
+    if coarse is None:
+        if params.full_scan_fallback:
+            return _largest(detect(gray, params.min_size))
+        return None
+
+    # Перевести грубый bbox в координаты оригинала и уточнить в ROI
+    cx, cy, cw, ch = (int(round(v / k)) for v in coarse)
+    pad = int(max(cw, ch) * params.roi_padding)
+    x1, y1 = max(0, cx - pad), max(0, cy - pad)
+    x2, y2 = min(width, cx + cw + pad), min(height, cy + ch + pad)
+    roi = gray[y1:y2, x1:x2]
+    refined = _largest(detect(roi, max(params.min_size, min(cw, ch) // 2), max_side=min(roi.shape)))
+    if refined is None:
+        return (cx, cy, cw, ch)
+    rx, ry, rw, rh = refined
+    return (x1 + rx, y1 + ry, rw, rh)
+
+
+class FaceDetector:
+    """
+    Детектор лица для штендера. Реализации должны быть безопасны для вызова
+    из нескольких потоков (один экземпляр на ShtenderRenderer).
+    """
+
+    name = "base"
+
+    def detect(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        """Найти самое большое лицо на изображении RGB: (x, y, w, h) или None."""
+        raise NotImplementedError
+
+
+class HaarFaceDetector(FaceDetector):
+    """Каскад Haar (frontalface_default) с двухэтапным поиском, см. _detect_face."""
+
+    name = "haar"
+
+    def __init__(
+        self,
+        cascade_path: str = HAAR_CASCADE_PATH,
+        params: FaceDetectionParams = DEFAULT_DETECTION_PARAMS,
+    ):
+        self.cascade_path = cascade_path
+        self.params = params
+        self._local = threading.local()
+        # Разобрать каскад сразу: ошибка пути проявится при создании, а не на первом фото
+        self._get_cascade()
+
+    def _get_cascade(self) -> "cv2.CascadeClassifier":
+        """Каскад Haar текущего потока (CascadeClassifier не потокобезопасен)."""
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+            if cascade.empty():
+                raise RuntimeError(f"Не удалось загрузить каскад Haar: {self.cascade_path}")
+            self._local.cascade = cascade
+        return cascade
+
+    def detect(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        return _detect_face(image, self._get_cascade(), self.params)
+
+
+class YuNetFaceDetector(FaceDetector):
+    """
+    CNN-детектор YuNet (cv2.FaceDetectorYN, OpenCV DNN на CPU).
+
+    Сеть сама находит лица разного масштаба, поэтому поиск одноэтапный: на копии
+    с длинной стороной params.coarse_max_side (0 — на полном изображении), bbox
+    пересчитывается в координаты оригинала. Экземпляр модели — один на поток.
+    """
+
+    name = "yunet"
+
+    def __init__(
+        self,
+        model_path: str = YUNET_MODEL_PATH,
+        params: FaceDetectionParams = DEFAULT_DETECTION_PARAMS,
+        score_threshold: float = 0.7,
+        nms_threshold: float = 0.3,
+    ):
+        if not hasattr(cv2, "FaceDetectorYN"):
+            raise RuntimeError("Для YuNet нужен OpenCV >= 4.5.4 (cv2.FaceDetectorYN)")
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(
+                f"Модель YuNet не найдена: {model_path} (скачать: python -m scripts.fetch_yunet)"
+            )
+        self.model_path = model_path
+        self.params = params
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self._local = threading.local()
+        # Загрузить модель сразу: битый файл проявится при создании, а не на первом фото
+        self._get_model((320, 320))
+
+    def _get_model(self, input_size: Tuple[int, int]) -> "cv2.FaceDetectorYN":
+        """Модель текущего потока с заданным размером входа (ширина, высота)."""
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = cv2.FaceDetectorYN.create(
+                self.model_path,
+                "",
+                input_size,
+                self.score_threshold,
+                self.nms_threshold,
+                5000,
+                cv2.dnn.DNN_BACKEND_OPENCV,
+                cv2.dnn.DNN_TARGET_CPU,
+            )
+            self._local.model = model
+        model.setInputSize(input_size)
+        return model
+
+    def detect(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        bgr = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+        height, width = bgr.shape[:2]
+        k = self.params.coarse_max_side / max(width, height) if self.params.coarse_max_side else 1.0
+        if k < 1.0:
+            bgr = cv2.resize(bgr, (max(1, round(width * k)), max(1, round(height * k))), interpolation=cv2.INTER_AREA)
+        else:
+            k = 1.0
+        _, faces = self._get_model((bgr.shape[1], bgr.shape[0])).detect(bgr)
+        if faces is None or len(faces) == 0:
+            return None
+
+        min_side = self.params.min_size * k
+        faces = [f for f in faces if min(f[2], f[3]) >= min_side]
+        if not faces:
+            return None
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])[:4]
+        # Перевести в координаты оригинала и обрезать по границам изображения
+        x1, y1 = max(0, int(round(x / k))), max(0, int(round(y / k)))
+        x2, y2 = min(width, int(round((x + w) / k))), min(height, int(round((y + h) / k)))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return (x1, y1, x2 - x1, y2 - y1)
+
+
+def create_face_detector(
+    backend: str = "haar",
+    detection: FaceDetectionParams = DEFAULT_DETECTION_PARAMS,
+    yunet_model_path: str = YUNET_MODEL_PATH,
+) -> FaceDetector:
+    """
+    Создать детектор лица по имени бэкенда.
+
+    Args:
+        backend: "haar" или "yunet" (см. FACE_DETECTOR_BACKENDS).
+        detection: Параметры детекции.
+        yunet_model_path: Путь к ONNX-модели YuNet.
+
+    Raises:
+        ValueError: Неизвестный бэкенд.
+        FileNotFoundError: Нет файла модели YuNet.
+    """
+    if backend == "haar":
+        return HaarFaceDetector(params=detection)
+    if backend == "yunet":
+        return YuNetFaceDetector(model_path=yunet_model_path, params=detection)
+    raise ValueError(f"Неизвестный детектор лица: {backend} (доступны: {', '.join(FACE_DETECTOR_BACKENDS)})")
+
+
+def _face_crop_box(
+    image_size: Tuple[int, int],
     bbox: Tuple[int, int, int, int],
     padding_frac: float = FACE_CROP_PADDING,
-) -> Image.Image:
-    """Обрезать область вокруг лица с отступами. bbox = (x, y, w, h)."""
+) -> Tuple[int, int, int, int]:
+    """Область вокруг лица с отступами (x1, y1, x2, y2). bbox = (x, y, w, h)."""
     x, y, w, h = bbox
-    W, H = image.size
+    W, H = image_size
     pad_w = max(1, int(w * padding_frac))
     pad_h = max(1, int(h * padding_frac))
     x1 = max(0, x - pad_w)
     y1 = max(0, y - pad_h)
     x2 = min(W, x + w + pad_w)
     y2 = min(H, y + h + pad_h)
-    return image.crop((x1, y1, x2, y2))
+    return (x1, y1, x2, y2)
+
+
+def _crop_around_face(
+    image: Image.Image,
+    bbox: Tuple[int, int, int, int],
+    padding_frac: float = FACE_CROP_PADDING,
+) -> Image.Image:
+    """Обрезать область вокруг лица с отступами. bbox = (x, y, w, h)."""
+    return image.crop(_face_crop_box(image.size, bbox, padding_frac))
 
 
 def _resize_fill(image: Image.Image, target_w: int, target_h: int) -> Image.Image:
@@ -96,6 +351,340 @@ def _get_template_photo_rect(template: Image.Image) -> Tuple[int, int, int, int]
     return TEMPLATE_PHOTO_RECT_PX
 
 
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    """Сжать RGB-изображение в JPEG (baseline, оптимизированные таблицы Хаффмана)."""
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+class PdfWriter:
+    """Сборка PDF-страницы штендера из шаблона и фото, уже подогнанного под рамку."""
+
+    name = "base"
+
+    def write(self, photo: Image.Image) -> bytes:
+        """Вернуть bytes PDF: шаблон с фото (размер рамки) в прямоугольнике под фото."""
+        raise NotImplementedError
+
+
+class PilPdfWriter(PdfWriter):
+    """
+    Фото вклеивается в копию шаблона, страница целиком сохраняется через PDF-плагин
+    PIL (вся страница кодируется в JPEG на каждый рендер).
+    """
+
+    name = "pil"
+
+    def __init__(
+        self,
+        template: Image.Image,
+        photo_rect: Tuple[int, int, int, int],
+        resolution: float = PDF_RESOLUTION,
+    ):
+        self._template = template
+        self.photo_rect = photo_rect
+        self.resolution = resolution
+
+    def write(self, photo: Image.Image) -> bytes:
+        page = self._template.copy()
+        page.paste(photo, self.photo_rect[:2])
+        buf = io.BytesIO()
+        page.save(buf, format="PDF", resolution=self.resolution)
+        return buf.getvalue()
+
+
+class DirectPdfWriter(PdfWriter):
+    """
+    PDF собирается вручную: шаблон кодируется в image XObject один раз при создании,
+    на каждый рендер в JPEG сжимается только фото и дописывается вторым XObject,
+    который рисуется поверх шаблона в прямоугольнике под фото.
+
+    Рамка под фото на шаблоне перед кодированием заливается белым (ее все равно
+    закрывает фото). Шаблон кодируется палитрой на 256 цветов с Flate (для плоской
+    графики и текста это и меньше, и точнее JPEG), если она не уступает JPEG того же
+    качества по размеру и PSNR; иначе — JPEG.
+
+    Все объекты, кроме фото, и содержимое страницы заранее собраны в префикс;
+    рендер добавляет к нему объект фото, таблицу xref и trailer.
+    """
+
+    name = "direct"
+
+    def __init__(
+        self,
+        template: Image.Image,
+        photo_rect: Tuple[int, int, int, int],
+        resolution: float = PDF_RESOLUTION,
+        quality: int = PDF_JPEG_QUALITY,
+    ):
+        self.photo_rect = photo_rect
+        self.resolution = resolution
+        self.quality = quality
+
+        k = 72.0 / resolution
+        page_w, page_h = template.size[0] * k, template.size[1] * k
+        x, y, w, h = photo_rect
+        # В PDF ось Y направлена вверх: нижний левый угол рамки
+        content = (
+            f"q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Tpl Do Q\n"
+            f"q {w * k:.2f} 0 0 {h * k:.2f} {x * k:.2f} {(template.size[1] - y - h) * k:.2f} cm /Ph Do Q\n"
+        ).encode("ascii")
+
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] "
+                f"/Resources << /XObject << /Tpl 4 0 R /Ph 6 0 R >> >> /Contents 5 0 R >>"
+            ).encode("ascii"),
+            self._template_object(template, photo_rect, quality),
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        ]
+        prefix = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._offsets = []
+        for number, body in enumerate(objects, start=1):
+            self._offsets.append(len(prefix))
+            prefix += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        self._prefix = bytes(prefix)
+
+    @classmethod
+    def _template_object(
+        cls,
+        template: Image.Image,
+        photo_rect: Tuple[int, int, int, int],
+        quality: int,
+    ) -> bytes:
+        """Image XObject шаблона: палитра + Flate или JPEG (что меньше без потери качества)."""
+        x, y, w, h = photo_rect
+        template = template.copy()
+        template.paste((255, 255, 255), (x, y, x + w, y + h))
+        original = np.asarray(template, dtype=np.float32)
+
+        def psnr(image: Image.Image) -> float:
+            mse = float(np.mean((original - np.asarray(image.convert("RGB"), dtype=np.float32)) ** 2))
+            return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+        jpeg = _encode_jpeg(template, quality)
+        indexed = template.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        flate = zlib.compress(indexed.tobytes(), 9)
+        if len(flate) > len(jpeg) or psnr(indexed) < psnr(Image.open(io.BytesIO(jpeg))):
+            logger.debug("Шаблон PDF: JPEG, %d байт", len(jpeg))
+            return cls._image_object(template.size, jpeg)
+
+        palette = indexed.getpalette()[: 3 * (int(np.asarray(indexed).max()) + 1)]
+        logger.debug("Шаблон PDF: палитра %d цветов + Flate, %d байт", len(palette) // 3, len(flate))
+        return (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+            b"/ColorSpace [/Indexed /DeviceRGB %d <%s>] /BitsPerComponent 8 "
+            b"/Filter /FlateDecode /Length %d >>\nstream\n"
+            % (template.size[0], template.size[1], len(palette) // 3 - 1, bytes(palette).hex().encode("ascii"), len(flate))
+            + flate
+            + b"\nendstream"
+        )
+
+    @staticmethod
+    def _image_object(size: Tuple[int, int], jpeg: bytes) -> bytes:
+        """Image XObject с JPEG-потоком (DCTDecode)."""
+        return (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n"
+            % (size[0], size[1], len(jpeg))
+            + jpeg
+            + b"\nendstream"
+        )
+
+    def write(self, photo: Image.Image) -> bytes:
+        out = bytearray(self._prefix)
+        offsets = self._offsets + [len(out)]
+        out += b"6 0 obj\n" + self._image_object(photo.size, _encode_jpeg(photo, self.quality)) + b"\nendobj\n"
+        xref_offset = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref_offset)
+        return bytes(out)
+
+
+def create_pdf_writer(
+    name: str,
+    template: Image.Image,
+    photo_rect: Tuple[int, int, int, int],
+) -> PdfWriter:
+    """
+    Создать сборщик PDF по имени.
+
+    Args:
+        name: "pil" или "direct" (см. PDF_WRITERS).
+        template: Шаблон в RGB.
+        photo_rect: Прямоугольник под фото (x, y, width, height).
+
+    Raises:
+        ValueError: Неизвестный сборщик.
+    """
+    if name == "pil":
+        return PilPdfWriter(template, photo_rect)
+    if name == "direct":
+        return DirectPdfWriter(template, photo_rect)
+    raise ValueError(f"Неизвестный сборщик PDF: {name} (доступны: {', '.join(PDF_WRITERS)})")
+
+
+class ShtenderRenderer:
+    """
+    Переиспользуемый генератор штендеров.
+
+    Шаблон декодируется один раз и хранится в сборщике PDF (pil — готовым к копированию,
+    direct — уже сжатым в поток PDF, см. PdfWriter); детектор лица
+    (по умолчанию каскад Haar, см. FaceDetector) держит свою модель на каждый поток,
+    поэтому один экземпляр можно вызывать из asyncio.to_thread и пулов потоков.
+
+    При reduced_decode=True JPEG декодируется в уменьшенном масштабе (см. _decode_photo):
+    сначала так, чтобы снимок целиком покрывал рамку шаблона, а если кадр вокруг лица
+    после этого оказывается меньше рамки — повторно, в масштабе, достаточном для кадра.
+    Полное декодирование — только когда кадру нужно исходное разрешение.
+    """
+
+    def __init__(
+        self,
+        template_path: str,
+        cascade_path: str = HAAR_CASCADE_PATH,
+        reduced_decode: bool = True,
+        detection: FaceDetectionParams = DEFAULT_DETECTION_PARAMS,
+        detector: Optional[FaceDetector] = None,
+        pdf_writer: str = "pil",
+    ):
+        self.template_path = template_path
+        self.reduced_decode = reduced_decode
+        self.detection = detection
+        template = Image.open(template_path).convert("RGB")
+        template.load()
+        self.photo_rect = _get_template_photo_rect(template)
+        self.pdf_writer = create_pdf_writer(pdf_writer, template, self.photo_rect)
+        # По умолчанию — каскад Haar; другой бэкенд передается готовым (create_face_detector)
+        self.detector = detector or HaarFaceDetector(cascade_path, detection)
+
+    def detect_face(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        """Найти самое большое лицо на изображении: (x, y, w, h) или None."""
+        return self.detector.detect(image)
+
+    def render(
+        self,
+        photo_source: str,
+        output_path: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> bytes:
+        """
+        Собрать штендер: загрузить фото, найти лицо, вставить в шаблон, экспорт в PDF.
+
+        Args:
+            photo_source: Путь к файлу (jpg/png) или URL фото.
+            output_path: Если задан — дополнительно записать PDF в файл.
+            timings: Если задан — сюда пишется длительность этапов в секундах
+                (load, detect, compose, pdf).
+
+        Returns:
+            bytes PDF.
+
+        Raises:
+            FaceNotFoundError: На фото не обнаружено лицо.
+        """
+        rect_w, rect_h = self.photo_rect[2:]
+        stage_started = time.perf_counter()
+
+        def mark(stage: str) -> None:
+            nonlocal stage_started
+            now = time.perf_counter()
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + (now - stage_started)
+            stage_started = now
+
+        source = _read_photo_source(photo_source)
+        photo, scale = _decode_photo(source, (rect_w, rect_h) if self.reduced_decode else None)
+        mark("load")
+        bbox = self.detect_face(photo)
+        mark("detect")
+
+        if bbox is None:
+            logger.warning("Лицо на фото не найдено")
+            raise FaceNotFoundError("На фото не обнаружено лицо. Отправьте фото, где чётко видно лицо.")
+
+        x1, y1, x2, y2 = _face_crop_box(photo.size, bbox)
+        # Масштаб, при котором кадр вокруг лица покрывает рамку шаблона без апскейла
+        needed_scale = min(1.0, scale * max(rect_w / (x2 - x1), rect_h / (y2 - y1)))
+        if scale < needed_scale:
+            full_w, full_h = photo.size[0] / scale, photo.size[1] / scale
+            photo, new_scale = _decode_photo(
+                source,
+                (math.ceil(full_w * needed_scale), math.ceil(full_h * needed_scale)),
+            )
+            k = new_scale / scale
+            x1, y1 = int(x1 * k), int(y1 * k)
+            x2, y2 = min(photo.size[0], int(math.ceil(x2 * k))), min(photo.size[1], int(math.ceil(y2 * k)))
+            scale = new_scale
+            mark("load")
+        logger.debug("Масштаб декодирования фото: %.3f", scale)
+
+        photo_crop = photo.crop((x1, y1, x2, y2))
+        logger.info("Лицо найдено, кадрирование по лицу")
+
+        photo_resized = _resize_fill(photo_crop, rect_w, rect_h)
+        mark("compose")
+
+        pdf_bytes = self.pdf_writer.write(photo_resized)
+        mark("pdf")
+
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(pdf_bytes)
+            logger.info("PDF записан: %s", output_path)
+
+        return pdf_bytes
+
+
+# Общие экземпляры по шаблону, детектору и его параметрам (для logic.py, CLI и воркеров)
+_renderers: Dict[Tuple[str, str, str, FaceDetectionParams, str], ShtenderRenderer] = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(
+    template_path: str,
+    detection: FaceDetectionParams = DEFAULT_DETECTION_PARAMS,
+    backend: str = "haar",
+    yunet_model_path: str = YUNET_MODEL_PATH,
+    pdf_writer: str = "pil",
+) -> ShtenderRenderer:
+    """
+    Получить общий ShtenderRenderer для шаблона (создается при первом обращении).
+
+    Args:
+        template_path: Путь к PNG-шаблону.
+        detection: Параметры детекции лица.
+        backend: Детектор лица, см. create_face_detector.
+        yunet_model_path: Путь к ONNX-модели YuNet (для backend="yunet").
+        pdf_writer: Сборщик PDF, см. create_pdf_writer.
+
+    Returns:
+        Экземпляр ShtenderRenderer, общий для всего процесса.
+    """
+    model_key = os.path.abspath(yunet_model_path) if backend == "yunet" else ""
+    key = (os.path.abspath(template_path), backend, model_key, detection, pdf_writer)
+    renderer = _renderers.get(key)
+    if renderer is None:
+        with _renderers_lock:
+            renderer = _renderers.get(key)
+            if renderer is None:
+                detector = create_face_detector(backend, detection, yunet_model_path)
+                renderer = ShtenderRenderer(
+                    template_path, detection=detection, detector=detector, pdf_writer=pdf_writer
+                )
+                _renderers[key] = renderer
+                logger.info(
+                    "Шаблон штендера загружен: %s, детектор лица: %s, PDF: %s",
+                    template_path, backend, pdf_writer,
+                )
+    return renderer
+
+
 def build_shtender_pdf(
     template_path: str,
     photo_source: str,
@@ -105,6 +694,7 @@ def build_shtender_pdf(
     Собрать штендер: загрузить фото, найти лицо, вставить в шаблон, экспорт в PDF.
 
     Если лицо на фото не найдено, выбрасывается FaceNotFoundError — штендер не создаётся.
+    Использует общий ShtenderRenderer (см. get_renderer).
 
     Args:
         template_path: Путь к PNG-шаблону.
@@ -117,29 +707,4 @@ def build_shtender_pdf(
     Raises:
         FaceNotFoundError: На фото не обнаружено лицо.
     """
-    template = Image.open(template_path).convert("RGB")
-    rect_x, rect_y, rect_w, rect_h = _get_template_photo_rect(template)
-
-    photo = _load_photo(photo_source)
-    bbox = _detect_face(photo)
-
-    if bbox is None:
-        logger.warning("Лицо на фото не найдено")
-        raise FaceNotFoundError("На фото не обнаружено лицо. Отправьте фото, где чётко видно лицо.")
-
-    photo_crop = _crop_around_face(photo, bbox)
-    logger.info("Лицо найдено, кадрирование по лицу")
-
-    photo_resized = _resize_fill(photo_crop, rect_w, rect_h)
-    template.paste(photo_resized, (rect_x, rect_y))
-
-    buf = io.BytesIO()
-    template.save(buf, format="PDF", resolution=100.0)
-    pdf_bytes = buf.getvalue()
-
-    if output_path:
-        with open(output_path, "wb") as f:
-            f.write(pdf_bytes)
-        logger.info("PDF записан: %s", output_path)
-
-    return pdf_bytes
+    return get_renderer(template_path).render(photo_source, output_path=output_path)
@@ -1,17 +1,101 @@
 """
 Сервис для взаимодействия с Telegram Bot API.
 """
+import json
 import logging
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, Optional, Tuple
 import httpx
 
 from src.config import config
-from src.utils.http import make_request
+from src.utils.http import RETRY_STATUSES, make_request, get_http_client, download_url
+from src.utils.rate_limit import RateLimiter
 
 logger = logging.getLogger(__name__)
 
-# Базовый URL для Telegram Bot API
-TELEGRAM_API_BASE = "https://api.telegram.org/bot"
+# Базовый URL для Telegram Bot API (TG_API_BASE_URL — например, локальный Bot API сервер)
+TELEGRAM_API_BASE = f"{config.TG_API_BASE_URL}/bot"
+# Базовый URL для скачивания файлов
+TELEGRAM_FILE_BASE = f"{config.TG_API_BASE_URL}/file/bot"
+
+# Максимум элементов в одном sendMediaGroup
+MEDIA_GROUP_MAX_ITEMS = 10
+
+# 429 от Telegram обрабатывает планировщик отправок (retry_after), а не слепой backoff
+SEND_RETRY_STATUSES = tuple(s for s in RETRY_STATUSES if s != 429)
+
+# Планировщик исходящих сообщений: общий лимит бота + лимит на чат
+rate_limiter = RateLimiter(
+    "telegram",
+    rate=config.TG_RATE_LIMIT_PER_SECOND,
+    burst=config.TG_RATE_LIMIT_BURST,
+    key_rate=config.TG_CHAT_RATE_LIMIT_PER_SECOND,
+    key_burst=config.TG_CHAT_RATE_LIMIT_BURST,
+)
+
+
+def _retry_after(response: httpx.Response) -> float:
+    """Пауза из ответа 429: parameters.retry_after, заголовок Retry-After или 1 с."""
+    try:
+        value = response.json().get("parameters", {}).get("retry_after")
+        if value is not None:
+            return float(value)
+    except Exception:
+        pass
+    try:
+        return float(response.headers.get("retry-after", 1))
+    except ValueError:
+        return 1.0
+
+
+async def _send(chat_id: Optional[int], request: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+    """
+    Выполнить отправку через планировщик: дождаться слота в общей и в чатовой
+    корзине; на 429 — отложить чат на retry_after и повторить.
+    """
+    max_retries = max(0, config.TG_RATE_LIMIT_MAX_RETRIES)
+    attempt = 0
+    while True:
+        await rate_limiter.acquire(chat_id)
+        try:
+            return await request()
+        except httpx.HTTPStatusError as e:
+            if e.response is None or e.response.status_code != 429 or attempt >= max_retries:
+                raise
+            retry_after = _retry_after(e.response)
+            if retry_after > config.TG_RATE_LIMIT_MAX_RETRY_AFTER:
+                logger.error(f"Telegram 429 для чата {chat_id}: retry_after={retry_after:.0f}с, запрос не повторяется")
+                raise
+            attempt += 1
+            logger.warning(
+                f"Telegram 429 для чата {chat_id}, повтор {attempt}/{max_retries} через {retry_after:.1f}с"
+            )
+            rate_limiter.penalize(chat_id, retry_after)
+
+
+async def _post_json(chat_id: Optional[int], url: str, payload: Dict[str, Any], timeout: float = 10.0) -> Dict[str, Any]:
+    """POST JSON-метода Bot API через планировщик отправок."""
+    response = await _send(
+        chat_id,
+        lambda: make_request("POST", url, json=payload, timeout=timeout, retry_on=SEND_RETRY_STATUSES),
+    )
+    return response.json()
+
+
+async def _post_multipart(
+    chat_id: int,
+    url: str,
+    files: Dict[str, Any],
+    data: Dict[str, Any],
+    timeout: float = 30.0,
+) -> Dict[str, Any]:
+    """POST multipart/form-data (загрузка файла) через планировщик отправок."""
+    async def request() -> httpx.Response:
+        response = await get_http_client().post(url, files=files, data=data, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    response = await _send(chat_id, request)
+    return response.json()
 
 
 async def send_message(
@@ -43,13 +127,7 @@ async def send_message(
         payload["reply_markup"] = reply_markup
 
     try:
-        response = await make_request(
-            "POST",
-            url,
-            json=payload,
-            timeout=10.0,
-        )
-        return response.json()
+        return await _post_json(chat_id, url, payload)
     except Exception as e:
         logger.error(f"Ошибка при отправке сообщения в Telegram: {e}")
         raise
@@ -80,77 +158,15 @@ async def send_photo(
     # Это необходимо, т.к. Telegram не может получить доступ к presigned URL от MinIO
     if photo.startswith(("http://", "https://")):
         try:
-            # Скачать изображение
-            # Важно: многие CDN/хранилища отдают 302/301 на реальный файл.
-            # По умолчанию httpx НЕ следует редиректам, из-за чего можно скачать не картинку,
-            # а HTML/redirect-заглушку, и Telegram вернет 400 на sendPhoto.
-            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                image_response = await client.get(photo)
-                image_response.raise_for_status()
-                image_data = image_response.content
-                image_content_type = (image_response.headers.get("content-type") or "").split(";")[0].strip().lower()
-                if not image_content_type:
-                    image_content_type = "application/octet-stream"
-            
-            # Определить имя файла из URL или использовать дефолтное
-            filename = "photo.jpg"
-            if ".jpg" in photo.lower() or ".jpeg" in photo.lower():
-                filename = "photo.jpg"
-            elif ".png" in photo.lower():
-                filename = "photo.png"
-
-            # Если формат/размер подозрительные — отправим как документ (Telegram менее строгий).
-            size_mb = len(image_data) / (1024 * 1024) if image_data else 0.0
-            should_send_as_document = False
-            if image_content_type not in ("image/jpeg", "image/png"):
-                # Входные форматы у нас ограничены, а вот выход Replicate может быть разным.
-                should_send_as_document = True
-            if size_mb > float(config.MAX_IMAGE_MB):
-                should_send_as_document = True
-
-            if should_send_as_document:
-                return await send_document_bytes(
-                    chat_id=chat_id,
-                    document=image_data,
-                    filename=filename,
-                    caption=caption,
-                    parse_mode=parse_mode,
-                    content_type=image_content_type,
-                )
-            
-            # Отправить через multipart/form-data
-            files = {
-                "photo": (filename, image_data, image_content_type)
-            }
-            data = {
-                "chat_id": chat_id
-            }
-            if caption:
-                data["caption"] = caption
-            if parse_mode:
-                data["parse_mode"] = parse_mode
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                try:
-                    response = await client.post(url, files=files, data=data)
-                    response.raise_for_status()
-                    return response.json()
-                except httpx.HTTPStatusError as e:
-                    # Если Telegram не принял "photo" (400), попробуем отправить тем же контентом как документ.
-                    if e.response is not None and e.response.status_code == 400:
-                        logger.error(
-                            "Telegram sendPhoto вернул 400. Ответ: %s",
-                            (e.response.text or "").strip()
-                        )
-                        return await send_document_bytes(
-                            chat_id=chat_id,
-                            document=image_data,
-                            filename=filename,
-                            caption=caption,
-                            parse_mode=parse_mode,
-                            content_type=image_content_type,
-                        )
-                    raise
+            image_data, image_content_type = await download_url(photo, timeout=30.0)
+            return await send_photo_bytes(
+                chat_id=chat_id,
+                photo=image_data,
+                filename=photo_filename(photo),
+                caption=caption,
+                parse_mode=parse_mode,
+                content_type=image_content_type,
+            )
         except Exception as e:
             logger.error(f"Ошибка при отправке фото по URL в Telegram: {e}")
             raise
@@ -166,18 +182,91 @@ async def send_photo(
             payload["parse_mode"] = parse_mode
         
         try:
-            response = await make_request(
-                "POST",
-                url,
-                json=payload,
-                timeout=10.0
-            )
-            return response.json()
+            return await _post_json(chat_id, url, payload)
         except Exception as e:
             logger.error(f"Ошибка при отправке фото в Telegram: {e}")
             raise
 
 
+def photo_filename(url: str) -> str:
+    """Имя файла для отправки фото по расширению в URL."""
+    if ".png" in url.lower() and not any(ext in url.lower() for ext in (".jpg", ".jpeg")):
+        return "photo.png"
+    return "photo.jpg"
+
+
+async def send_photo_bytes(
+    chat_id: int,
+    photo: bytes,
+    filename: str = "photo.jpg",
+    caption: Optional[str] = None,
+    parse_mode: Optional[str] = None,
+    content_type: str = "image/jpeg",
+    reply_markup: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Отправить фото из памяти (multipart/form-data).
+
+    Если формат/размер не подходят для sendPhoto или Telegram вернул 400 —
+    то же содержимое отправляется документом. Результаты обработки приводятся
+    к фото заранее (src/services/transcode.py) — это запасной путь.
+    """
+    url = f"{TELEGRAM_API_BASE}{config.TG_BOT_TOKEN}/sendPhoto"
+
+    # Если формат/размер подозрительные — отправим как документ (Telegram менее строгий).
+    size_mb = len(photo) / (1024 * 1024) if photo else 0.0
+    should_send_as_document = False
+    if content_type not in ("image/jpeg", "image/png"):
+        # Входные форматы у нас ограничены, а вот выход Replicate может быть разным.
+        should_send_as_document = True
+    if size_mb > float(config.MAX_IMAGE_MB):
+        should_send_as_document = True
+
+    if should_send_as_document:
+        return await send_document_bytes(
+            chat_id=chat_id,
+            document=photo,
+            filename=filename,
+            caption=caption,
+            parse_mode=parse_mode,
+            content_type=content_type,
+            reply_markup=reply_markup,
+        )
+
+    files = {
+        "photo": (filename, photo, content_type)
+    }
+    data: Dict[str, Any] = {
+        "chat_id": chat_id
+    }
+    if caption:
+        data["caption"] = caption
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    if reply_markup:
+        data["reply_markup"] = json.dumps(reply_markup, ensure_ascii=False)
+
+    try:
+        return await _post_multipart(chat_id, url, files, data)
+    except httpx.HTTPStatusError as e:
+        # Если Telegram не принял "photo" (400), попробуем отправить тем же контентом как документ.
+        if e.response is not None and e.response.status_code == 400:
+            logger.error(
+                "Telegram sendPhoto вернул 400. Ответ: %s",
+                (e.response.text or "").strip()
+            )
+            return await send_document_bytes(
+                chat_id=chat_id,
+                document=photo,
+                filename=filename,
+                caption=caption,
+                parse_mode=parse_mode,
+                content_type=content_type,
+                reply_markup=reply_markup,
+            )
+        raise
+
+
 async def send_document_bytes(
     chat_id: int,
     document: bytes,
@@ -185,6 +274,7 @@ async def send_document_bytes(
     caption: Optional[str] = None,
     parse_mode: Optional[str] = None,
     content_type: str = "application/octet-stream",
+    reply_markup: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
     Отправить файл пользователю как документ (multipart/form-data).
@@ -202,11 +292,143 @@ async def send_document_bytes(
         data["caption"] = caption
     if parse_mode:
         data["parse_mode"] = parse_mode
+    if reply_markup:
+        data["reply_markup"] = json.dumps(reply_markup, ensure_ascii=False)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(url, files=files, data=data)
-        response.raise_for_status()
-        return response.json()
+    return await _post_multipart(chat_id, url, files, data)
+
+
+def sent_file(response: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """
+    Файл из ответа sendPhoto / sendDocument.
+
+    Returns:
+        (тип: "photo" или "document", file_id) или None, если файла в ответе нет
+    """
+    result = (response or {}).get("result") or {}
+    photos = result.get("photo")
+    if photos:
+        # Последний размер — исходный, его file_id отправляет фото целиком
+        return "photo", photos[-1]["file_id"]
+    document = result.get("document")
+    if document and document.get("file_id"):
+        return "document", document["file_id"]
+    return None
+
+
+async def send_file_id(
+    chat_id: int,
+    kind: str,
+    file_id: str,
+    caption: Optional[str] = None,
+    parse_mode: Optional[str] = None,
+    reply_markup: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Отправить уже загруженный в Telegram файл по file_id (без загрузки).
+
+    Args:
+        kind: "photo" (sendPhoto) или "document" (sendDocument) — как файл был отправлен
+        reply_markup: Кнопки под файлом
+    """
+    method = "sendPhoto" if kind == "photo" else "sendDocument"
+    url = f"{TELEGRAM_API_BASE}{config.TG_BOT_TOKEN}/{method}"
+    payload: Dict[str, Any] = {"chat_id": chat_id, kind: file_id}
+    if caption:
+        payload["caption"] = caption
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    return await _post_json(chat_id, url, payload)
+
+
+async def send_media_group_bytes(
+    chat_id: int,
+    items: List[Dict[str, Any]],
+    caption: Optional[str] = None,
+    media_type: str = "photo",
+) -> List[Dict[str, Any]]:
+    """
+    Отправить несколько файлов из памяти одним альбомом (sendMediaGroup).
+
+    Args:
+        chat_id: ID чата
+        items: Элементы {"data": bytes, "filename": str, "content_type": str}
+            (больше MEDIA_GROUP_MAX_ITEMS — несколькими альбомами)
+        caption: Подпись (у первого элемента)
+        media_type: "photo" или "document" (в одном альбоме типы не смешиваются)
+
+    Если хотя бы один файл не подходит для sendPhoto, весь альбом уходит документами;
+    если Telegram вернул 400 — элементы отправляются по одному.
+
+    Returns:
+        Ответы Telegram API (по одному на отправленный альбом)
+    """
+    if media_type == "photo" and any(
+        item["content_type"] not in ("image/jpeg", "image/png")
+        or len(item["data"]) > float(config.MAX_IMAGE_MB) * 1024 * 1024
+        for item in items
+    ):
+        media_type = "document"
+
+    url = f"{TELEGRAM_API_BASE}{config.TG_BOT_TOKEN}/sendMediaGroup"
+    responses = []
+    for start in range(0, len(items), MEDIA_GROUP_MAX_ITEMS):
+        chunk = items[start:start + MEDIA_GROUP_MAX_ITEMS]
+        chunk_caption = caption if start == 0 else None
+        if len(chunk) == 1:
+            # Альбом из одного элемента Telegram не принимает
+            responses.append(await _send_single(chat_id, chunk[0], chunk_caption, media_type))
+            continue
+
+        media = []
+        files = {}
+        for i, item in enumerate(chunk):
+            name = f"file{i}"
+            entry: Dict[str, Any] = {"type": media_type, "media": f"attach://{name}"}
+            if i == 0 and chunk_caption:
+                entry["caption"] = chunk_caption
+            media.append(entry)
+            files[name] = (item["filename"], item["data"], item["content_type"])
+        data = {"chat_id": chat_id, "media": json.dumps(media, ensure_ascii=False)}
+
+        try:
+            responses.append(await _post_multipart(chat_id, url, files, data, timeout=60.0))
+        except httpx.HTTPStatusError as e:
+            if e.response is None or e.response.status_code != 400:
+                raise
+            logger.error(
+                "Telegram sendMediaGroup вернул 400, отправка по одному. Ответ: %s",
+                (e.response.text or "").strip()
+            )
+            for i, item in enumerate(chunk):
+                responses.append(await _send_single(chat_id, item, chunk_caption if i == 0 else None, media_type))
+    return responses
+
+
+async def _send_single(
+    chat_id: int,
+    item: Dict[str, Any],
+    caption: Optional[str],
+    media_type: str,
+) -> Dict[str, Any]:
+    """Отправить один элемент альбома отдельным сообщением."""
+    if media_type == "photo":
+        return await send_photo_bytes(
+            chat_id=chat_id,
+            photo=item["data"],
+            filename=item["filename"],
+            caption=caption,
+            content_type=item["content_type"],
+        )
+    return await send_document_bytes(
+        chat_id=chat_id,
+        document=item["data"],
+        filename=item["filename"],
+        caption=caption,
+        content_type=item["content_type"],
+    )
 
 
 async def get_file_info(file_id: str) -> Dict[str, Any]:
@@ -289,8 +511,7 @@ async def edit_message_reply_markup(
     if reply_markup is not None:
         payload["reply_markup"] = reply_markup
     try:
-        response = await make_request("POST", url, json=payload, timeout=10.0)
-        return response.json()
+        return await _post_json(chat_id, url, payload)
     except Exception as e:
         logger.error("Ошибка при edit_message_reply_markup: %s", e)
         raise
@@ -306,15 +527,37 @@ async def download_file(file_path: str) -> bytes:
     Returns:
         Байты файла
     """
-    url = f"https://api.telegram.org/file/bot{config.TG_BOT_TOKEN}/{file_path}"
+    url = f"{TELEGRAM_FILE_BASE}{config.TG_BOT_TOKEN}/{file_path}"
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.content
+        client = get_http_client()
+        response = await client.get(url, timeout=30.0)
+        response.raise_for_status()
+        return response.content
     except Exception as e:
         logger.error(f"Ошибка при скачивании файла из Telegram: {e}")
         raise
 
 
+async def iter_file_chunks(file_path: str, chunk_size: int = 256 * 1024) -> AsyncIterator[bytes]:
+    """
+    Скачать файл из Telegram потоком, по кускам (без загрузки целиком в память).
+
+    Args:
+        file_path: Путь к файлу (из get_file_info)
+        chunk_size: Размер куска в байтах
+
+    Yields:
+        Куски файла
+    """
+    url = f"{TELEGRAM_FILE_BASE}{config.TG_BOT_TOKEN}/{file_path}"
+
+    try:
+        client = get_http_client()
+        async with client.stream("GET", url, timeout=30.0) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+    except Exception as e:
+        logger.error(f"Ошибка при потоковом скачивании файла из Telegram: {e}")
+        raise
@@ -0,0 +1,204 @@
+"""
+Перекодирование результата обработки в фото, которое примет sendPhoto.
+
+Раньше выход Replicate в другом формате (WebP и т.п.) или больше MAX_IMAGE_MB
+уходил документом, а при 400 от sendPhoto — повторной загрузкой документом:
+пользователь получал тяжелый файл без превью, а мы платили двумя загрузками.
+Здесь, в потоке (asyncio.to_thread), такой результат сразу становится JPEG в
+пределах Telegram: не больше TELEGRAM_PHOTO_MAX_BYTES и MAX_IMAGE_MB, длинная
+сторона не больше OUTPUT_PHOTO_MAX_SIDE (больше Telegram все равно не
+показывает), сумма сторон не больше 10000.
+
+Оригинал перекодированного результата сохраняется в S3
+(images/output/originals/) — пользователь получает его документом по кнопке
+под фото (OUTPUT_ORIGINAL_BUTTON), без второй загрузки для всех остальных.
+"""
+import asyncio
+import io
+import logging
+import mimetypes
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from src.config import config
+from src.services import s3_async
+from src.utils.images import to_rgb
+
+logger = logging.getLogger(__name__)
+
+# Ограничения sendPhoto
+TELEGRAM_PHOTO_MAX_BYTES = 10 * 1024 * 1024
+TELEGRAM_PHOTO_MAX_SIDES_SUM = 10000
+TELEGRAM_PHOTO_MAX_RATIO = 20
+
+PHOTO_CONTENT_TYPES = ("image/jpeg", "image/png")
+
+ORIGINALS_PREFIX = "images/output/originals"
+# callback_data кнопки «Оригинал файлом»: префикс + токен (лимит Telegram — 64 байта)
+ORIGINAL_CALLBACK_PREFIX = "original="
+_TOKEN_RE = re.compile(r"^[0-9a-f]{32}\.[a-z0-9]{2,5}$")
+
+# Шаги сжатия, если JPEG не уложился в лимит байтов
+_QUALITY_STEP = 10
+_MIN_QUALITY = 70
+_SCALE_STEP = 0.75
+
+# Счетчики процесса (отдаются в /metrics)
+_stats: Dict[str, Any] = {
+    "transcoded": 0,
+    "kept": 0,
+    "errors": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "seconds_total": 0.0,
+    "originals_stored": 0,
+    "originals_sent": 0,
+}
+
+
+def get_stats() -> Dict[str, Any]:
+    """Счетчики перекодирования результатов и отправок оригиналов."""
+    stats = dict(_stats)
+    stats["seconds_total"] = round(stats["seconds_total"], 3)
+    return stats
+
+
+def photo_max_bytes() -> int:
+    return min(TELEGRAM_PHOTO_MAX_BYTES, int(config.MAX_IMAGE_MB * 1024 * 1024))
+
+
+def _fits(source_format: Optional[str], size_bytes: int, width: int, height: int) -> bool:
+    """Фото уйдет через sendPhoto как есть."""
+    return (
+        source_format in ("JPEG", "PNG")
+        and size_bytes <= photo_max_bytes()
+        and max(width, height) <= config.OUTPUT_PHOTO_MAX_SIDE
+        and width + height <= TELEGRAM_PHOTO_MAX_SIDES_SUM
+    )
+
+
+def _transcode(data: bytes, quality: int) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+    """Синхронная часть: None — перекодирование не нужно (или не поможет)."""
+    from PIL import Image, ImageOps
+
+    max_bytes = photo_max_bytes()
+    with Image.open(io.BytesIO(data)) as img:
+        source_format = img.format
+        width, height = img.size
+        if _fits(source_format, len(data), width, height):
+            return None
+        if max(width, height) > TELEGRAM_PHOTO_MAX_RATIO * min(width, height):
+            # Пропорции sendPhoto не исправить уменьшением — останется документом
+            return None
+
+        limit = min(config.OUTPUT_PHOTO_MAX_SIDE, TELEGRAM_PHOTO_MAX_SIDES_SUM * max(width, height) // (width + height))
+        if source_format == "JPEG" and max(width, height) > limit:
+            img.draft("RGB", (width * limit // max(width, height), height * limit // max(width, height)))
+        image = to_rgb(ImageOps.exif_transpose(img))
+
+    side = min(limit, max(image.size))
+    while True:
+        scale = side / max(image.size)
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        resized = image.resize(target, Image.LANCZOS) if target != image.size else image
+        for q in range(quality, _MIN_QUALITY - 1, -_QUALITY_STEP):
+            buffer = io.BytesIO()
+            resized.save(buffer, format="JPEG", quality=q, optimize=True)
+            if buffer.tell() <= max_bytes:
+                return buffer.getvalue(), {
+                    "format": source_format,
+                    "input_size": [width, height],
+                    "output_size": list(target),
+                    "quality": q,
+                }
+        side = int(side * _SCALE_STEP)
+
+
+async def for_telegram(data: bytes, content_type: str) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Подготовить результат к sendPhoto.
+
+    Returns:
+        (байты, content_type, сведения: transcoded — перекодирован ли; для
+        перекодированного — размеры, quality, ms; error — если оставлен как есть)
+    """
+    if not config.OUTPUT_TRANSCODE_ENABLED:
+        return data, content_type, {"transcoded": False}
+    started = time.perf_counter()
+    try:
+        converted = await asyncio.to_thread(_transcode, data, config.OUTPUT_JPEG_QUALITY)
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Не удалось перекодировать результат ({content_type}), отправка как есть: {e}")
+        return data, content_type, {"transcoded": False, "error": str(e)}
+    if converted is None:
+        _stats["kept"] += 1
+        return data, content_type, {"transcoded": False}
+
+    output, info = converted
+    elapsed = time.perf_counter() - started
+    info.update({"transcoded": True, "ms": round(elapsed * 1000, 1)})
+    _stats["transcoded"] += 1
+    _stats["bytes_in"] += len(data)
+    _stats["bytes_out"] += len(output)
+    _stats["seconds_total"] += elapsed
+    logger.info(
+        f"Результат перекодирован для sendPhoto: {info['format']} "
+        f"{info['input_size'][0]}x{info['input_size'][1]} {len(data) / 1024:.0f} КБ → "
+        f"JPEG {info['output_size'][0]}x{info['output_size'][1]} {len(output) / 1024:.0f} КБ "
+        f"(q={info['quality']}) за {info['ms']:.0f} мс"
+    )
+    return output, "image/jpeg", info
+
+
+def _original_key(token: str) -> str:
+    return f"{ORIGINALS_PREFIX}/{token}"
+
+
+async def store_original(data: bytes, content_type: str, sha256: str) -> str:
+    """
+    Сохранить оригинал результата для отправки по кнопке.
+
+    Returns:
+        Токен для callback_data (ORIGINAL_CALLBACK_PREFIX + токен)
+    """
+    extension = (mimetypes.guess_extension(content_type or "") or ".bin").lstrip(".").lower()
+    token = f"{sha256[:32]}.{extension}"
+    await s3_async.upload_to_s3(config.S3_BUCKET, _original_key(token), data, content_type=content_type)
+    _stats["originals_stored"] += 1
+    return token
+
+
+def original_keyboard(token: str) -> Dict[str, Any]:
+    """Кнопка под фото: отправить оригинал документом."""
+    return {
+        "inline_keyboard": [
+            [{"text": "📎 Оригинал файлом", "callback_data": f"{ORIGINAL_CALLBACK_PREFIX}{token}"}],
+        ]
+    }
+
+
+async def load_original(token: str) -> Optional[Tuple[bytes, str, str]]:
+    """
+    Оригинал по токену из callback_data.
+
+    Returns:
+        (байты, content_type, имя файла) или None — токен некорректен или объект
+        уже удален lifecycle-правилом
+    """
+    if not _TOKEN_RE.match(token):
+        logger.warning(f"Некорректный токен оригинала: {token!r}")
+        return None
+    try:
+        data = await s3_async.download_from_s3(config.S3_BUCKET, _original_key(token))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in ("NoSuchKey", "404"):
+            return None
+        raise
+    extension = token.rsplit(".", 1)[1]
+    content_type = mimetypes.guess_type(f"original.{extension}")[0] or "application/octet-stream"
+    _stats["originals_sent"] += 1
+    return data, content_type, f"original.{extension}"
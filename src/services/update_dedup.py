@@ -0,0 +1,181 @@
+"""
+Защита от повторной обработки Update Telegram (по update_id).
+
+Telegram повторяет вебхук, если ответ не пришел вовремя, — а handler.py отвечает
+только после обработки. Без защиты повтор заново скачивает фото, грузит его в S3
+и создает платный prediction.
+
+- Недавние update_id помнятся в процессе (теплый экземпляр функции, FastAPI) —
+  для всех Update.
+- Между экземплярами — маркер updates/{update_id}, только для Update с
+  побочными эффектами (фото, документ): команды и кнопки не платят лишний PUT.
+  Маркер создается условной записью (If-None-Match: *) как аренда
+  {"state": "processing", "expires_at": ...} на UPDATE_DEDUP_LEASE_SECONDS;
+  после обработки — {"state": "done"}. Если экземпляр упал или не уложился в
+  таймаут, аренда истекает, и повтор Telegram забирает Update себе — фото не
+  теряется. Ошибка обработки снимает маркер сразу.
+
+Ошибка S3 не блокирует обработку: лучше редкий дубль, чем потерянный Update.
+Маркеры удаляет lifecycle-правило бакета (см. spec/04-s3-data.md).
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from src.config import config
+from src.services import s3_async
+from src.utils import codec
+
+logger = logging.getLogger(__name__)
+
+UPDATES_PREFIX = "updates/"
+
+PROCESSING = "processing"
+DONE = "done"
+
+
+def has_side_effects(update_data: Dict[str, Any]) -> bool:
+    """Update, повтор которого дорог: фото или документ (загрузка в S3, prediction)."""
+    message = update_data.get("message") or {}
+    return "photo" in message or "document" in message
+
+
+class UpdateDeduplicator:
+    """Недавние update_id в памяти + маркеры-аренды в S3."""
+
+    def __init__(self, max_size: int, ttl: float, lease: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lease = lease
+        # update_id -> момент истечения (time.monotonic())
+        self._recent: "OrderedDict[int, float]" = OrderedDict()
+        self._stats: Dict[str, int] = {
+            "processed": 0,
+            "duplicates": 0,
+            "duplicates_memory": 0,
+            "duplicates_s3": 0,
+            "takeovers": 0,
+            "released": 0,
+            "s3_errors": 0,
+        }
+
+    def _seen(self, update_id: int) -> bool:
+        expires = self._recent.get(update_id)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._recent[update_id]
+            return False
+        return True
+
+    def _remember(self, update_id: int) -> None:
+        self._recent[update_id] = time.monotonic() + self.ttl
+        self._recent.move_to_end(update_id)
+        while len(self._recent) > self.max_size:
+            self._recent.popitem(last=False)
+
+    def _duplicate(self, update_id: int, source: str) -> bool:
+        self._stats["duplicates"] += 1
+        self._stats[f"duplicates_{source}"] += 1
+        logger.info(f"Повтор Update {update_id} пропущен")
+        return False
+
+    @staticmethod
+    def _key(update_id: int) -> str:
+        return f"{UPDATES_PREFIX}{update_id}"
+
+    def _lease_body(self) -> bytes:
+        return codec.dumps({"state": PROCESSING, "expires_at": time.time() + self.lease})
+
+    async def _claim_s3(self, update_id: int) -> bool:
+        """Маркер в S3: True — Update наш (новый или аренда истекла)."""
+        key = self._key(update_id)
+        if await s3_async.put_object_if_absent(config.S3_BUCKET, key, self._lease_body()):
+            return True
+        try:
+            raw = await s3_async.download_from_s3(config.S3_BUCKET, key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code", "") not in ("NoSuchKey", "404"):
+                raise
+            # Маркер сняли между записью и чтением (ошибка обработки) — пробуем снова
+            return await s3_async.put_object_if_absent(config.S3_BUCKET, key, self._lease_body())
+        # Пустой маркер — формат до аренд: Update обработан
+        marker = codec.loads(raw) if raw else {"state": DONE}
+        if marker.get("state") == PROCESSING and float(marker.get("expires_at", 0)) <= time.time():
+            # Обработка не завершилась (падение, таймаут) — повтор забирает Update.
+            # Перезапись не атомарна: два одновременных повтора после истечения
+            # аренды могут обработать Update оба (редко, Telegram повторяет по одному)
+            await s3_async.upload_to_s3(config.S3_BUCKET, key, self._lease_body())
+            self._stats["takeovers"] += 1
+            logger.warning(f"Аренда Update {update_id} истекла, обработка повторяется")
+            return True
+        return False
+
+    async def claim(self, update_id: Optional[int], durable: bool = False) -> bool:
+        """
+        Занять update_id для обработки.
+
+        Args:
+            durable: Маркер в S3 (Update с побочными эффектами, см. has_side_effects)
+
+        Returns:
+            True — Update новый, его нужно обработать (затем complete() или
+            release()); False — повтор, пропустить
+        """
+        if not config.UPDATE_DEDUP_ENABLED or update_id is None:
+            return True
+        if self._seen(update_id):
+            return self._duplicate(update_id, "memory")
+        # До обращения к S3: одновременный повтор в этом же процессе уже увидит запись
+        self._remember(update_id)
+        if durable and config.UPDATE_DEDUP_S3_ENABLED:
+            try:
+                claimed = await self._claim_s3(update_id)
+            except Exception as e:
+                self._stats["s3_errors"] += 1
+                logger.warning(f"Не удалось записать маркер Update {update_id}: {e}")
+                claimed = True
+            if not claimed:
+                return self._duplicate(update_id, "s3")
+        self._stats["processed"] += 1
+        return True
+
+    async def complete(self, update_id: Optional[int], durable: bool = False) -> None:
+        """Update обработан: маркер «done» — повтор больше не обрабатывается."""
+        if not config.UPDATE_DEDUP_ENABLED or update_id is None:
+            return
+        if durable and config.UPDATE_DEDUP_S3_ENABLED:
+            try:
+                await s3_async.upload_to_s3(config.S3_BUCKET, self._key(update_id), codec.dumps({"state": DONE}))
+            except Exception as e:
+                # Аренда истечет сама; повтор после нее обработается еще раз
+                self._stats["s3_errors"] += 1
+                logger.warning(f"Не удалось отметить Update {update_id} обработанным: {e}")
+
+    async def release(self, update_id: Optional[int], durable: bool = False) -> None:
+        """Обработка не удалась: снять маркер, чтобы повтор Telegram обработал Update."""
+        if not config.UPDATE_DEDUP_ENABLED or update_id is None:
+            return
+        self._recent.pop(update_id, None)
+        self._stats["released"] += 1
+        if durable and config.UPDATE_DEDUP_S3_ENABLED:
+            try:
+                await s3_async.delete_object(config.S3_BUCKET, self._key(update_id))
+            except Exception as e:
+                self._stats["s3_errors"] += 1
+                logger.warning(f"Не удалось снять маркер Update {update_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["recent"] = len(self._recent)
+        return stats
+
+
+deduplicator = UpdateDeduplicator(
+    max_size=config.UPDATE_DEDUP_CACHE_SIZE,
+    ttl=config.UPDATE_DEDUP_TTL_SECONDS,
+    lease=config.UPDATE_DEDUP_LEASE_SECONDS,
+)
@@ -0,0 +1,157 @@
+"""
+In-process кэши: LRU с TTL, отрицательным кэшем и объединением одновременных загрузок.
+"""
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLRUCache:
+    """
+    LRU-кэш для асинхронных загрузчиков (например, состояния из S3).
+
+    - Запись живет ttl секунд, отсутствие значения (загрузчик вернул None) —
+      negative_ttl секунд (отрицательный кэш).
+    - Одновременные get_or_load одного ключа выполняют один вызов загрузчика
+      (single-flight), остальные ждут его результат.
+    - Значения отдаются копиями: вызывающий код может менять словарь,
+      не портя закэшированное.
+    - Запись (set / invalidate) во время загрузки того же ключа важнее ее
+      результата: загруженное (возможно, уже устаревшее) значение не кэшируется.
+
+    Кэш живет в памяти процесса; другие экземпляры (Cloud Function) его не видят,
+    поэтому устаревание ограничено ttl.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float, negative_ttl: Optional[float] = None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        # ключ -> (значение или None, момент истечения по time.monotonic())
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Загрузки, во время которых ключ был записан: их результат не кэшируется
+        self._superseded: Set[asyncio.Future] = set()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "superseded": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def _get_entry(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _supersede(self, key: Hashable) -> None:
+        """Ключ записан: текущая загрузка устарела, новые запросы ее не ждут."""
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            self._superseded.add(future)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Положить значение (None — отрицательная запись)."""
+        if not self.enabled:
+            return
+        self._supersede(key)
+        self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (copy.deepcopy(value), time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удалить запись (например, после неудачной записи в хранилище)."""
+        self._supersede(key)
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Вернуть значение из кэша или загрузить его loader'ом (один вызов на ключ
+        для всех одновременных запросов).
+        """
+        if not self.enabled:
+            self._stats["misses"] += 1
+            self._stats["loads"] += 1
+            return await loader()
+
+        entry = self._get_entry(key)
+        if entry is not None:
+            self._stats["hits" if entry[0] is not None else "negative_hits"] += 1
+            return copy.deepcopy(entry[0])
+
+        self._stats["misses"] += 1
+        future = self._inflight.get(key)
+        if future is not None and not future.done() and future.get_loop() is asyncio.get_running_loop():
+            self._stats["coalesced"] += 1
+            await asyncio.wait({future})
+            if future.cancelled():
+                # Загружавший запрос отменили — загрузить заново
+                return await self.get_or_load(key, loader)
+            return copy.deepcopy(future.result())
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self._stats["loads"] += 1
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение могут не забрать (ожидающих нет) — не засорять лог
+            future.exception()
+            raise
+        else:
+            if future in self._superseded:
+                # Пока шла загрузка, ключ записали: отдать записанное, если оно в кэше
+                self._stats["superseded"] += 1
+                entry = self._get_entry(key)
+                if entry is not None:
+                    value = entry[0]
+            else:
+                self._store(key, value)
+            future.set_result(value)
+            return copy.deepcopy(value)
+        finally:
+            self._superseded.discard(future)
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики и доля попаданий (hits + negative_hits к общему числу обращений)."""
+        stats: Dict[str, Any] = dict(self._stats)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["size"] = len(self._entries)
+        stats["hit_ratio"] = round((stats["hits"] + stats["negative_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,71 @@
+"""
+Кодек JSON-документов в S3 (tasks/, users/, cache/): компактный вывод без отступов,
+datetime — без ручных преобразований.
+
+Бэкенд выбирается JSON_CODEC: orjson (если установлен) или стандартный json.
+Наивные datetime считаются UTC и пишутся как ISO 8601 с суффиксом "Z" — в том же
+формате, что и раньше, поэтому старые документы (с отступами) читаются без изменений.
+"""
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Union
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+JSON_CODECS = ("auto", "orjson", "json")
+
+
+def _json_default(obj: Any) -> Any:
+    """Сериализация datetime для стандартного json (в формате orjson с OPT_UTC_Z)."""
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None or obj.utcoffset().total_seconds() == 0:
+            return obj.replace(tzinfo=None).isoformat() + "Z"
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    return json.loads(data)
+
+
+def _select_backend(name: str):
+    """Вернуть (имя, dumps, loads) для JSON_CODEC."""
+    if name not in JSON_CODECS:
+        logger.warning(f"Неизвестный JSON_CODEC={name}, используется auto")
+        name = "auto"
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+
+            option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+            def _orjson_dumps(obj: Any) -> bytes:
+                return orjson.dumps(obj, option=option)
+
+            return "orjson", _orjson_dumps, orjson.loads
+        except ImportError:
+            if name == "orjson":
+                logger.warning("JSON_CODEC=orjson, но пакет orjson не установлен (pip install orjson); используется json")
+    return "json", _json_dumps, _json_loads
+
+
+backend, _dumps, _loads = _select_backend(config.JSON_CODEC)
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализовать документ в компактный JSON (UTF-8)."""
+    return _dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Разобрать JSON-документ (в том числе старый, с отступами)."""
+    return _loads(data)
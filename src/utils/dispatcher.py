@@ -0,0 +1,212 @@
+"""
+Диспетчер фоновой обработки вебхуков: ограниченная очередь + N воркеров.
+
+Вместо asyncio.create_task() на каждый запрос (без лимита, без ссылок на задачи,
+без ожидания при остановке):
+
+- работа ставится с ключом (chat_id): задачи одного ключа выполняются строго по
+  порядку, разные ключи — параллельно, ключи обслуживаются по кругу;
+- очередь ограничена: при переполнении submit() ждет место, затем отказывает —
+  маршрут отвечает 503, и Telegram / Replicate повторят запрос позже;
+- drain() на остановке приложения дожидается очереди (с таймаутом).
+
+Воркеры привязаны к event loop приложения (FastAPI, локальная разработка);
+Cloud Function обрабатывает Update в рамках вызова и диспетчер не использует.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних ожиданий хранить для перцентилей в метриках
+_WAIT_SAMPLES = 1000
+
+_Job = Tuple[Callable[..., Awaitable[Any]], Tuple[Any, ...], float]
+
+
+class KeyedDispatcher:
+    """
+    Пул воркеров с очередью по ключам.
+
+    submit(key, func, *args) — поставить func(*args) в очередь ключа;
+    start() / drain() — запуск воркеров и остановка с ожиданием очереди.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        # Ожидающие задачи по ключам; ключ в _ready, если у него есть задачи и он не занят
+        self._pending: Dict[Hashable, Deque[_Job]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._queued = 0
+        self._running = 0
+        self._closing = False
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self._stats: Dict[str, Any] = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "queue_depth_max": 0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def start(self) -> None:
+        """Запустить воркеры в текущем event loop (повторный вызов ничего не делает)."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Диспетчер {self.name}: запущено воркеров {self.workers}, очередь до {self.max_queue}")
+
+    async def submit(
+        self,
+        key: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """
+        Поставить func(*args) в очередь ключа.
+
+        Args:
+            key: Ключ упорядочивания (chat_id); задачи ключа выполняются по одной
+            func: Корутинная функция
+            timeout: Сколько ждать места в переполненной очереди, с
+                (по умолчанию DISPATCHER_ENQUEUE_TIMEOUT_SECONDS)
+
+        Returns:
+            True — поставлено; False — очередь переполнена или диспетчер останавливается
+        """
+        if self._closing:
+            self._stats["rejected"] += 1
+            return False
+        if not self._tasks:
+            self.start()
+        if timeout is None:
+            timeout = config.DISPATCHER_ENQUEUE_TIMEOUT_SECONDS
+        if self._queued >= self.max_queue:
+            try:
+                async with self._space:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self._queued < self.max_queue or self._closing),
+                        timeout=max(0.0, timeout),
+                    )
+            except asyncio.TimeoutError:
+                pass
+            if self._queued >= self.max_queue or self._closing:
+                self._stats["rejected"] += 1
+                logger.warning(f"Диспетчер {self.name}: очередь переполнена ({self._queued}), задача отклонена")
+                return False
+
+        jobs = self._pending.get(key)
+        if jobs is None:
+            jobs = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        jobs.append((func, args, time.monotonic()))
+        self._queued += 1
+        self._idle.clear()
+        self._stats["submitted"] += 1
+        self._stats["queue_depth_max"] = max(self._stats["queue_depth_max"], self._queued)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            if key is None:
+                return
+            jobs = self._pending.get(key)
+            if not jobs:
+                # Очередь ключа сброшена при остановке
+                continue
+            func, args, queued_at = jobs.popleft()
+            self._queued -= 1
+            self._running += 1
+            wait = time.monotonic() - queued_at
+            self._waits.append(wait)
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+            async with self._space:
+                self._space.notify()
+            try:
+                await func(*args)
+                self._stats["completed"] += 1
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"Диспетчер {self.name}: ошибка в задаче ключа {key}: {e}", exc_info=True)
+            finally:
+                self._running -= 1
+                # Следующая задача ключа — в конец круга, чтобы длинная очередь
+                # одного чата не задерживала остальные
+                if jobs:
+                    self._ready.put_nowait(key)
+                else:
+                    self._pending.pop(key, None)
+                if self._queued == 0 and self._running == 0:
+                    self._idle.set()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Перестать принимать задачи, дождаться очереди (не дольше timeout,
+        по умолчанию DISPATCHER_DRAIN_TIMEOUT_SECONDS) и остановить воркеры.
+        """
+        if not self._tasks:
+            return
+        if timeout is None:
+            timeout = config.DISPATCHER_DRAIN_TIMEOUT_SECONDS
+        self._closing = True
+        async with self._space:
+            self._space.notify_all()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Диспетчер {self.name}: за {timeout:.0f} с не завершены "
+                f"{self._running} задач, отброшено из очереди {self._queued}"
+            )
+            self._pending.clear()
+            self._queued = 0
+        for _ in self._tasks:
+            self._ready.put_nowait(None)
+        _, pending = await asyncio.wait(self._tasks, timeout=1.0)
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+        logger.info(f"Диспетчер {self.name} остановлен")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики, глубина очереди, занятые воркеры и перцентили ожидания в очереди."""
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["workers"] = self.workers if self._tasks else 0
+        stats["running"] = self._running
+        stats["queue_depth"] = self._queued
+        stats["keys"] = len(self._pending)
+        stats["wait_seconds_max"] = round(stats["wait_seconds_max"], 3)
+        waits = sorted(self._waits)
+        if waits:
+            stats["wait_seconds_p50"] = round(waits[len(waits) // 2], 3)
+            stats["wait_seconds_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3)
+        else:
+            stats["wait_seconds_p50"] = stats["wait_seconds_p95"] = 0.0
+        return stats
+
+
+webhook_dispatcher = KeyedDispatcher(
+    name="webhooks",
+    workers=config.DISPATCHER_WORKERS,
+    max_queue=config.DISPATCHER_MAX_QUEUE,
+)
@@ -1,20 +1,93 @@
 """
-Утилиты для HTTP-запросов: ретраи, таймауты, backoff.
+Утилиты для HTTP-запросов: общий пул соединений, ретраи, таймауты, backoff.
 """
 import asyncio
 import logging
 import time
-from typing import Callable, Any, Optional
+from typing import Callable, Any, Optional, Tuple
 from functools import wraps
 import httpx
 
+from src.config import config
+
 logger = logging.getLogger(__name__)
 
+# Общий HTTP-клиент процесса (создается при первом использовании).
+# Держит keep-alive соединения к api.telegram.org / Replicate, чтобы не платить
+# за TCP+TLS handshake на каждый запрос.
+_http_client: Optional[httpx.AsyncClient] = None
+# Event loop, к которому привязаны соединения клиента
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _http2_available() -> bool:
+    """Проверить, установлен ли пакет h2 (нужен httpx для HTTP/2)."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Создать AsyncClient с лимитами пула из конфига."""
+    http2 = config.HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("HTTP2_ENABLED=1, но пакет h2 не установлен (pip install httpx[http2]); используется HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+    logger.info(
+        f"Создан общий HTTP-клиент: max_connections={limits.max_connections}, "
+        f"keepalive={limits.max_keepalive_connections}, http2={http2}"
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=10.0)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Получить общий пул HTTP-соединений.
+
+    Клиент привязан к текущему event loop: если loop сменился (Cloud Function
+    заменила зависший loop или FUNCTION_PERSISTENT_LOOP=0), создается новый клиент.
+
+    Returns:
+        httpx.AsyncClient с keep-alive пулом
+    """
+    global _http_client, _http_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = _create_http_client()
+        _http_client_loop = loop
+
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Закрыть общий HTTP-клиент (при остановке приложения / в конце вызова функции)."""
+    global _http_client, _http_client_loop
+
+    client = _http_client
+    _http_client = None
+    _http_client_loop = None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+        logger.info("Общий HTTP-клиент закрыт")
+
+
+# HTTP-статусы, при которых запрос повторяется по умолчанию
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
 
 def retry_request(
     max_retries: int = 3,
     backoff_factor: float = 1.0,
-    retry_on: tuple = (429, 500, 502, 503, 504)
+    retry_on: tuple = RETRY_STATUSES
 ):
     """
     Декоратор для повторных попыток HTTP-запросов с экспоненциальным backoff.
@@ -68,26 +141,45 @@ async def make_request(
     url: str,
     timeout: float = 10.0,
     max_retries: int = 3,
+    retry_on: tuple = RETRY_STATUSES,
     **kwargs
 ) -> httpx.Response:
     """
     Выполнить HTTP-запрос с таймаутом и автоматическими ретраями.
+    Запрос идет через общий пул соединений (get_http_client).
     
     Args:
         method: HTTP метод (GET, POST, etc.)
         url: URL для запроса
         timeout: Таймаут в секундах
         max_retries: Максимальное количество попыток
+        retry_on: HTTP статус-коды, при которых запрос повторяется
         **kwargs: Дополнительные аргументы для httpx (headers, json, data, etc.)
         
     Returns:
         Response объект от httpx
     """
-    @retry_request(max_retries=max_retries)
+    @retry_request(max_retries=max_retries, retry_on=retry_on)
     async def _request():
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response
+        client = get_http_client()
+        response = await client.request(method, url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        return response
     
     return await _request()
+
+
+async def download_url(url: str, timeout: float = 30.0) -> Tuple[bytes, str]:
+    """
+    Скачать файл по URL через общий пул соединений (с переходом по редиректам).
+
+    Returns:
+        (содержимое, MIME-тип из Content-Type или application/octet-stream)
+    """
+    # Многие CDN/хранилища отдают 302/301 на реальный файл, а httpx по умолчанию
+    # редиректам не следует — скачалась бы HTML/redirect-заглушка
+    client = get_http_client()
+    response = await client.get(url, timeout=timeout, follow_redirects=True)
+    response.raise_for_status()
+    content_type = (response.headers.get("content-type") or "").split(";")[0].strip().lower()
+    return response.content, content_type or "application/octet-stream"
@@ -1,5 +1,5 @@
 """
-Утилиты для работы с изображениями: валидация, выбор размера.
+Утилиты для работы с изображениями: валидация, выбор размера, приведение к RGB.
 """
 import logging
 from typing import List, Dict, Any
@@ -70,3 +70,26 @@ def validate_image_size(size_bytes: int, max_mb: int) -> bool:
         return False
     
     return True
+
+
+def to_rgb(image: Any) -> Any:
+    """
+    Привести изображение Pillow к RGB для JPEG: прозрачность — на белый фон.
+
+    Args:
+        image: PIL.Image.Image
+
+    Returns:
+        Изображение в режиме RGB (то же, если уже RGB)
+    """
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # Прозрачность в JPEG не переносится — фон белый
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
@@ -0,0 +1,177 @@
+"""
+Ограничение частоты исходящих запросов: общий лимит процесса + лимит на ключ (чат).
+
+Корзины токенов реализованы как GCRA (виртуальное расписание): вызов резервирует
+ближайший свободный слот и спит до него. Очередь получается FIFO без фоновых задач
+и без объектов, привязанных к event loop, — это важно для Cloud Function, где
+loop может смениться между вызовами (см. src/utils/runtime.py).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних ожиданий хранить для перцентилей в метриках
+_WAIT_SAMPLES = 1000
+
+
+class RateLimiter:
+    """
+    Общая корзина (rate/с, burst) + корзины по ключу (key_rate/с, key_burst).
+
+    - acquire(key) ждет, пока отправка укладывается в оба лимита; порядок
+      сообщений одному чату сохраняется;
+    - penalize(key, seconds) откладывает отправки ключа (или все, key=None),
+      например на retry_after из ответа 429.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        key_rate: float,
+        key_burst: int,
+        max_keys: int = 10000,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.key_rate = key_rate
+        self.key_burst = max(1, key_burst)
+        self.max_keys = max_keys
+        # Теоретическое время следующего слота (time.monotonic()) — общий и по ключам
+        self._tat = 0.0
+        self._key_tat: Dict[Hashable, float] = {}
+        # Паузы после 429: общая и по ключам (time.monotonic())
+        self._paused_until = 0.0
+        self._key_paused: Dict[Hashable, float] = {}
+        self._waiting = 0
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self._stats: Dict[str, Any] = {
+            "acquired": 0,
+            "delayed": 0,
+            "throttled": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "queue_depth_max": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _reserve_key(self, key: Hashable, now: float) -> float:
+        """Зарезервировать слот в корзине ключа и вернуть его момент."""
+        interval = 1.0 / self.key_rate
+        tat = self._key_tat.get(key, 0.0)
+        at = max(now, tat - (self.key_burst - 1) * interval)
+        self._key_tat[key] = max(tat, at) + interval
+        if len(self._key_tat) > self.max_keys:
+            self._prune(now)
+        return at
+
+    def _reserve_global(self, now: float) -> float:
+        """Зарезервировать слот в общей корзине и вернуть его момент."""
+        interval = 1.0 / self.rate
+        at = max(now, self._tat - (self.burst - 1) * interval)
+        self._tat = max(self._tat, at) + interval
+        return at
+
+    def _prune(self, now: float) -> None:
+        """Удалить корзины и паузы ключей, которые уже истекли."""
+        for k in [k for k, tat in self._key_tat.items() if tat <= now]:
+            del self._key_tat[k]
+        for k in [k for k, until in self._key_paused.items() if until <= now]:
+            del self._key_paused[k]
+
+    def _pause_left(self, key: Optional[Hashable], now: float) -> float:
+        until = self._paused_until
+        if key is not None:
+            until = max(until, self._key_paused.get(key, 0.0))
+        return until - now
+
+    async def acquire(self, key: Optional[Hashable] = None) -> float:
+        """
+        Дождаться слота для отправки.
+
+        Сначала слот в корзине ключа (FIFO внутри чата), затем — в общей корзине.
+        Общий слот резервируется только когда очередь чата дошла: чат с длинной
+        очередью не занимает будущие общие слоты и не задерживает другие чаты.
+
+        Args:
+            key: Ключ отдельной корзины (chat_id); None — только общий лимит
+
+        Returns:
+            Время ожидания в секундах
+        """
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        self._stats["acquired"] += 1
+        self._waiting += 1
+        self._stats["queue_depth_max"] = max(self._stats["queue_depth_max"], self._waiting)
+        try:
+            if key is not None and self.key_rate > 0:
+                await self._sleep_until(self._reserve_key(key, started))
+            # Пауза после 429 могла наступить, пока слот ждал своей очереди
+            while True:
+                pause = self._pause_left(key, time.monotonic())
+                if pause <= 0:
+                    break
+                await asyncio.sleep(pause)
+            await self._sleep_until(self._reserve_global(time.monotonic()))
+        finally:
+            self._waiting -= 1
+
+        wait = time.monotonic() - started
+        if wait < 0.001:
+            wait = 0.0
+        else:
+            self._stats["delayed"] += 1
+        self._waits.append(wait)
+        self._stats["wait_seconds_total"] += wait
+        self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+        return wait
+
+    @staticmethod
+    async def _sleep_until(at: float) -> None:
+        delay = at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def penalize(self, key: Optional[Hashable], seconds: float) -> None:
+        """
+        Запретить отправки ключа (key=None — все отправки) на seconds секунд,
+        например на retry_after из ответа 429. Уже зарезервированные слоты ключа
+        дождутся конца паузы перед отправкой.
+        """
+        self._stats["throttled"] += 1
+        until = time.monotonic() + max(0.0, seconds)
+        if key is None:
+            self._paused_until = max(self._paused_until, until)
+            return
+        self._key_paused[key] = max(self._key_paused.get(key, 0.0), until)
+        if self.key_rate > 0:
+            # После паузы — без всплеска: следующий слот ключа не раньше until
+            self._key_tat[key] = max(
+                self._key_tat.get(key, 0.0), until + (self.key_burst - 1) / self.key_rate
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики, текущая глубина очереди и перцентили ожидания (по последним отправкам)."""
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["wait_seconds_total"] = round(stats["wait_seconds_total"], 3)
+        stats["wait_seconds_max"] = round(stats["wait_seconds_max"], 3)
+        stats["queue_depth"] = self._waiting
+        stats["keys"] = len(self._key_tat)
+        waits = sorted(self._waits)
+        if waits:
+            stats["wait_seconds_p50"] = round(waits[len(waits) // 2], 3)
+            stats["wait_seconds_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3)
+        else:
+            stats["wait_seconds_p50"] = stats["wait_seconds_p95"] = 0.0
+        return stats
@@ -0,0 +1,168 @@
+"""
+Постоянный event loop экземпляра Cloud Function.
+
+asyncio.run() на каждый вызов создает и закрывает loop, а вместе с ним — общий
+HTTP-клиент (src/utils/http.py привязан к loop): теплый вызов заново открывает
+TCP+TLS соединения к Telegram и Replicate. Здесь loop живет в отдельном потоке
+весь срок жизни экземпляра, вызовы handler() ставят в него корутины:
+
+- HTTP-клиент и его keep-alive соединения переживают вызовы; клиент S3, пул
+  потоков s3_async и кэши в памяти и так живут на уровне модулей;
+- поток вызова ждет результат, не владея loop, — подходит и для runtime,
+  вызывающего handler() из разных потоков;
+- loop проверяется перед каждым вызовом: если поток завершился, loop закрыт
+  или не отвечает FUNCTION_LOOP_PING_TIMEOUT_SECONDS (заблокирован синхронным
+  кодом), он бросается и создается новый — объекты, привязанные к старому
+  loop (HTTP-клиент), пересоздаются при первом обращении.
+
+FUNCTION_PERSISTENT_LOOP=0 — прежнее поведение: asyncio.run() на вызов и
+закрытие HTTP-клиента в конце.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Awaitable, Dict, Optional
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# Шаг, с которым ожидающий вызов проверяет, что loop еще жив
+_CHECK_SECONDS = 1.0
+
+
+class LoopBrokenError(RuntimeError):
+    """Loop остановился, не завершив корутину вызова."""
+
+    pass
+
+
+class FunctionRuntime:
+    """
+    Event loop в фоновом потоке, общий для всех вызовов экземпляра функции.
+
+    run(coro) — выполнить корутину и вернуть результат (синхронно, из handler()).
+    """
+
+    def __init__(self, name: str, ping_timeout: float):
+        self.name = name
+        self.ping_timeout = ping_timeout
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stats: Dict[str, int] = {
+            "invocations": 0,
+            "loops_started": 0,
+            "loops_replaced": 0,
+            "errors": 0,
+        }
+
+    def _start_loop(self) -> None:
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            try:
+                loop.run_forever()
+            except BaseException as e:  # noqa: B902
+                logger.error(f"Event loop {self.name} завершился с ошибкой: {e}", exc_info=True)
+
+        thread = threading.Thread(target=serve, name=f"{self.name}-loop", daemon=True)
+        thread.start()
+        started.wait()
+        self._loop = loop
+        self._thread = thread
+        self._stats["loops_started"] += 1
+        logger.info(f"Запущен постоянный event loop {self.name}")
+
+    def _alive(self) -> bool:
+        loop, thread = self._loop, self._thread
+        return (
+            loop is not None
+            and thread is not None
+            and thread.is_alive()
+            and loop.is_running()
+            and not loop.is_closed()
+        )
+
+    def _responsive(self) -> bool:
+        """Loop успевает выполнить пустой callback за ping_timeout."""
+        ping: concurrent.futures.Future = concurrent.futures.Future()
+        try:
+            self._loop.call_soon_threadsafe(ping.set_result, None)
+            ping.result(timeout=self.ping_timeout)
+            return True
+        except (RuntimeError, concurrent.futures.TimeoutError):
+            return False
+
+    def _abandon(self, reason: str) -> None:
+        """Бросить текущий loop: остановить, если он еще исполняет callback'и."""
+        loop = self._loop
+        self._loop = None
+        self._thread = None
+        self._stats["loops_replaced"] += 1
+        logger.warning(f"Event loop {self.name} {reason}, будет создан новый")
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(loop.stop)
+            except RuntimeError:
+                pass
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Рабочий loop: текущий, если он жив и отвечает, иначе новый."""
+        with self._lock:
+            if self._loop is not None:
+                if not self._alive():
+                    self._abandon("остановлен")
+                elif not self._responsive():
+                    self._abandon(f"не отвечает {self.ping_timeout:.1f} с")
+            if self._loop is None:
+                self._start_loop()
+            return self._loop
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        """
+        Выполнить корутину вызова функции и вернуть ее результат.
+
+        Raises:
+            Исключение корутины; LoopBrokenError, если loop остановился во время вызова
+        """
+        self._stats["invocations"] += 1
+        if not config.FUNCTION_PERSISTENT_LOOP:
+            return asyncio.run(_run_and_close_http_client(coro))
+
+        loop = self.get_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            # Не future.result(timeout): TimeoutError из самой корутины неотличим от ожидания
+            while not concurrent.futures.wait([future], timeout=_CHECK_SECONDS).done:
+                if not loop.is_running():
+                    future.cancel()
+                    raise LoopBrokenError(f"Event loop {self.name} остановился во время вызова")
+            return future.result()
+        except BaseException:
+            self._stats["errors"] += 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["loop_alive"] = self._alive()
+        return stats
+
+
+async def _run_and_close_http_client(coro: Awaitable[Any]) -> Any:
+    from src.utils.http import close_http_client  # noqa: WPS433
+
+    try:
+        return await coro
+    finally:
+        await close_http_client()
+
+
+function_runtime = FunctionRuntime(
+    name="function",
+    ping_timeout=config.FUNCTION_LOOP_PING_TIMEOUT_SECONDS,
+)